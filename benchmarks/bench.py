@@ -0,0 +1,214 @@
+"""Measure the csvblend merge and export throughput on synthetic csvfiles.
+
+Each scenario runs in its own process (for its peak RSS), merges the csvfiles in
+order, then reads the merge CSV with rows() and write_csv(). The results are
+written as JSON, and can be compared with a baseline (a previous output).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+from generate import INDEXES, generate_csv
+
+from csvblend import MergeFiles, Tuning
+
+# The benchmark scenarios: their MergeFiles options
+SCENARIOS = {
+    "upsert": {"engine": "upsert"},
+    "upsert-no-bulk-load": {"engine": "upsert", "bulk_load": False},
+    "staging": {"engine": "staging"},
+    "sorted": {"engine": "sorted"},
+    "external": {"engine": "external"},
+    **{f"tuning-{i}": {"tuning": i} for i in Tuning.PROFILES if i != "default"},
+}
+
+# The csvfile parameters forced by a scenario: the "sorted" engine falls back to
+# "upsert" on an unsorted csvfile, so its csvfiles are in index order
+SCENARIO_PARAMETERS = {"sorted": {"sortedness": 1.0}}
+
+
+def peak_rss():
+    """Return the peak resident set size of the process, in bytes.
+
+    :rtype: int
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in KiB elsewhere
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def run_scenario(columns, paths, rows, options, directory):
+    """Run a benchmark scenario.
+
+    :param list columns: The csvfile columns.
+    :param list paths: The csvfile paths, in merge order.
+    :param int rows: The number of rows of the csvfiles.
+    :param dict options: The MergeFiles options.
+    :param str directory: The scratch directory.
+    :rtype: dict
+    """
+    db = os.path.join(directory, "bench.db")
+    with MergeFiles(columns, INDEXES, db, **options) as mf:
+        start_time = timeit.default_timer()
+        for path in paths:
+            with open(path, newline="", encoding="utf-8") as fp:
+                mf.merge(fp)
+        merge_seconds = timeit.default_timer() - start_time
+        db_bytes = os.path.getsize(db) if os.path.exists(db) else None
+        start_time = timeit.default_timer()
+        for _ in mf.rows():
+            pass
+        rows_seconds = timeit.default_timer() - start_time
+        write_csv = mf.write_csv(os.path.join(directory, "merge.csv"))
+        return {
+            # The engine used, which differs from the scenario engine after a
+            # fallback (such as "sorted" on an unsorted csvfile)
+            "engine": mf._engine,
+            "rows": rows,
+            "rowcount": mf.rowcount,
+            "affected_count": mf.affected_count,
+            "merge_seconds": merge_seconds,
+            "merge_rows_per_second": rows / merge_seconds,
+            "rows_seconds": rows_seconds,
+            "rows_per_second": mf.rowcount / rows_seconds if rows_seconds else 0.0,
+            "write_csv_seconds": write_csv["seconds"],
+            "write_csv_rows_per_second": write_csv["rows_per_second"],
+            "db_bytes": db_bytes,
+            "peak_rss_bytes": peak_rss(),
+        }
+
+
+def _run_scenario(queue, *args):
+    """Run a benchmark scenario, and put its result in a queue (a process target).
+
+    :param multiprocessing.Queue queue: The result queue.
+    """
+    try:
+        queue.put(run_scenario(*args))
+    except Exception as e:
+        queue.put({"error": repr(e)})
+
+
+def compare(results, baseline):
+    """Compare results with a baseline, scenario by scenario.
+
+    :param list results: The scenario results.
+    :param list baseline: The baseline scenario results.
+    :return: The ratio (result / baseline) of each throughput.
+    :rtype: dict
+    """
+    metrics = ("merge_rows_per_second", "rows_per_second", "write_csv_rows_per_second")
+    baseline = {i["scenario"]: i for i in baseline}
+    ratios = {}
+    for result in results:
+        other = baseline.get(result["scenario"])
+        if not other or "error" in result or "error" in other:
+            continue
+        ratios[result["scenario"]] = {
+            i: result[i] / other[i] if other[i] else None for i in metrics
+        }
+    return ratios
+
+
+def generate_inputs(args, sortedness, directory):
+    """Generate the csvfiles of a benchmark run.
+
+    :param argparse.Namespace args: The command line arguments.
+    :param float sortedness: The fraction of rows in index order.
+    :param str directory: The directory of the csvfiles.
+    :return: The csvfile columns, and the csvfile paths.
+    :rtype: tuple
+    """
+    directory = tempfile.mkdtemp(dir=directory)
+    paths = [os.path.join(directory, f"{i}.csv") for i in range(args.files)]
+    for i, path in enumerate(paths):
+        columns = generate_csv(
+            path,
+            args.rows,
+            args.width,
+            args.duplicates,
+            args.cardinality,
+            sortedness,
+            args.seed + i,
+        )
+    return columns, paths
+
+
+def main():
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000, help="rows per csvfile")
+    parser.add_argument("--files", type=int, default=2, help="number of csvfiles")
+    parser.add_argument("--width", type=int, default=4, help="number of columns")
+    parser.add_argument("--duplicates", type=float, default=0.0)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--sortedness", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=list(SCENARIOS),
+        help="the scenarios to run (default: all)",
+    )
+    parser.add_argument("--output", help="the results file (default: stdout)")
+    parser.add_argument("--baseline", help="a results file to compare with")
+    args = parser.parse_args()
+    parameters = {
+        i: getattr(args, i)
+        for i in ("rows", "files", "width", "duplicates", "cardinality", "sortedness")
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        # The csvfiles of each set of parameters, generated once
+        inputs = {}
+        for scenario in args.scenario or SCENARIOS:
+            sortedness = SCENARIO_PARAMETERS.get(scenario, {}).get(
+                "sortedness", args.sortedness
+            )
+            if sortedness not in inputs:
+                inputs[sortedness] = generate_inputs(args, sortedness, directory)
+            columns, paths = inputs[sortedness]
+            scratch = tempfile.mkdtemp(dir=directory)
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_run_scenario,
+                args=(
+                    queue,
+                    columns,
+                    paths,
+                    args.rows * args.files,
+                    SCENARIOS[scenario],
+                    scratch,
+                ),
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append({"scenario": scenario, "sortedness": sortedness, **result})
+            print(f"{scenario}: {result}", file=sys.stderr)
+    output = {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parameters": parameters,
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            output["baseline"] = compare(results, json.load(fp)["results"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(output, fp, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
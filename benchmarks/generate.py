@@ -0,0 +1,95 @@
+"""Generate synthetic csvfiles for the csvblend benchmarks."""
+
+import argparse
+import csv
+import random
+
+# The index columns of the generated csvfiles
+INDEXES = ["k1", "k2"]
+
+
+def generate_keys(rows, duplicates, cardinality, sortedness, rng):
+    """Generate the index keys of a csvfile.
+
+    :param int rows: The number of rows.
+    :param float duplicates: The fraction of rows repeating a key of the csvfile.
+    :param int cardinality: The number of distinct keys to draw from (keys shared
+           by csvfiles drawing from the same space are updates).
+    :param float sortedness: The fraction of rows in index order (1.0 is sorted).
+    :param random.Random rng: The random number generator.
+    :rtype: list[int]
+    """
+    unique = max(int(rows * (1 - duplicates)), 1)
+    keys = rng.sample(range(cardinality), min(unique, cardinality))
+    keys += rng.choices(keys, k=rows - len(keys))
+    keys.sort()
+    # Move a fraction of the rows out of order
+    unsorted = int(rows * (1 - sortedness))
+    for i in rng.sample(range(rows), unsorted):
+        j = rng.randrange(rows)
+        keys[i], keys[j] = keys[j], keys[i]
+    return keys
+
+
+def generate_csv(
+    path,
+    rows,
+    width=4,
+    duplicates=0.0,
+    cardinality=None,
+    sortedness=0.0,
+    seed=0,
+):
+    """Write a synthetic csvfile.
+
+    The first two columns (INDEXES) are zero-padded, so the text order of the keys
+    is their numeric order. The other columns are random reals.
+
+    :param str path: The csvfile path.
+    :param int rows: The number of rows.
+    :param int width: (optional) The number of columns (at least 3).
+    :param float duplicates: (optional) The fraction of duplicate keys.
+    :param int cardinality: (optional) The key space (default: rows).
+    :param float sortedness: (optional) The fraction of rows in index order.
+    :param int seed: (optional) The random seed.
+    :return: The csvfile columns.
+    :rtype: list
+    """
+    if width < 3:
+        raise ValueError("width should be at least 3")
+    rng = random.Random(seed)
+    keys = generate_keys(rows, duplicates, cardinality or rows, sortedness, rng)
+    columns = INDEXES + [f"v{i}" for i in range(1, width - 1)]
+    with open(path, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(columns)
+        for key in keys:
+            values = [f"{rng.random():.6f}" for _ in range(width - 2)]
+            writer.writerow([f"{key // 1000:09d}", f"{key % 1000:03d}", *values])
+    return columns
+
+
+def main():
+    """Run the generator from the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path", help="the csvfile path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--width", type=int, default=4)
+    parser.add_argument("--duplicates", type=float, default=0.0)
+    parser.add_argument("--cardinality", type=int, default=None)
+    parser.add_argument("--sortedness", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_csv(
+        args.path,
+        args.rows,
+        args.width,
+        args.duplicates,
+        args.cardinality,
+        args.sortedness,
+        args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
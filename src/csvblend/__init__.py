@@ -25,4 +25,11 @@ Example::
     ...         print(row)
 """
 
-from csvblend.models import MergeFiles  # noqa: F401
+from csvblend.models import (  # noqa: F401
+    AsyncMergeFiles,
+    DatabasePool,
+    MergeFiles,
+    MergeStats,
+    PartitionedMergeFiles,
+    Tuning,
+)
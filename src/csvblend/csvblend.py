@@ -1,112 +1,905 @@
 """Primary methods that power csvblend."""
 
+import functools
 import logging
 import sqlite3
 
 logger = logging.getLogger(__name__)
 
 
-def create_database(database):
+def create_database(database, pragmas=None, check_same_thread=True):
     """Create a merge database (SQLite3).
 
     :param str database: The database file.
+    :param dict pragmas: (optional) The PRAGMA statements to run, in order.
+    :param bool check_same_thread: (optional) Only allow the connection in the
+           thread creating it (False to hand it over to another thread, one at a
+           time).
     :rtype: sqlite3.Connection
     """
     logger.debug("Create the merge database: '%s'", database)
-    connection = sqlite3.connect(database)
-    # Disable the rollback journal completely
-    connection.execute("PRAGMA journal_mode = OFF;")
-    # Change the "synchronous" flag to OFF
-    connection.execute("PRAGMA synchronous = OFF;")
+    connection = sqlite3.connect(database, check_same_thread=check_same_thread)
+    if pragmas is None:
+        # Disable the rollback journal completely, and change the "synchronous"
+        # flag to OFF
+        pragmas = {"journal_mode": "OFF", "synchronous": "OFF"}
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value};")
     return connection
 
 
-def create_table(connection, table, columns, indexes):
+def select_pragmas(connection, names):
+    """Select the (effective) PRAGMA values of a merge database.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param list names: The PRAGMA names.
+    :return: The PRAGMA values (None if not applicable, such as the mmap_size of an
+             in-memory database).
+    :rtype: dict
+    """
+    pragmas = {}
+    for name in names:
+        row = connection.execute(f"PRAGMA {name};").fetchone()
+        pragmas[name] = row[0] if row else None
+    return pragmas
+
+
+def create_table(
+    connection, table, columns, indexes, unique=True, types=None, without_rowid=False
+):
     """Create a merge database table.
 
     :param sqlite3.Connection connection: The database connection.
     :param str table: The merge table.
     :param list columns: The table columns.
     :param list indexes: The table indexes.
+    :param bool unique: (optional) Whether to add the UNIQUE constraint. Without
+           it, the constraint must be added later with create_index().
+    :param list types: (optional) The declared type of each column (default:
+           TEXT).
+    :param bool without_rowid: (optional) Create a WITHOUT ROWID table, with the
+           indexes as its PRIMARY KEY (the table is its own index). The indexes
+           can not be NULL.
     :rtype: sqlite3.Cursor
     """
-    create_columns = ", ".join([f'"{i}" TEXT' for i in columns])
+    types = types or ["TEXT"] * len(columns)
+    create_columns = ", ".join([f'"{i}" {j}' for i, j in zip(columns, types)])
     create_indexes = ", ".join([f'"{i}"' for i in indexes])
+    if without_rowid:
+        query = f"""
+            CREATE TABLE {table} ({create_columns},
+            PRIMARY KEY ({create_indexes})) WITHOUT ROWID;
+        """
+    elif unique:
+        query = f"""
+            CREATE TABLE {table} ({create_columns},
+            UNIQUE ({create_indexes}));
+        """
+    else:
+        query = f"""
+            CREATE TABLE {table} ({create_columns});
+        """
+    logger.debug("Create the merge table")
+    return connection.execute(query)
+
+
+def add_column(connection, table, column, type_=None):
+    """Add a column to a merge table, its values are NULL.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str column: The column.
+    :param str type_: (optional) The declared type of the column.
+    :rtype: sqlite3.Cursor
+    """
+    column_type = f" {type_}" if type_ else ""
     query = f"""
-        CREATE TABLE {table} ({create_columns},
-        UNIQUE ({create_indexes}));
+        ALTER TABLE {table} ADD COLUMN "{column}"{column_type};
     """
-    logger.debug("Create the merge table")
+    logger.debug("Add a merge table column")
     return connection.execute(query)
 
 
-def insert_values(connection, table, columns, indexes, values):
-    """Insert values into a merge table.
+def create_index(connection, table, indexes):
+    """Create the UNIQUE index of a merge table.
+
+    Building the index once over a loaded table (a single sort) is much cheaper
+    than maintaining it row by row. The index is also a valid ON CONFLICT target
+    for insert_values().
 
     :param sqlite3.Connection connection: The database connection.
     :param str table: The merge table.
-    :param list columns: The table columns.
     :param list indexes: The table indexes.
-    :param list[tuple] values: The values to insert.
     :rtype: sqlite3.Cursor
     """
-    insert_columns = ", ".join([f'"{i}"' for i in columns])
-    insert_indexes = ", ".join([f'"{i}"' for i in indexes])
-    insert_bindings = ", ".join([f"@{i}" for i in columns])
+    create_indexes = ", ".join([f'"{i}"' for i in indexes])
     query = f"""
-        INSERT INTO {table} ({insert_columns})
-        VALUES ({insert_bindings})
-        ON CONFLICT ({insert_indexes})
+        CREATE UNIQUE INDEX {table}_unique ON {table} ({create_indexes});
+    """
+    logger.debug("Create the merge index")
+    return connection.execute(query)
+
+
+# The conflict policies: the new value of a column ({0}) when a row conflicts
+# with the merge table. "last" takes the new value, "first" keeps the current
+# value, "coalesce" takes the new value unless it is empty (or NULL), "max" and
+# "min" take the greater and lower value (ignoring NULL)
+CONFLICTS = {
+    "last": "excluded.{0}",
+    "first": "{0}",
+    "coalesce": "coalesce(nullif(excluded.{0}, ''), {0})",
+    "max": "coalesce(max({0}, excluded.{0}), {0}, excluded.{0})",
+    "min": "coalesce(min({0}, excluded.{0}), {0}, excluded.{0})",
+}
+
+
+def _conflict_clause(columns, indexes, conflicts=None, latest=None):
+    """Build the ON CONFLICT clause of a merge table INSERT statement.
+
+    :param list columns: The table columns.
+    :param list indexes: The table indexes.
+    :param dict conflicts: (optional) The conflict policy of each column, one of
+           CONFLICTS (default: "last").
+    :param str latest: (optional) The column ordering the conflicting rows, a row
+           only updates the merge table when its latest value is not lower.
+    :rtype: str
     """
-    # The table indexes value columns (columns - indexes)
-    ivalues = [i for i in columns if i not in indexes]
+    conflict_indexes = ", ".join([f'"{i}"' for i in indexes])
+    clause = f"""
+        ON CONFLICT ({conflict_indexes})
+    """
+    conflicts = conflicts or {}
+    # The table indexes value columns (columns - indexes), the "first" values are
+    # never updated
+    ivalues = [i for i in columns if i not in indexes and conflicts.get(i) != "first"]
     if ivalues:
         update_columns = ", ".join([f'"{i}"' for i in ivalues])
-        update_bindings = ", ".join([f"@{i}" for i in ivalues])
+        update_values = ", ".join(
+            [CONFLICTS[conflicts.get(i, "last")].format(f'"{i}"') for i in ivalues]
+        )
         # The idea of the UPSERT statement is that when a UNIQUE or PRIMARY KEY
         # constraint violation occurs, the UPSERT statement:
         # - First, checks if the existing row that causes the constraint
         #   violation matches the new row
         # - Second, if no match, updates the existing row values with the new
         #   row
-        query += f"""
-            DO UPDATE SET ({update_columns}) = ({update_bindings})
-            WHERE ({update_columns}) != ({update_bindings})
+        # Unlike !=, IS NOT also matches a NULL value with a non-NULL value
+        clause += f"""
+            DO UPDATE SET ({update_columns}) = ({update_values})
+            WHERE ({update_columns}) IS NOT ({update_values})
         """
+        if latest:
+            clause += f"""
+                AND (excluded."{latest}" >= "{latest}" OR "{latest}" IS NULL)
+            """
     else:
-        query += """
+        clause += """
             DO NOTHING
         """
+    return clause
+
+
+# The number of statements kept by the statement caches (see _insert_query())
+STATEMENT_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _insert_query(table, columns, indexes, conflicts, latest, staging=False):
+    """Build the INSERT statement of a merge table, once per merge plan.
+
+    The statement text is the same for the same arguments, which also lets
+    sqlite3 reuse its prepared statement on a connection.
+
+    :param str table: The merge table.
+    :param tuple columns: The table columns.
+    :param tuple indexes: The table indexes.
+    :param frozenset conflicts: The (column, policy) items of the conflict
+           policies (see _conflict_clause()).
+    :param str latest: The column ordering the conflicting rows, or None.
+    :param bool staging: (optional) Insert the staging table values, otherwise
+           the bound values.
+    :rtype: str
+    """
+    insert_columns = ", ".join([f'"{i}"' for i in columns])
+    if staging:
+        # The WHERE clause avoids a parsing ambiguity between ON CONFLICT and the
+        # ON clause of a join
+        query = f"""
+            INSERT INTO {table} ({insert_columns})
+            SELECT {insert_columns} FROM temp.{table}_staging
+            WHERE 1 ORDER BY rowid
+        """
+    else:
+        insert_bindings = ", ".join(["?"] * len(columns))
+        query = f"""
+            INSERT INTO {table} ({insert_columns})
+            VALUES ({insert_bindings})
+        """
+    query += _conflict_clause(columns, indexes, dict(conflicts), latest)
     query += ";"
+    return query
+
+
+def insert_values(
+    connection, table, columns, indexes, values, conflicts=None, latest=None
+):
+    """Insert values into a merge table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :param list indexes: The table indexes.
+    :param list[tuple] values: The values to insert.
+    :param dict conflicts: (optional) The conflict policy of each column (see
+           _conflict_clause()).
+    :param str latest: (optional) The column ordering the conflicting rows (see
+           _conflict_clause()).
+    :rtype: sqlite3.Cursor
+    """
+    query = _insert_query(
+        table,
+        tuple(columns),
+        tuple(indexes),
+        frozenset((conflicts or {}).items()),
+        latest,
+    )
     logger.debug("Insert the merge values")
     return connection.executemany(query, values)
 
 
-def select_values(connection, table, columns):
+def create_staging(connection, table, columns):
+    """Create the (temporary) staging table of a merge table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :rtype: sqlite3.Cursor
+    """
+    create_columns = ", ".join([f'"{i}"' for i in columns])
+    query = f"""
+        CREATE TEMP TABLE {table}_staging ({create_columns});
+    """
+    logger.debug("Create the staging table")
+    return connection.execute(query)
+
+
+def insert_staging(connection, table, columns, indexes, conflicts=None, latest=None):
+    """Insert the staging table values into a merge table, and empty it.
+
+    The values are applied in staging order with a single INSERT ... SELECT, so
+    the result (and the cursor rowcount) match insert_values() row by row.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :param list indexes: The table indexes.
+    :param dict conflicts: (optional) The conflict policy of each column (see
+           _conflict_clause()).
+    :param str latest: (optional) The column ordering the conflicting rows (see
+           _conflict_clause()).
+    :rtype: sqlite3.Cursor
+    """
+    query = _insert_query(
+        table,
+        tuple(columns),
+        tuple(indexes),
+        frozenset((conflicts or {}).items()),
+        latest,
+        staging=True,
+    )
+    logger.debug("Insert the staging values")
+    cursor = connection.execute(query)
+    connection.execute(f"""
+        DELETE FROM temp.{table}_staging;
+    """)
+    return cursor
+
+
+def load_values(connection, table, columns, values):
+    """Load values into a merge table without conflict checks.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :param list[tuple] values: The values to load.
+    :rtype: sqlite3.Cursor
+    """
+    insert_columns = ", ".join([f'"{i}"' for i in columns])
+    insert_bindings = ", ".join(["?"] * len(columns))
+    query = f"""
+        INSERT INTO {table} ({insert_columns})
+        VALUES ({insert_bindings});
+    """
+    logger.debug("Load the merge values")
+    return connection.executemany(query, values)
+
+
+def dedupe_values(connection, table, columns, indexes, conflicts=None):
+    """Remove the duplicate indexes from a merge table (loaded by load_values()).
+
+    The result matches insert_values() applied row by row: each index keeps the
+    position of its first row and the values of its last row (or the values of
+    its conflict policies). Rows with a NULL index are never duplicates (as with
+    a UNIQUE constraint).
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :param list indexes: The table indexes.
+    :param dict conflicts: (optional) The conflict policy of each column (see
+           _conflict_clause()).
+    :return: The number of duplicate indexes.
+    :rtype: int
+    """
+    conflicts = conflicts or {}
+    dedupe_indexes = ", ".join([f'"{i}"' for i in indexes])
+    dedupe_notnull = " AND ".join([f'"{i}" IS NOT NULL' for i in indexes])
+    # The table indexes value columns (columns - indexes), the "first" values are
+    # already in the first row
+    ivalues = [i for i in columns if i not in indexes and conflicts.get(i) != "first"]
+    # The aggregate of each "max", "min" and "coalesce" column (the rowid of its
+    # last non-empty value)
+    aggregates = {}
+    for i in ivalues:
+        if conflicts.get(i) in ("max", "min"):
+            aggregates[i] = f'{conflicts[i]}("{i}")'
+        elif conflicts.get(i) == "coalesce":
+            aggregates[i] = (
+                f"max(CASE WHEN nullif(\"{i}\", '') IS NOT NULL THEN rowid END)"
+            )
+    # The indexes of each duplicate group are kept, to delete its other rows
+    dedupe_columns = "".join([f', "{i}"' for i in [*indexes, *aggregates]])
+    dedupe_aggregates = "".join(
+        [f', "{i}"' for i in indexes] + [f", {i}" for i in aggregates.values()]
+    )
+    logger.debug("Dedupe the merge values")
+    connection.execute(f"""
+        CREATE TEMP TABLE merge_dedupe (
+        first_id INTEGER PRIMARY KEY, last_id INTEGER{dedupe_columns});
+    """)
+    cursor = connection.execute(f"""
+        INSERT INTO merge_dedupe (first_id, last_id{dedupe_columns})
+        SELECT min(rowid), max(rowid){dedupe_aggregates} FROM {table}
+        WHERE {dedupe_notnull}
+        GROUP BY {dedupe_indexes} HAVING count(*) > 1;
+    """)
+    duplicates = cursor.rowcount
+    if not duplicates:
+        connection.execute("""
+            DROP TABLE temp.merge_dedupe;
+        """)
+        return duplicates
+    if ivalues:
+        update_columns = ", ".join([f'"{i}"' for i in ivalues])
+        update_values = []
+        for i in ivalues:
+            if conflicts.get(i) == "coalesce":
+                update_values.append(f"""coalesce((
+                    SELECT "{i}" FROM {table} AS value_row
+                    WHERE value_row.rowid = merge_dedupe."{i}"), {table}."{i}")""")
+            elif i in aggregates:
+                update_values.append(f'merge_dedupe."{i}"')
+            else:
+                update_values.append(f'last_row."{i}"')
+        update_values = ", ".join(update_values)
+        # Move the last values (or aggregates) of each index into its first row
+        connection.execute(f"""
+            UPDATE {table} SET ({update_columns}) = (
+                SELECT {update_values} FROM merge_dedupe, {table} AS last_row
+                WHERE merge_dedupe.first_id = {table}.rowid
+                AND last_row.rowid = merge_dedupe.last_id)
+            WHERE rowid IN (SELECT first_id FROM merge_dedupe);
+        """)
+    # Delete the other rows of the duplicate groups only, instead of grouping the
+    # whole table again (a NULL index is never IN a group)
+    connection.execute(f"""
+        DELETE FROM {table}
+        WHERE ({dedupe_indexes}) IN (SELECT {dedupe_indexes} FROM merge_dedupe)
+        AND rowid NOT IN (SELECT first_id FROM merge_dedupe);
+    """)
+    connection.execute("""
+        DROP TABLE temp.merge_dedupe;
+    """)
+    return duplicates
+
+
+def select_values(connection, table, columns, indexes=None, where=None, limit=None):
     """Select the values from a merge table.
 
     :param sqlite3.Connection connection: The database connection.
     :param str table: The merge table.
     :param list columns: The table columns.
+    :param list indexes: (optional) The table indexes, to order the values by (a
+           scan of the UNIQUE index, so without a sort).
+    :param list where: (optional) The (column, values) conditions of the values
+           selected: the column value is one of values (None is NULL). Conditions
+           on a prefix of the indexes search the UNIQUE index.
+    :param int limit: (optional) The maximum number of values.
     :rtype: sqlite3.Cursor
     """
     select_columns = ", ".join([f'"{i}"' for i in columns])
     query = f"""
-        SELECT {select_columns} FROM {table};
+        SELECT {select_columns} FROM {table}
     """
+    parameters = []
+    if where:
+        conditions = []
+        for column, values in where:
+            terms = []
+            bound = [i for i in values if i is not None]
+            if bound:
+                bindings = ", ".join(["?"] * len(bound))
+                terms.append(f'"{column}" IN ({bindings})')
+                parameters += bound
+            if None in values:
+                terms.append(f'"{column}" IS NULL')
+            # No values match no rows
+            conditions.append(f"({' OR '.join(terms) or '0'})")
+        query += f"""
+            WHERE {" AND ".join(conditions)}
+        """
+    if indexes:
+        order_indexes = ", ".join([f'"{i}"' for i in indexes])
+        query += f"""
+            ORDER BY {order_indexes}
+        """
+    if limit is not None:
+        query += """
+            LIMIT ?
+        """
+        parameters.append(limit)
+    query += ";"
     logger.debug("Select the merge values")
-    return connection.execute(query)
+    return connection.execute(query, parameters)
+
+
+def select_keys(connection, table, columns, indexes, keys):
+    """Select the rows of a list of keys (index values) from a merge table.
+
+    A single key is selected with its index. More keys are inserted into a
+    (temporary) keys table, which is joined with the index in one statement.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The columns to select.
+    :param list indexes: The table indexes.
+    :param list[tuple] keys: The keys (without NULL values), in indexes order.
+    :return: The position of the key, followed by its values, of each key found.
+    :rtype: list[tuple]
+    """
+    if len(keys) == 1:
+        where = [(i, [j]) for i, j in zip(indexes, keys[0])]
+        cursor = select_values(connection, table, columns, where=where)
+        return [(0, *i) for i in cursor]
+    keys_columns = ", ".join([f'"{i}"' for i in indexes])
+    keys_bindings = ", ".join(["?"] * (len(indexes) + 1))
+    connection.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {table}_keys (
+        position INTEGER PRIMARY KEY, {keys_columns});
+    """)
+    select_columns = "".join([f', {table}."{i}"' for i in columns])
+    select_join = " AND ".join([f'{table}."{i}" = lookup."{i}"' for i in indexes])
+    # The keys table is emptied even if the lookup fails, so the next lookup only
+    # finds its own keys
+    try:
+        connection.executemany(
+            f"""
+            INSERT INTO temp.{table}_keys (position, {keys_columns})
+            VALUES ({keys_bindings});
+        """,
+            [(i, *j) for i, j in enumerate(keys)],
+        )
+        # The CROSS JOIN keeps the keys as the outer loop, each key searches the
+        # index
+        logger.debug("Select the merge keys")
+        return connection.execute(f"""
+            SELECT lookup.position{select_columns}
+            FROM temp.{table}_keys AS lookup CROSS JOIN {table}
+            ON {select_join};
+        """).fetchall()
+    finally:
+        connection.execute(f"""
+            DELETE FROM temp.{table}_keys;
+        """)
 
 
-def select_count(connection, table):
+def select_count(connection, table, rowid=None):
     """Count the values inside a merge table.
 
     :param sqlite3.Connection connection: The database connection.
     :param str table: The merge table.
+    :param int rowid: (optional) Only count the values inserted after this rowid
+           (a range scan of the new rows, rather than a scan of the table).
+    :rtype: sqlite3.Cursor
+    """
+    if rowid is None:
+        query = f"""
+            SELECT count(*) FROM {table};
+        """
+        logger.debug("Count the merge values")
+        return connection.execute(query)
+    query = f"""
+        SELECT count(*) FROM {table} WHERE rowid > ?;
+    """
+    logger.debug("Count the merge values after rowid %s", rowid)
+    return connection.execute(query, (rowid,))
+
+
+def select_size(connection):
+    """Select the size of a merge database, in bytes.
+
+    :param sqlite3.Connection connection: The database connection.
+    :rtype: int
+    """
+    cursor = connection.execute("""
+        SELECT page_count * page_size
+        FROM pragma_page_count(), pragma_page_size();
+    """)
+    return cursor.fetchone()[0]
+
+
+def select_rowid(connection, table):
+    """Select the last rowid of a merge table.
+
+    New values are always inserted after the last rowid, see select_count().
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        SELECT coalesce(max(rowid), 0) FROM {table};
+    """
+    return connection.execute(query)
+
+
+def create_changes(connection, table, indexes=None):
+    """Create the change log of a merge table.
+
+    Triggers record the rowid of each inserted or updated row, tagged with the
+    current merge sequence number (see update_sequence()). UPSERT statements that
+    change nothing do not fire the UPDATE trigger.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list indexes: (optional) The table indexes, recorded instead of the
+           rowid (for a WITHOUT ROWID table).
+    :rtype: sqlite3.Cursor
+    """
+    if indexes:
+        log_columns = ", ".join([f'"{i}"' for i in indexes])
+        log_values = ", ".join([f'new."{i}"' for i in indexes])
+    else:
+        log_columns, log_values = "id", "new.rowid"
+    logger.debug("Create the change log")
+    connection.execute(f"""
+        CREATE TABLE {table}_sequence (merge INTEGER NOT NULL);
+    """)
+    connection.execute(f"""
+        INSERT INTO {table}_sequence (merge) VALUES (0);
+    """)
+    connection.execute(f"""
+        CREATE TABLE {table}_changes (merge INTEGER NOT NULL, {log_columns});
+    """)
+    for event in ("INSERT", "UPDATE"):
+        cursor = connection.execute(f"""
+            CREATE TRIGGER {table}_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                INSERT INTO {table}_changes (merge, {log_columns})
+                SELECT merge, {log_values} FROM {table}_sequence;
+            END;
+        """)
+    return cursor
+
+
+def update_sequence(connection, table, merge):
+    """Update the merge sequence number of the change log.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param int merge: The merge sequence number (from 1).
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        UPDATE {table}_sequence SET merge = ?;
+    """
+    return connection.execute(query, (merge,))
+
+
+def select_changes(connection, table, columns, merge, indexes=None):
+    """Select the values inserted or updated after a merge sequence number.
+
+    Each row is returned once (with its current values), in merge order (index
+    order for a WITHOUT ROWID table).
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param list columns: The table columns.
+    :param int merge: The merge sequence number.
+    :param list indexes: (optional) The table indexes, if the change log records
+           them (see create_changes()).
+    :rtype: sqlite3.Cursor
+    """
+    select_columns = ", ".join([f'"{i}"' for i in columns])
+    if indexes:
+        table_keys = log_keys = ", ".join([f'"{i}"' for i in indexes])
+    else:
+        table_keys, log_keys = "rowid", "id"
+    query = f"""
+        SELECT {select_columns} FROM {table}
+        WHERE ({table_keys}) IN (
+            SELECT {log_keys} FROM {table}_changes WHERE merge > ?)
+        ORDER BY {table_keys};
+    """
+    logger.debug("Select the merge changes after merge %s", merge)
+    return connection.execute(query, (merge,))
+
+
+def select_columns(connection, table):
+    """Select the columns of a database table, and their declared types.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The table.
+    :return: The table columns (empty if the table does not exist).
+    :rtype: dict
+    """
+    cursor = connection.execute(f"""
+        PRAGMA table_info({table});
+    """)
+    # table_info: (cid, name, type, notnull, dflt_value, pk)
+    return {i[1]: i[2] for i in cursor}
+
+
+def select_without_rowid(connection, table):
+    """Return True if a merge table is a WITHOUT ROWID table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :rtype: bool
+    """
+    cursor = connection.execute(
+        """
+        SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;
+    """,
+        (table,),
+    )
+    row = cursor.fetchone()
+    return bool(row) and "WITHOUT ROWID" in row[0].upper()
+
+
+def select_unique_indexes(connection, table):
+    """Select the UNIQUE indexes of a merge table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :return: The columns of each UNIQUE index (or constraint).
+    :rtype: list[list]
+    """
+    indexes = []
+    cursor = connection.execute(f"""
+        PRAGMA index_list({table});
+    """)
+    for index in cursor.fetchall():
+        # index_list: (seq, name, unique, origin, partial)
+        if index[2]:
+            cursor = connection.execute(f"""
+                PRAGMA index_info("{index[1]}");
+            """)
+            indexes.append([i[2] for i in cursor])
+    return indexes
+
+
+def select_merge_count(connection):
+    """Select the number of merges applied to a merge database.
+
+    :param sqlite3.Connection connection: The database connection.
+    :rtype: int
+    """
+    cursor = connection.execute("""
+        PRAGMA user_version;
+    """)
+    return cursor.fetchone()[0]
+
+
+def update_merge_count(connection, merge_count):
+    """Update the number of merges applied to a merge database.
+
+    The count is kept in the database header (the user_version PRAGMA), and is
+    written with the current transaction.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param int merge_count: The number of merges.
     :rtype: sqlite3.Cursor
     """
     query = f"""
-        SELECT count(*) FROM {table};
+        PRAGMA user_version = {int(merge_count)};
     """
-    logger.debug("Count the merge values")
     return connection.execute(query)
+
+
+def create_manifest(connection, table):
+    """Create the manifest of a merge table (the csvfiles merged), if needed.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        CREATE TABLE IF NOT EXISTS {table}_manifest (
+        path TEXT NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL,
+        merge INTEGER NOT NULL);
+    """
+    return connection.execute(query)
+
+
+def insert_manifest(connection, table, path, size, sha256, merge):
+    """Record a merged csvfile in the manifest of a merge table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str path: The csvfile path.
+    :param int size: The csvfile size, in bytes.
+    :param str sha256: The csvfile checksum.
+    :param int merge: The merge sequence number.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        INSERT INTO {table}_manifest (path, size, sha256, merge)
+        VALUES (?, ?, ?, ?);
+    """
+    return connection.execute(query, (path, size, sha256, merge))
+
+
+def select_manifest(connection, table, path, size, sha256):
+    """Select the merge sequence numbers of a csvfile from a merge table manifest.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str path: The csvfile path.
+    :param int size: The csvfile size, in bytes.
+    :param str sha256: The csvfile checksum.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        SELECT merge FROM {table}_manifest
+        WHERE path = ? AND size = ? AND sha256 = ?;
+    """
+    return connection.execute(query, (path, size, sha256))
+
+
+def create_checkpoint(connection, table):
+    """Create the checkpoints of a merge table (the csvfiles being merged), if needed.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        CREATE TABLE IF NOT EXISTS {table}_checkpoint (
+        path TEXT NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL,
+        offset INTEGER NOT NULL, rows INTEGER NOT NULL);
+    """
+    return connection.execute(query)
+
+
+def update_checkpoint(connection, table, path, size, sha256, offset, rows):
+    """Record the checkpoint of a csvfile being merged into a merge table.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str path: The csvfile path.
+    :param int size: The csvfile size, in bytes.
+    :param str sha256: The csvfile checksum.
+    :param int offset: The position after the last record merged, in bytes.
+    :param int rows: The number of rows merged.
+    :rtype: sqlite3.Cursor
+    """
+    delete_checkpoint(connection, table, path)
+    query = f"""
+        INSERT INTO {table}_checkpoint (path, size, sha256, offset, rows)
+        VALUES (?, ?, ?, ?, ?);
+    """
+    return connection.execute(query, (path, size, sha256, offset, rows))
+
+
+def select_checkpoint(connection, table, path, size, sha256):
+    """Select the checkpoint (offset, rows) of a csvfile being merged.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str path: The csvfile path.
+    :param int size: The csvfile size, in bytes.
+    :param str sha256: The csvfile checksum.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        SELECT offset, rows FROM {table}_checkpoint
+        WHERE path = ? AND size = ? AND sha256 = ?;
+    """
+    return connection.execute(query, (path, size, sha256))
+
+
+def delete_checkpoint(connection, table, path):
+    """Delete the checkpoint of a csvfile.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param str path: The csvfile path.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        DELETE FROM {table}_checkpoint WHERE path = ?;
+    """
+    return connection.execute(query, (path,))
+
+
+def create_counter(connection, table, count=0):
+    """Count the rows inserted into a merge table, in a temporary table.
+
+    A WITHOUT ROWID table has no rowid to count its new rows with (see
+    select_count()), so a (temporary) trigger counts them instead.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param int count: (optional) The initial count.
+    :rtype: sqlite3.Cursor
+    """
+    connection.execute(f"""
+        CREATE TEMP TABLE {table}_inserts (count INTEGER NOT NULL);
+    """)
+    query = f"""
+        INSERT INTO temp.{table}_inserts (count) VALUES (?);
+    """
+    connection.execute(query, (count,))
+    return connection.execute(f"""
+        CREATE TEMP TRIGGER {table}_count AFTER INSERT ON main.{table}
+        BEGIN
+            UPDATE {table}_inserts SET count = count + 1;
+        END;
+    """)
+
+
+def select_counter(connection, table):
+    """Select the number of rows inserted into a merge table (see create_counter()).
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :rtype: sqlite3.Cursor
+    """
+    query = f"""
+        SELECT count FROM temp.{table}_inserts;
+    """
+    return connection.execute(query)
+
+
+def reset_database(connection, table, changes=False, staging=False, counter=False):
+    """Empty a merge database, keeping its schema (and its prepared statements).
+
+    The merge table, its manifest and checkpoint tables are emptied, and the merge
+    count is reset, so the database can be used as a new one.
+
+    :param sqlite3.Connection connection: The database connection.
+    :param str table: The merge table.
+    :param bool changes: (optional) Whether to empty the change log (see
+           create_changes()).
+    :param bool staging: (optional) Whether to empty the staging table (see
+           create_staging()).
+    :param bool counter: (optional) Whether to reset the inserts counter (see
+           create_counter()).
+    """
+    logger.debug("Reset the merge database")
+    tables = [table, f"{table}_manifest", f"{table}_checkpoint"]
+    if changes:
+        tables.append(f"{table}_changes")
+        update_sequence(connection, table, 0)
+    if staging:
+        tables.append(f"temp.{table}_staging")
+    for name in tables:
+        connection.execute(f"""
+            DELETE FROM {name};
+        """)
+    if counter:
+        connection.execute(f"""
+            UPDATE temp.{table}_inserts SET count = 0;
+        """)
+    update_merge_count(connection, 0)
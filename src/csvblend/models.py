@@ -1,27 +1,367 @@
 """Primary objects that power csvblend."""
 
+import asyncio
+import concurrent.futures
 import contextlib
 import csv
+import functools
+import gzip
+import heapq
+import io
+import itertools
 import logging
+import math
+import multiprocessing
 import os
+import queue
 import sqlite3
 import tempfile
+import threading
 import timeit
 
-from csvblend import csvblend, utils
+from csvblend import csvblend, sorting, utils
 
 logger = logging.getLogger(__name__)
 
+# The merge() engines: "upsert" inserts each row with an UPSERT statement,
+# "staging" loads each csvfile into a staging table and applies it with one
+# INSERT ... SELECT statement, "sorted" merges csvfiles sorted by their indexes
+# without a database (falling back to "upsert" on an unsorted csvfile), and
+# "external" sorts csvfiles into runs on disk, then merges them like "sorted"
+ENGINES = ("upsert", "staging", "sorted", "external")
+
+# The engines that merge runs (sorted by indexes) instead of a database
+RUN_ENGINES = ("sorted", "external")
+
+# The column types: their declared (SQLite) type and csv value converter
+TYPES = {
+    "integer": ("INTEGER", utils.convert_integer),
+    "real": ("REAL", utils.convert_real),
+    "text": ("TEXT", None),
+    "date": ("DATE", utils.convert_date),
+}
+
+# The write_csv() compressions ("zstd" requires the zstandard package)
+COMPRESSIONS = ("gzip", "zstd")
+
+
+class Tuning:
+    """Representation of a merge database tuning profile (SQLite PRAGMAs)."""
+
+    # The tuned PRAGMAs, in the order they are set (page_size must be set before
+    # the database is written)
+    PRAGMAS = (
+        "page_size",
+        "journal_mode",
+        "synchronous",
+        "locking_mode",
+        "temp_store",
+        "cache_size",
+        "mmap_size",
+    )
+
+    # The built-in profiles
+    PROFILES = {
+        "default": {},
+        "bulk": {
+            "page_size": 65536,
+            "temp_store": "MEMORY",
+            "cache_size": "auto",
+            "mmap_size": 1 << 30,
+        },
+        "low-memory": {
+            "page_size": 4096,
+            "temp_store": "FILE",
+            "cache_size": -2048,
+            "mmap_size": 0,
+        },
+    }
+
+    def __init__(self, memory_fraction=0.25, **pragmas):
+        """Construct a new Tuning instance from a dict of PRAGMAs.
+
+        journal_mode and synchronous default to OFF. cache_size can be "auto", a
+        fraction of the available memory.
+
+        :param float memory_fraction: (optional) The fraction of the available
+               memory used by an "auto" cache_size.
+        :param pragmas: (optional) The PRAGMA values (int or keyword).
+        """
+        if not set(pragmas).issubset(self.PRAGMAS):
+            raise ValueError(f"pragmas should be in {', '.join(self.PRAGMAS)}")
+        for value in pragmas.values():
+            if not isinstance(value, int) and not str(value).isalpha():
+                raise ValueError(f"invalid pragma value: {value!r}")
+        if not 0 < memory_fraction <= 1:
+            raise ValueError("memory_fraction should be in (0, 1]")
+        # The fraction of the available memory used by an "auto" cache_size
+        self.memory_fraction = memory_fraction
+        # The PRAGMA values
+        self._pragmas = {"journal_mode": "OFF", "synchronous": "OFF", **pragmas}
+
+    @classmethod
+    def from_profile(cls, name, **pragmas):
+        """Construct a new Tuning instance from a built-in profile.
+
+        :param str name: The profile name, one of PROFILES.
+        :param pragmas: (optional) The PRAGMA values to override.
+        :rtype: Tuning
+        """
+        if name not in cls.PROFILES:
+            raise ValueError(f"profile should be one of {', '.join(cls.PROFILES)}")
+        return cls(**{**cls.PROFILES[name], **pragmas})
+
+    def split(self, parts):
+        """Return a copy of the instance for one of parts databases.
+
+        :param int parts: The number of databases sharing the memory.
+        :rtype: Tuning
+        """
+        return Tuning(self.memory_fraction / parts, **self._pragmas)
+
+    def pragmas(self):
+        """Return the PRAGMA values to set, in order.
+
+        :rtype: dict
+        """
+        pragmas = {i: self._pragmas[i] for i in self.PRAGMAS if i in self._pragmas}
+        if pragmas.get("cache_size") == "auto":
+            available = utils.available_memory()
+            if available is None:
+                del pragmas["cache_size"]
+            else:
+                # A negative cache_size is in KiB (at least 2 MiB)
+                cache_size = int(available * self.memory_fraction) // 1024
+                pragmas["cache_size"] = -max(cache_size, 2048)
+        return pragmas
+
+
+class MergeStats:
+    """Representation of the statistics of a merge (see MergeFiles.last_merge_stats).
+
+    The times are in seconds. parse_time is the time spent waiting on the csvfile
+    reader (or on the parser processes), insert_time the time spent merging the
+    rows (the rest of total_time).
+    """
+
+    def __init__(self):
+        """Construct a new (empty) MergeStats instance."""
+        # The number of rows read from the csvfiles
+        self.rows_read = 0
+        # The number of bytes read from the csvfiles (None if unknown)
+        self.bytes_read = None
+        # The number of rows inserted into the merge table
+        self.inserted = 0
+        # The number of rows updated (not counted for the first merge, as with
+        # affected_count)
+        self.updated = 0
+        # The number of rows read, but neither inserted nor updated
+        self.unchanged = 0
+        # The merge phase times
+        self.parse_time = 0.0
+        self.insert_time = 0.0
+        self.commit_time = 0.0
+        self.count_time = 0.0
+        self.total_time = 0.0
+        # The growth of the merge database (or run) file, in bytes
+        self.size_growth = 0
+
+    def __repr__(self):
+        """Return the representation of the instance."""
+        return f"MergeStats({self.as_dict()})"
+
+    @property
+    def rows_per_second(self):
+        """The number of rows read per second.
+
+        :rtype: float
+        """
+        return self.rows_read / self.total_time if self.total_time else 0.0
+
+    def as_dict(self):
+        """Return the statistics as a dict, such as for a metrics system.
+
+        :rtype: dict
+        """
+        return {**vars(self), "rows_per_second": self.rows_per_second}
+
+
+class DatabasePool(contextlib.AbstractContextManager):
+    """Representation of a pool of (empty) temporary merge databases.
+
+    A MergeFiles instance using the pool takes the database of an instance with
+    the same merge plan (columns, indexes, types and options) cleaned up before it,
+    with its tables and prepared statements, instead of creating a new one.
+    """
+
+    def __init__(self, size=8, max_size=1 << 26):
+        """Construct a new DatabasePool instance.
+
+        :param int size: (optional) The maximum number of idle databases (the
+               oldest ones are removed).
+        :param int max_size: (optional) The size of the largest database kept, in
+               bytes (larger ones are removed on cleanup()).
+        """
+        if size < 1:
+            raise ValueError("size should be a positive number")
+        if max_size < 0:
+            raise ValueError("max_size should not be negative")
+        self.size = size
+        self.max_size = max_size
+        # True if close() has been called, otherwise False
+        self.closed = False
+        # The idle databases, (plan, connection, db, pragmas), oldest first
+        self._idle = []
+        # The lock of the idle databases, the pool can be shared by threads
+        self._lock = threading.Lock()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Close the pool (on exit)."""
+        self.close()
+
+    def __len__(self):
+        """Return the number of idle databases."""
+        return len(self._idle)
+
+    def prefill(self, columns, indexes, count=1, **options):
+        """Create idle databases for a merge plan, ahead of the instances using it.
+
+        :param list columns: The list of columns.
+        :param list indexes: The list of indexes.
+        :param int count: (optional) The number of idle databases of the plan.
+        :param options: (optional) The MergeFiles options of the plan.
+        """
+        instances = [
+            MergeFiles(columns, indexes, pool=self, **options) for _ in range(count)
+        ]
+        try:
+            for mf in instances:
+                mf._open()
+        finally:
+            for mf in instances:
+                mf.cleanup()
+
+    def _acquire(self, plan):
+        """Take the most recent idle database of a merge plan.
+
+        :param tuple plan: The merge plan.
+        :return: The (connection, db, pragmas) of the database, or None.
+        :rtype: tuple
+        """
+        with self._lock:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == plan:
+                    return self._idle.pop(i)[1:]
+        return None
+
+    def _release(self, plan, connection, db, pragmas):
+        """Keep an (empty) database of a merge plan for reuse.
+
+        :param tuple plan: The merge plan.
+        :param sqlite3.Connection connection: The database connection.
+        :param str db: The database file.
+        :param dict pragmas: The effective database PRAGMAs.
+        """
+        with self._lock:
+            if self.closed:
+                removed = [(plan, connection, db, pragmas)]
+            else:
+                self._idle.append((plan, connection, db, pragmas))
+                removed = self._idle[: -self.size]
+                del self._idle[: -self.size]
+        for _, idle_connection, idle_db, _ in removed:
+            idle_connection.close()
+            os.remove(idle_db)
+
+    def close(self):
+        """Remove the idle databases, the databases released later are removed."""
+        with self._lock:
+            self.closed = True
+            removed, self._idle = self._idle, []
+        for _, idle_connection, idle_db, _ in removed:
+            idle_connection.close()
+            os.remove(idle_db)
+
 
 class MergeFiles(contextlib.AbstractContextManager):
     """Representation of a MergeFiles instance."""
 
-    def __init__(self, columns, indexes, db=None):
+    def __init__(
+        self,
+        columns,
+        indexes,
+        db=None,
+        bulk_load=True,
+        engine="upsert",
+        tuning=None,
+        run_size=1000000,
+        track_changes=False,
+        persist=False,
+        types=None,
+        without_rowid=False,
+        metrics=None,
+        progress=None,
+        progress_rows=100000,
+        memory_limit=None,
+        commit_rows=None,
+        commit_seconds=None,
+        conflicts=None,
+        latest=None,
+        blend=False,
+        cache_size=0,
+        pool=None,
+    ):
         """Construct a new MergeFiles instance from a list of columns.
 
         :param list columns: The list of columns.
         :param list indexes: The list of indexes.
         :param str db: (optional) The database file database.
+        :param bool bulk_load: (optional) Load the first csvfile without the
+               UNIQUE constraint, and create the index afterwards.
+        :param str engine: (optional) The merge() engine, one of ENGINES.
+        :param Tuning tuning: (optional) The database tuning, or the name of a
+               built-in profile (default: "default").
+        :param int run_size: (optional) The number of rows sorted in memory at
+               once by the "external" engine.
+        :param bool track_changes: (optional) Record the rows inserted or updated
+               by each merge(), see changes().
+        :param bool persist: (optional) Keep the database file (db) on cleanup(),
+               and open it again (checking its columns and indexes) on the next
+               run.
+        :param dict types: (optional) The type of each column, one of TYPES
+               (default: "text"). The csv values are converted when read.
+        :param bool without_rowid: (optional) Store the merge table as a WITHOUT
+               ROWID table keyed by the indexes, which can not be NULL (implies
+               bulk_load=False).
+        :param callable metrics: (optional) Called with the MergeStats of each
+               merge, see last_merge_stats.
+        :param callable progress: (optional) Called with the MergeStats of the
+               current merge every progress_rows rows read.
+        :param int progress_rows: (optional) The number of rows between progress
+               calls.
+        :param int memory_limit: (optional) Start the merge database in memory,
+               and move it to the database file (db) once it is larger than
+               memory_limit bytes.
+        :param int commit_rows: (optional) Commit a merge every commit_rows rows,
+               and record a checkpoint for merge_path() to resume from. The tuning
+               must have a journal (the built-in profiles use journal_mode=WAL).
+        :param float commit_seconds: (optional) Commit a merge (and record a
+               checkpoint) every commit_seconds seconds.
+        :param dict conflicts: (optional) The conflict policy of each (non-index)
+               column, one of csvblend.CONFLICTS (default: "last", the last
+               csvfile wins).
+        :param str latest: (optional) A (non-index) column ordering the
+               conflicting rows, such as a timestamp: a row only updates the merge
+               CSV when its latest value is not lower (implies bulk_load=False).
+        :param bool blend: (optional) Merge csvfiles with different columns: a
+               csvfile header only needs the indexes, its new columns are added to
+               the merge table, and its missing columns keep their current values
+               (NULL for a new row).
+        :param int cache_size: (optional) The number of keys kept in the LRU cache
+               of get_many() (and get() and contains()), which each merge clears.
+        :param DatabasePool pool: (optional) Take the (temporary) merge database
+               from a pool of the databases with the same merge plan, and return
+               it empty on cleanup() (implies bulk_load=False).
         """
         if sqlite3.sqlite_version_info < (3, 24, 0):
             raise Exception(
@@ -42,6 +382,72 @@ class MergeFiles(contextlib.AbstractContextManager):
             raise ValueError("columns contains duplicate items")
         if len(indexes) > len(set(indexes)):
             raise ValueError("indexes contains duplicate items")
+        if engine not in ENGINES:
+            raise ValueError(f"engine should be one of {', '.join(ENGINES)}")
+        if run_size < 1:
+            raise ValueError("run_size should be a positive number")
+        if progress_rows < 1:
+            raise ValueError("progress_rows should be a positive number")
+        types = types or {}
+        # With blend, the other columns can be added by a csvfile
+        if not (blend or set(types).issubset(columns)):
+            raise ValueError("types must be a subset of columns")
+        if not set(types.values()).issubset(TYPES):
+            raise ValueError(f"types should be in {', '.join(TYPES)}")
+        if track_changes and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support track_changes")
+        if persist and (not db or db == ":memory:"):
+            raise ValueError("persist requires a database file (db)")
+        if persist and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support persist")
+        if memory_limit is not None and db == ":memory:":
+            raise ValueError("memory_limit requires a database file (db) or none")
+        if memory_limit is not None and persist:
+            raise ValueError("memory_limit does not support persist")
+        if memory_limit is not None and memory_limit < 0:
+            raise ValueError("memory_limit should not be negative")
+        if (commit_rows or commit_seconds) and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support commit_rows")
+        if commit_rows is not None and commit_rows < 1:
+            raise ValueError("commit_rows should be a positive number")
+        if commit_seconds is not None and commit_seconds <= 0:
+            raise ValueError("commit_seconds should be a positive number")
+        if not isinstance(tuning, Tuning):
+            pragmas = {}
+            if commit_rows or commit_seconds:
+                # A merge committed in parts needs a journal, without one the
+                # pages written before a commit can not be rolled back
+                pragmas = {"journal_mode": "WAL", "synchronous": "NORMAL"}
+            tuning = Tuning.from_profile(tuning or "default", **pragmas)
+        journal_mode = str(tuning._pragmas["journal_mode"]).upper()
+        if (commit_rows or commit_seconds) and journal_mode in ("OFF", "MEMORY"):
+            raise ValueError("commit_rows requires a journal (journal_mode)")
+        conflicts = conflicts or {}
+        if set(conflicts) & set(indexes) or not (
+            blend or set(conflicts) <= set(columns)
+        ):
+            raise ValueError("conflicts must be a subset of the non-index columns")
+        if not set(conflicts.values()).issubset(csvblend.CONFLICTS):
+            raise ValueError(f"conflicts should be in {', '.join(csvblend.CONFLICTS)}")
+        if latest is not None and (
+            latest in indexes or not (blend or latest in columns)
+        ):
+            raise ValueError("latest should be a non-index column")
+        if (conflicts or latest) and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support conflicts")
+        if blend and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support blend")
+        if blend and persist:
+            raise ValueError("blend does not support persist")
+        if cache_size < 0:
+            raise ValueError("cache_size should not be negative")
+        if pool is not None and (db or persist or memory_limit is not None or blend):
+            raise ValueError(
+                "pool requires a temporary database (no db, persist, memory_limit "
+                "or blend)"
+            )
+        if pool is not None and engine in RUN_ENGINES:
+            raise ValueError(f"engine '{engine}' does not support pool")
         # The number of rows affected by merge() (created or updated). This is not the
         # same as the number of rows in the merge table
         self.affected_count = 0
@@ -60,75 +466,2166 @@ class MergeFiles(contextlib.AbstractContextManager):
         self._table = "merge_table"
         # The number of times merge() has succeeded
         self._merge_count = 0
+        # True if the first merge() skips the UNIQUE constraint, otherwise False
+        self._bulk_load = (
+            bulk_load and not without_rowid and latest is None and pool is None
+        )
+        # True if the merge table has its UNIQUE constraint, otherwise False
+        self._indexed = False
+        # The effective database PRAGMAs (Tuning.PRAGMAS), once created
+        self.pragmas = {}
+        # The merge() engine
+        self._engine = engine
+        # The merge run file (sorted by indexes) of the RUN_ENGINES
+        self._run = None
+        # The number of rows sorted in memory at once by the "external" engine
+        self._run_size = run_size
+        # The database tuning
+        self._tuning = tuning
+        # True if the merge table has a change log, otherwise False
+        self._track_changes = track_changes
+        # True if the database file is kept on cleanup(), otherwise False
+        self._persist = persist
+        # The declared type, and the csv value converter of each column
+        self._types = [TYPES[types.get(i, "text")][0] for i in columns]
+        self._converters = [TYPES[types.get(i, "text")][1] for i in columns]
+        # True if the merge table is a WITHOUT ROWID table, otherwise False
+        self._without_rowid = without_rowid
+        # The statistics of the last merge (a merge(), merge_path() or
+        # merge_many() call), once merged
+        self.last_merge_stats = None
+        # The statistics of the current merge, while merging
+        self._stats = None
+        # The metrics and progress callbacks
+        self._metrics = metrics
+        self._progress = progress
+        self._progress_rows = progress_rows
+        # The size of the in-memory merge database before it is moved to disk
+        self._memory_limit = memory_limit
+        # True if the merge database is in memory until memory_limit, otherwise
+        # False
+        self._in_memory = False
+        # The number of rows merged between memory_limit checks
+        self._check_rows = 100000
+        # The number of rows, and seconds, between the commits of a merge
+        self._commit_rows = commit_rows
+        self._commit_seconds = commit_seconds
+        # The conflict policy of each column (bindings), and the column ordering
+        # the conflicting rows
+        self._conflicts = {utils.hash_function(i): j for i, j in conflicts.items()}
+        self._latest = latest and utils.hash_function(latest)
+        # True if the csvfiles can have different columns, otherwise False
+        self._blend = blend
+        # The type of each column, including the columns added by blend
+        self._column_types = types
+        # The rows (or None) of the keys looked up since the last merge
+        self._cache = utils.LRUCache(cache_size) if cache_size else None
+        # The database pool, and the merge plan (the schema and PRAGMAs) of its
+        # databases
+        self._pool = pool
+        self._plan = (
+            tuple(self._columns),
+            tuple(self._indexes),
+            tuple(self._types),
+            without_rowid,
+            track_changes,
+            engine == "staging",
+            tuple(sorted(self._tuning._pragmas.items())),
+            self._tuning.memory_fraction,
+        )
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Exit the runtime context."""
         self.cleanup()
 
-    def merge(self, csvfile):
+    def merge(self, csvfile, where=None):
         """Merge a csvfile into the merge CSV.
 
         :param object csvfile: Can be any object that returns a line of input
                for each iteration, such as a file object or a list.
+        :param dict where: (optional) Only merge the rows matching the filter (see
+               rows()). The other rows are dropped as they are read.
+        """
+        conditions = self._conditions(where)
+        self._open()
+        start = utils.byte_position(csvfile)
+        with self._measure() as stats:
+            self._merge_reader(csv.reader(csvfile), conditions)
+            end = utils.byte_position(csvfile)
+            if start is not None and end is not None:
+                stats.bytes_read = end - start
+
+    def _merge_reader(self, reader, conditions, source=None):
+        """Merge the records of a csv reader into the merge table.
+
+        :param object reader: The csv reader, header first.
+        :param list conditions: The row filter (see _conditions()).
+        :param _Source source: (optional) The csvfile of the checkpoints.
         """
+        fieldnames = next(reader, [])
+        if self._blend:
+            self._add_columns(fieldnames)
+        positions = self._positions(fieldnames)
+        values = utils.project_rows(reader, positions)
+        values = utils.convert_rows(values, self._converters)
+        values = utils.filter_rows(values, conditions)
+        # The values are counted before the checkpoints are added
+        values = self._checkpoints(self._measure_values(values), source)
+        absent = self._absent(positions, fieldnames)
+        self._merge_values(values, absent)
+
+    def merge_path(self, path, encoding="utf-8", where=None):
+        """Merge a csvfile (path) into the merge CSV, unless it was merged before.
+
+        gzip, bz2, xz and zstd (with the zstandard package) compressed csvfiles
+        are detected by their magic bytes, and decompressed as they are read.
+
+        With a persisted database (persist), the merged csvfiles are recorded in
+        the manifest of the merge database, by path, size and checksum (SHA-256),
+        so each run only merges the new csvfiles. A temporary database keeps no
+        manifest, and the csvfile is not read to compute its checksum.
+
+        With persist and commit_rows or commit_seconds, each commit records a
+        checkpoint (the position after the last record merged). An interrupted
+        merge is resumed from its checkpoint by the next merge_path() of the
+        csvfile. The csvfile must use an ASCII compatible encoding.
+
+        A filtered merge (where) only merges part of the csvfile, so it is neither
+        recorded in the manifest nor checkpointed, and is never skipped.
+
+        :param str path: The csvfile path.
+        :param str encoding: (optional) The csvfile encoding.
+        :param dict where: (optional) Only merge the rows matching the filter (see
+               rows()).
+        :return: True if the csvfile was merged, False if it was skipped.
+        :rtype: bool
+        """
+        self._conditions(where)
+        self._open()
+        if not self._persist or where:
+            # A filtered merge is not the merge of the whole csvfile
+            with utils.open_csvfile(path, encoding) as fp:
+                self.merge(fp, where)
+            return True
+        csvfiles, error = self._new_csvfiles([path])
+        if error:
+            raise error
+        if not csvfiles:
+            return False
+        path, size, sha256 = csvfiles[0]
+        if self._commit_rows or self._commit_seconds:
+            self._resume_path(path, size, sha256, encoding)
+        else:
+            with utils.open_csvfile(path, encoding) as fp:
+                self.merge(fp, where)
+        self._record_csvfile(path, size, sha256)
+        return True
+
+    def _new_csvfiles(self, paths):
+        """Find the csvfiles (paths) not recorded in the manifest.
+
+        A csvfile listed twice is only merged once. The search stops at the first
+        csvfile that can not be read, and returns its exception.
+
+        :param list paths: The csvfile paths.
+        :return: The (absolute path, size, checksum) of each new csvfile, in
+                 order, and the exception (or None).
+        :rtype: tuple
+        """
+        csvfiles = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                size = os.path.getsize(path)
+                sha256 = utils.checksum_file(path)
+            except OSError as e:
+                return csvfiles, e
+            cursor = csvblend.select_manifest(
+                self._connection, self._table, path, size, sha256
+            )
+            if cursor.fetchone() or (path, size, sha256) in csvfiles:
+                logger.info("Skipped csvfile '%s' (already merged)", path)
+                continue
+            csvfiles.append((path, size, sha256))
+        return csvfiles, None
+
+    def _record_csvfile(self, path, size, sha256):
+        """Record a merged csvfile in the manifest, and commit the merge.
+
+        :param str path: The csvfile (absolute) path.
+        :param int size: The csvfile size, in bytes.
+        :param str sha256: The csvfile checksum.
+        """
+        csvblend.delete_checkpoint(self._connection, self._table, path)
+        csvblend.insert_manifest(
+            self._connection, self._table, path, size, sha256, self._merge_count
+        )
+        self._connection.commit()
+
+    def _resume_path(self, path, size, sha256, encoding):
+        """Merge a csvfile (path) from its checkpoint, recording new checkpoints.
+
+        :param str path: The csvfile path.
+        :param int size: The csvfile size, in bytes.
+        :param str sha256: The csvfile checksum.
+        :param str encoding: The csvfile encoding.
+        """
+        cursor = csvblend.select_checkpoint(
+            self._connection, self._table, path, size, sha256
+        )
+        offset, rows = cursor.fetchone() or (None, 0)
+        if offset:
+            logger.info("Resuming csvfile '%s' after %s rows", path, rows)
+        with utils.open_binary(path) as fp, self._measure() as stats:
+            source = _Source(path, size, sha256, fp, rows)
+            reader = csv.reader(utils.read_lines(fp, encoding, offset))
+            self._merge_reader(reader, [], source)
+            stats.bytes_read = fp.tell() - (offset or 0)
+
+    def merge_many(
+        self, paths, workers=None, encoding="utf-8", chunk_size=1 << 23, where=None
+    ):
+        """Merge csvfiles (paths) into the merge CSV, in order.
+
+        The csvfiles are split into chunks of whole records, and parsed by a
+        process pool. The chunks are merged by the calling thread, in order, so the
+        result is the same as calling merge() on each csvfile. The csvfiles must
+        use "\\n" line endings, and an ASCII compatible encoding.
+
+        With a persisted database (persist), the csvfiles are skipped and recorded
+        in the manifest as by merge_path(), and each csvfile is committed once
+        merged. The checkpoints of commit_rows are not recorded: an interrupted
+        csvfile is merged again from its first row. A filtered merge (where) uses
+        no manifest.
+
+        :param list paths: The csvfile paths.
+        :param int workers: (optional) The number of parser processes (default:
+               the number of CPUs).
+        :param str encoding: (optional) The csvfiles encoding.
+        :param int chunk_size: (optional) The approximate chunk size, in bytes.
+        :param dict where: (optional) Only merge the rows matching the filter (see
+               rows()). The other rows are dropped by the parser processes.
+        """
+        conditions = self._conditions(where)
+        self._open()
+        csvfiles = error = None
+        if self._persist and not where:
+            csvfiles, error = self._new_csvfiles(paths)
+            paths = [i[0] for i in csvfiles]
+        if self._blend:
+            # The columns are added before the merge, not during a statement
+            for path in paths:
+                with contextlib.suppress(OSError, ValueError, EOFError):
+                    with utils.open_csvfile(path, encoding) as fp:
+                        self._add_columns(next(csv.reader(fp), []))
+        if self._engine not in RUN_ENGINES:
+            self._pool_merge_many(
+                paths, workers, encoding, chunk_size, conditions, csvfiles
+            )
+            if error:
+                raise error
+            return
+        # The csvfiles are merged in one pass, and measured as one merge
+        with self._measure() as stats:
+            if self._engine == "sorted":
+                merged, error = self._sorted_merge_many(paths, encoding, conditions)
+                if self._engine != "sorted":
+                    # Fell back to "upsert" before merging the csvfiles
+                    stats.rows_read = 0
+                    self._pool_merge_many(
+                        paths, workers, encoding, chunk_size, conditions
+                    )
+                    return
+            else:
+                with contextlib.ExitStack() as stack:
+                    sources, error = self._open_csvfiles(
+                        stack, paths, encoding, conditions
+                    )
+                    self._external_merge(sources)
+                merged = len(sources)
+            stats.bytes_read = sum(os.path.getsize(i) for i in paths[:merged])
+        if error:
+            raise error
+
+    def _pool_merge_many(
+        self, paths, workers, encoding, chunk_size, conditions, csvfiles=None
+    ):
+        """Merge csvfiles (paths) into the merge table, with a process pool.
+
+        Each csvfile is measured as a merge of its own (unless the merge_many()
+        call is measured as a whole).
+
+        :param list paths: The csvfile paths.
+        :param int workers: The number of parser processes (or None).
+        :param str encoding: The csvfiles encoding.
+        :param int chunk_size: The approximate chunk size, in bytes.
+        :param list conditions: The row filter (see _conditions()).
+        :param list csvfiles: (optional) The (path, size, checksum) of each
+               csvfile, to record in the manifest once merged.
+        """
+        workers = workers or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            tasks = self._submit_chunks(
+                executor, paths, encoding, chunk_size, conditions
+            )
+            # Bound the number of parsed chunks waiting on the writer
+            tasks = utils.read_ahead(tasks, workers * 2)
+            for i, task in enumerate(tasks):
+                if isinstance(task, Exception):
+                    raise task
+                size, absent = task
+                with self._measure() as stats:
+                    values = self._measure_values(self._chunk_values(tasks))
+                    values = self._checkpoints(values)
+                    self._merge_values(values, absent)
+                    stats.bytes_read = (stats.bytes_read or 0) + size
+                if csvfiles:
+                    self._record_csvfile(*csvfiles[i])
+
+    def _submit_chunks(self, executor, paths, encoding, chunk_size, conditions):
+        """Submit the csvfile chunks to a process pool.
+
+        Yields the csvfile size and missing columns (see _absent()), or the header
+        exception, followed by a future for each chunk, and None at the end of
+        each csvfile. A compressed csvfile can not be split, it is read by the
+        calling process (a single future).
+
+        :rtype: object
+        """
+        for path in paths:
+            chunks = []
+            try:
+                if utils.detect_compression(path):
+                    with utils.open_csvfile(path, encoding) as fp:
+                        fieldnames = next(csv.reader(fp), [])
+                else:
+                    header, *chunks = utils.split_csv(path, chunk_size)
+                    fieldnames = utils.read_csv_chunk(path, *header, None, encoding)
+                positions = self._positions(fieldnames)
+            except (OSError, ValueError, EOFError) as e:
+                yield e
+                return
+            yield os.path.getsize(path), self._absent(positions, fieldnames)
+            if not chunks:
+                future = concurrent.futures.Future()
+                future.set_result(self._read_csvfile(path, encoding, conditions))
+                yield future
+            for start, end in chunks:
+                yield executor.submit(
+                    utils.read_csv_chunk,
+                    path,
+                    start,
+                    end,
+                    positions,
+                    encoding,
+                    self._converters,
+                    conditions,
+                )
+            yield None
+
+    def _read_csvfile(self, path, encoding, conditions):
+        """Read the values of a (compressed) csvfile.
+
+        :param str path: The csvfile path.
+        :param str encoding: The csvfile encoding.
+        :param list conditions: The row filter (see _conditions()).
+        :rtype: tuple
+        """
+        with utils.open_csvfile(path, encoding) as fp:
+            reader = csv.reader(fp)
+            positions = self._positions(next(reader, []))
+            values = utils.project_rows(reader, positions)
+            values = utils.convert_rows(values, self._converters)
+            yield from utils.filter_rows(values, conditions)
+
+    def _chunk_values(self, tasks):
+        """Consume the parsed chunks of a csvfile from the merge_many() tasks.
+
+        :param iter tasks: The submitted tasks.
+        :rtype: tuple
+        """
+        for future in tasks:
+            if future is None:
+                return
+            yield from future.result()
+
+    def _open(self):
+        """Open the merge database, and create the merge table."""
         if self.closed:
             raise ValueError("Operation on closed MergeFile")
-        if not self._connection:
+        if self._connection or self._run:
+            return
+        if self._engine in RUN_ENGINES:
+            self._run = os.path.join(tempfile.mkdtemp(), "merge_files.run")
+            sorting.write_run(self._run, [])
+            return
+        if self._pool is not None:
+            pooled = self._pool._acquire(self._plan)
+            if pooled:
+                self._connection, self._db, self.pragmas = pooled
+                self._indexed = True
+                logger.debug("Reused a merge database with %s", self.pragmas)
+                return
+        self._in_memory = self._memory_limit is not None
+        if self._in_memory:
+            # The database file is created by _spill(), if ever
+            database = ":memory:"
+        else:
             if not self._db:
                 self._db = os.path.join(tempfile.mkdtemp(), "merge_files.db")
-            self._connection = csvblend.create_database(self._db)
+            database = self._db
+        # A pooled connection can be taken by an instance in another thread
+        self._connection = csvblend.create_database(
+            database, self._tuning.pragmas(), check_same_thread=self._pool is None
+        )
+        if self._persist and csvblend.select_columns(self._connection, self._table):
+            try:
+                self._open_table()
+            except ValueError:
+                self._connection.close()
+                self._connection = None
+                raise
+        else:
             csvblend.create_table(
-                self._connection, self._table, list(self._columns), list(self._indexes)
+                self._connection,
+                self._table,
+                list(self._columns),
+                list(self._indexes),
+                unique=not self._bulk_load,
+                types=self._types,
+                without_rowid=self._without_rowid,
             )
+            self._indexed = not self._bulk_load
+            if self._track_changes:
+                csvblend.create_changes(
+                    self._connection, self._table, self._log_indexes()
+                )
+        csvblend.create_manifest(self._connection, self._table)
+        csvblend.create_checkpoint(self._connection, self._table)
+        if self._without_rowid:
+            csvblend.create_counter(self._connection, self._table)
+        if self._engine == "staging":
+            csvblend.create_staging(self._connection, self._table, list(self._columns))
+        self.pragmas = csvblend.select_pragmas(self._connection, Tuning.PRAGMAS)
+        logger.debug("Created the merge database with %s", self.pragmas)
+
+    def _open_table(self):
+        """Check the merge table of a persisted database, and load its state."""
+        columns = csvblend.select_columns(self._connection, self._table)
+        if set(columns) != set(self._columns):
+            raise ValueError("merge database columns do not match columns")
+        if [columns[i] for i in self._columns] != self._types:
+            raise ValueError("merge database types do not match types")
+        without_rowid = csvblend.select_without_rowid(self._connection, self._table)
+        if without_rowid != self._without_rowid:
+            raise ValueError("merge database without_rowid does not match")
+        indexes = csvblend.select_unique_indexes(self._connection, self._table)
+        if indexes and set(self._indexes) not in [set(i) for i in indexes]:
+            raise ValueError("merge database indexes do not match indexes")
+        # A database closed before its first merge() has no index yet
+        self._indexed = bool(indexes)
+        if csvblend.select_columns(self._connection, f"{self._table}_changes"):
+            # The triggers record the changes regardless, keep the sequence
+            self._track_changes = True
+        elif self._track_changes:
+            csvblend.create_changes(self._connection, self._table, self._log_indexes())
+        self._merge_count = csvblend.select_merge_count(self._connection)
+        cursor = csvblend.select_count(self._connection, self._table)
+        self.rowcount = cursor.fetchone()[0]
+        logger.debug("Opened the merge table after %s merges", self._merge_count)
+
+    def _merge_values(self, values, absent=()):
+        """Merge the values of a csvfile into the merge table.
+
+        :param iter values: The csvfile values, in column order.
+        :param list absent: (optional) The columns missing from the csvfile (see
+               _absent()), their current values are kept.
+        """
+        if self._engine == "sorted":
+            self._sorted_merge(values)
+            return
+        if self._engine == "external":
+            self._external_merge([values])
+            return
         start_time = timeit.default_timer()
-        reader = csv.DictReader(csvfile)
-        # Hash the csvfile columns to match the (hashed) instance columns
-        reader.fieldnames = [utils.hash_function(i) for i in reader.fieldnames]
-        if not set(self._columns).issubset(reader.fieldnames):
-            raise ValueError("fieldnames (csv header) must be a subset of columns")
-        cursor = csvblend.insert_values(
-            self._connection,
-            self._table,
-            list(self._columns),
-            list(self._indexes),
-            reader,
-        )
+        if self._cache is not None:
+            self._cache.clear()
+        indexed = self._indexed
+        last_insert = self._last_insert()
+        if self._track_changes:
+            csvblend.update_sequence(
+                self._connection, self._table, self._merge_count + 1
+            )
+        conflicts = self._conflicts
+        if absent:
+            conflicts = {**conflicts, **dict.fromkeys(absent, "first")}
+        affected_count = 0
+        for segment in self._segments(values):
+            if not indexed:
+                cursor = csvblend.load_values(
+                    self._connection, self._table, list(self._columns), segment
+                )
+            elif self._engine == "staging":
+                cursor = self._staging_merge(segment, conflicts)
+            else:
+                cursor = csvblend.insert_values(
+                    self._connection,
+                    self._table,
+                    list(self._columns),
+                    list(self._indexes),
+                    segment,
+                    conflicts,
+                    self._latest,
+                )
+            affected_count += cursor.rowcount
+        if not indexed:
+            self._create_index(conflicts)
+        csvblend.update_merge_count(self._connection, self._merge_count + 1)
+        commit_time = timeit.default_timer()
         self._connection.commit()
         merge_time = timeit.default_timer()
         total_time = merge_time - start_time
         logger.debug("Merged csvfile in %ss", f"{total_time:.05f}")
+        if self._in_memory:
+            self._spill()
         # affected_count is tracked relative to the first call to merge()
         if self._merge_count != 0:
-            self.affected_count += cursor.rowcount
+            self.affected_count += affected_count
         self._merge_count += 1
-        cursor = csvblend.select_count(self._connection, self._table)
-        self.rowcount = cursor.fetchone()[0]
+        if indexed and self._without_rowid:
+            self.rowcount += self._last_insert() - last_insert
+        elif indexed:
+            # Only count the inserted rows, so a merge costs as much as its rows
+            cursor = csvblend.select_count(self._connection, self._table, last_insert)
+            self.rowcount += cursor.fetchone()[0]
+        else:
+            cursor = csvblend.select_count(self._connection, self._table)
+            self.rowcount = cursor.fetchone()[0]
+        if self._stats:
+            self._stats.commit_time += merge_time - commit_time
+            self._stats.count_time += timeit.default_timer() - merge_time
+
+    def _measure_values(self, values):
+        """Count the values of the current merge, and time their reading.
+
+        The values are read in chunks, so the timer is not called for each row.
+
+        :param iter values: The csvfile values.
+        :rtype: tuple
+        """
+        stats = self._stats
+        if stats is None:
+            return values
+        return self._measured_values(iter(values), stats)
+
+    def _measured_values(self, values, stats):
+        """Iterate over the values of the current merge (see _measure_values()).
+
+        :param iter values: The csvfile values.
+        :param MergeStats stats: The statistics of the current merge.
+        :rtype: tuple
+        """
+        every = self._progress_rows
+        chunk_size = min(every, 1024)
+        if self._commit_rows or self._commit_seconds:
+            # The checkpoints are every commit_rows rows, or a multiple of 1024
+            # rows (see _checkpoints()), so the chunks end at the checkpoints and
+            # the file position of a checkpoint is not past its rows
+            chunk_size = math.gcd(chunk_size, self._commit_rows or 1024, 1024)
+        while True:
+            start_time = timeit.default_timer()
+            chunk = list(itertools.islice(values, chunk_size))
+            stats.parse_time += timeit.default_timer() - start_time
+            if not chunk:
+                return
+            rows_read = stats.rows_read
+            stats.rows_read += len(chunk)
+            if self._progress and stats.rows_read // every > rows_read // every:
+                self._progress(stats)
+            yield from chunk
+
+    @contextlib.contextmanager
+    def _measure(self):
+        """Measure a merge, and publish its statistics (see last_merge_stats).
+
+        A merge measured inside another merge is part of it.
+
+        :rtype: MergeStats
+        """
+        if self._stats is not None:
+            yield self._stats
+            return
+        stats = self._stats = MergeStats()
+        rowcount = self.rowcount
+        affected_count = self.affected_count
+        merge_count = self._merge_count
+        size = self._size()
+        start_time = timeit.default_timer()
+        try:
+            yield stats
+        finally:
+            self._stats = None
+        stats.total_time = timeit.default_timer() - start_time
+        stats.insert_time = max(
+            stats.total_time - stats.parse_time - stats.commit_time - stats.count_time,
+            0.0,
+        )
+        stats.inserted = self.rowcount - rowcount
+        if merge_count:
+            stats.updated = max(
+                self.affected_count - affected_count - stats.inserted, 0
+            )
+        stats.unchanged = max(stats.rows_read - stats.inserted - stats.updated, 0)
+        stats.size_growth = self._size() - size
+        self.last_merge_stats = stats
+        logger.debug("Merge statistics: %s", stats)
+        if self._metrics:
+            self._metrics(stats)
+
+    def _size(self):
+        """Return the size of the merge database (or run), in bytes.
+
+        :rtype: int
+        """
+        if self._connection:
+            return csvblend.select_size(self._connection)
+        if self._run and os.path.exists(self._run):
+            return os.path.getsize(self._run)
+        return 0
+
+    def _last_insert(self):
+        """Return the position of the last row inserted into the merge table.
+
+        The position is the rowid, or the number of rows inserted into a WITHOUT
+        ROWID table (see csvblend.create_counter()).
+
+        :rtype: int
+        """
+        if self._without_rowid:
+            cursor = csvblend.select_counter(self._connection, self._table)
+        else:
+            cursor = csvblend.select_rowid(self._connection, self._table)
+        return cursor.fetchone()[0]
+
+    def _log_indexes(self):
+        """Return the indexes recorded by the change log instead of the rowid.
+
+        :return: The table indexes for a WITHOUT ROWID table, otherwise None.
+        :rtype: list
+        """
+        return list(self._indexes) if self._without_rowid else None
+
+    def _positions(self, fieldnames):
+        """Map the instance columns to their csvfile (header) positions.
+
+        With blend, a missing column is mapped past the end of the header, so its
+        values are None (see utils.project_rows()).
+
+        :param list fieldnames: The csvfile header.
+        :rtype: list[int]
+        """
+        # The last position wins for duplicate fieldnames (as with csv.DictReader)
+        header = {name: position for position, name in enumerate(fieldnames)}
+        if self._blend:
+            if not set(self._indexes.values()).issubset(header):
+                raise ValueError("fieldnames (csv header) must contain the indexes")
+            return [header.get(i, len(fieldnames)) for i in self._columns.values()]
+        if not set(self._columns.values()).issubset(header):
+            raise ValueError("fieldnames (csv header) must be a subset of columns")
+        return [header[i] for i in self._columns.values()]
+
+    def _absent(self, positions, fieldnames):
+        """Return the columns missing from a csvfile (see _positions()).
+
+        :param list positions: The csvfile positions of the columns.
+        :param list fieldnames: The csvfile header.
+        :rtype: list
+        """
+        return [i for i, j in zip(self._columns, positions) if j >= len(fieldnames)]
+
+    def _add_columns(self, fieldnames):
+        """Add the new columns of a csvfile header to the merge table (blend).
+
+        :param list fieldnames: The csvfile header.
+        """
+        for name in dict.fromkeys(fieldnames):
+            column = utils.hash_function(name)
+            if column in self._columns:
+                continue
+            type_, converter = TYPES[self._column_types.get(name, "text")]
+            csvblend.add_column(self._connection, self._table, column, type_)
+            if self._engine == "staging":
+                csvblend.add_column(
+                    self._connection, f"temp.{self._table}_staging", column
+                )
+            self._columns[column] = name
+            self._types.append(type_)
+            self._converters.append(converter)
+            logger.info("Added column '%s' to the merge table", name)
+
+    def _key(self):
+        """Return a callable that fetches the indexes of a row (in column order).
+
+        :rtype: callable
+        """
+        columns = list(self._columns)
+        return utils.itemgetter([columns.index(i) for i in self._indexes])
+
+    def _sorted_merge(self, values):
+        """Merge the (sorted) values of a csvfile into the merge run.
+
+        :param iter values: The csvfile values, in column order.
+        """
+        start_time = timeit.default_timer()
+        merge = sorting.SortedMerge(
+            [sorting.read_run(self._run), values],
+            self._key(),
+            [False, self._merge_count != 0],
+        )
+        run = f"{self._run}.new"
+        sorting.write_run(run, merge)
+        if merge.unsorted is not None:
+            # The merged rows and the rest of the merge run do not overlap, and
+            # the rest of the csvfile applies after both
+            base = self._sorted_fallback(
+                itertools.chain(sorting.read_run(run), merge.rest(0))
+            )
+            utils.remove_files([run, base])
+            if self._merge_count != 0:
+                self.affected_count += merge.affected_count
+            self._merge_values(merge.rest(1))
+            return
+        os.replace(run, self._run)
+        merge_time = timeit.default_timer()
+        total_time = merge_time - start_time
+        logger.debug("Merged csvfile in %ss", f"{total_time:.05f}")
+        self.affected_count += merge.affected_count
+        self.rowcount = merge.rowcount
+        self._merge_count += 1
+
+    def _sorted_merge_many(self, paths, encoding, conditions):
+        """Merge (sorted) csvfiles into the merge run, with a k-way merge.
+
+        The csvfiles before an invalid csvfile are merged, see _open_csvfiles().
+
+        :param list paths: The csvfile paths.
+        :param str encoding: The csvfiles encoding.
+        :param list conditions: The row filter (see _conditions()).
+        :return: The number of csvfiles merged, and the exception (or None).
+        :rtype: tuple
+        """
+        start_time = timeit.default_timer()
+        with contextlib.ExitStack() as stack:
+            sources, error = self._open_csvfiles(stack, paths, encoding, conditions)
+            streams = [sorting.read_run(self._run), *sources]
+            counted = [False] + [self._merge_count + i != 0 for i in range(len(paths))]
+            merge = sorting.SortedMerge(streams, self._key(), counted)
+            run = f"{self._run}.new"
+            sorting.write_run(run, merge)
+        if merge.unsorted is not None:
+            base = self._sorted_fallback(sorting.read_run(self._run))
+            utils.remove_files([run, base])
+            # The caller merges the csvfiles with the fallback engine
+            return 0, None
+        os.replace(run, self._run)
+        merge_time = timeit.default_timer()
+        total_time = merge_time - start_time
+        logger.debug("Merged csvfiles in %ss", f"{total_time:.05f}")
+        self.affected_count += merge.affected_count
+        self.rowcount = merge.rowcount
+        self._merge_count += len(sources)
+        return len(sources), error
+
+    def _open_csvfiles(self, stack, paths, encoding, conditions):
+        """Open csvfiles (paths), and read their headers.
+
+        The csvfiles before an invalid csvfile are merged, as with merge(), so the
+        exception is returned rather than raised.
+
+        :param contextlib.ExitStack stack: The csvfiles context.
+        :param list paths: The csvfile paths.
+        :param str encoding: The csvfiles encoding.
+        :param list conditions: The row filter (see _conditions()).
+        :return: The values of the valid csvfiles, and the exception (or None).
+        :rtype: tuple
+        """
+        sources = []
+        for path in paths:
+            try:
+                fp = stack.enter_context(utils.open_csvfile(path, encoding))
+                reader = csv.reader(fp)
+                positions = self._positions(next(reader, []))
+            except (OSError, ValueError) as e:
+                return sources, e
+            values = utils.project_rows(reader, positions)
+            values = utils.convert_rows(values, self._converters)
+            values = utils.filter_rows(values, conditions)
+            sources.append(self._measure_values(values))
+        return sources, None
+
+    def _external_merge(self, sources):
+        """Merge csvfiles into the merge run, with an external sort.
+
+        Each csvfile is sorted into runs on disk, then the merge run and all the
+        runs are merged in one pass.
+
+        :param list sources: The values of each csvfile, in column order.
+        """
+        start_time = timeit.default_timer()
+        key = self._key()
+        directory = os.path.dirname(self._run)
+        runs = [sorting.spill_runs(i, key, directory, self._run_size) for i in sources]
+        streams = [sorting.read_run(self._run)]
+        counted = [False]
+        for i, csvfile_runs in enumerate(runs):
+            streams += [sorting.read_run(j) for j in csvfile_runs]
+            counted += [self._merge_count + i != 0] * len(csvfile_runs)
+        merge = sorting.SortedMerge(streams, key, counted)
+        run = f"{self._run}.new"
+        sorting.write_run(run, merge)
+        spilled = [j for i in runs for j in i]
+        if merge.unsorted is not None:
+            # A NULL index: merge the runs with the fallback engine. The order of
+            # the rows of different indexes does not change the result
+            base = self._sorted_fallback(sorting.read_run(self._run))
+            for csvfile_runs in runs:
+                self._merge_values(
+                    itertools.chain.from_iterable(
+                        sorting.read_run(i) for i in csvfile_runs
+                    )
+                )
+            utils.remove_files([run, base, *spilled])
+            return
+        os.replace(run, self._run)
+        utils.remove_files(spilled)
+        merge_time = timeit.default_timer()
+        total_time = merge_time - start_time
+        logger.debug("Merged csvfiles in %ss", f"{total_time:.05f}")
+        self.affected_count += merge.affected_count
+        self.rowcount = merge.rowcount
+        self._merge_count += len(sources)
+
+    def _sorted_fallback(self, values):
+        """Switch a run engine to "upsert", and load the merge table.
+
+        :param iter values: The merge table values (unique and sorted).
+        :return: The merge run file, to remove.
+        :rtype: str
+        """
+        logger.info("Found an unsorted row, falling back to the upsert engine")
+        run = self._run
+        self._engine = "upsert"
+        self._run = None
+        self._open()
+        # Loading the merge table is not a merge() of its own
+        merge_count = self._merge_count
+        affected_count = self.affected_count
+        self._merge_count = 0
+        self._merge_values(values)
+        self._merge_count = merge_count
+        self.affected_count = affected_count
+        return run
+
+    def _create_index(self, conflicts):
+        """Create the index of the (bulk loaded) merge table.
+
+        :param dict conflicts: The conflict policy of each column.
+        """
+        # Resolve duplicate indexes in one pass. A failing CREATE UNIQUE INDEX can
+        # not be rolled back safely with the rollback journal disabled
+        csvblend.dedupe_values(
+            self._connection,
+            self._table,
+            list(self._columns),
+            list(self._indexes),
+            conflicts,
+        )
+        csvblend.create_index(self._connection, self._table, list(self._indexes))
+        self._indexed = True
+
+    def _segments(self, values):
+        """Split the values of a merge into segments.
+
+        A segment ends at each checkpoint (see _checkpoints()), which is committed,
+        and every _check_rows rows while the database is in memory, after which
+        its size is checked (see _spill()). Otherwise, the rest of the values are a
+        single segment.
+
+        :param iter values: The csvfile values, in column order.
+        :rtype: iter
+        """
+        values = iter(values)
+        checkpoints = self._commit_rows or self._commit_seconds
+        while checkpoints or self._in_memory:
+            # The values are tuples, never None
+            first = next(values, None)
+            if first is None:
+                return
+            if isinstance(first, _Checkpoint):
+                self._checkpoint(first)
+                continue
+            if not checkpoints:
+                yield itertools.chain(
+                    [first], itertools.islice(values, self._check_rows - 1)
+                )
+                self._spill()
+                continue
+            checkpoint = []
+            yield self._segment(first, values, checkpoint)
+            if checkpoint:
+                self._checkpoint(checkpoint[0])
+            if self._in_memory:
+                self._spill()
+        yield values
+
+    def _segment(self, first, values, checkpoint):
+        """Iterate over the values of a merge, up to the next checkpoint.
+
+        :param tuple first: The first value.
+        :param iter values: The values, and the checkpoints.
+        :param list checkpoint: Receives the checkpoint, if any.
+        :rtype: tuple
+        """
+        yield first
+        for value in values:
+            if isinstance(value, _Checkpoint):
+                checkpoint.append(value)
+                return
+            yield value
+
+    def _checkpoints(self, values, source=None):
+        """Add a checkpoint to the values of a merge every commit_rows rows, or
+        commit_seconds seconds.
+
+        :param iter values: The csvfile values.
+        :param _Source source: (optional) The csvfile, to record the checkpoints
+               of.
+        :rtype: object
+        """
+        every = self._commit_rows
+        seconds = self._commit_seconds
+        if not every and not seconds:
+            yield from values
+            return
+        rows = source.rows if source else 0
+        count = 0
+        deadline = timeit.default_timer() + seconds if seconds else None
+        for value in values:
+            yield value
+            rows += 1
+            count += 1
+            due = every and count >= every
+            if not due and deadline and not count % 1024:
+                # The timer is read every 1024 rows
+                due = timeit.default_timer() >= deadline
+            if not due:
+                continue
+            # The file position is after the record of the last value
+            offset = source.fp.tell() if source else None
+            yield _Checkpoint(source, offset, rows)
+            count = 0
+            if seconds:
+                deadline = timeit.default_timer() + seconds
+
+    def _checkpoint(self, checkpoint):
+        """Commit the current merge, and record its checkpoint.
+
+        :param _Checkpoint checkpoint: The checkpoint.
+        """
+        source = checkpoint.source
+        if source:
+            csvblend.update_checkpoint(
+                self._connection,
+                self._table,
+                source.path,
+                source.size,
+                source.sha256,
+                checkpoint.offset,
+                checkpoint.rows,
+            )
+        self._connection.commit()
+        logger.debug("Committed the merge after %s rows", checkpoint.rows)
+
+    def _spill(self):
+        """Move the in-memory merge database to its file, once over memory_limit.
+
+        The database is copied with the backup API, and the temporary tables
+        (which are not copied) are created again.
+        """
+        size = csvblend.select_size(self._connection)
+        if size <= self._memory_limit:
+            return
+        # The backup waits on an open transaction
+        self._connection.commit()
+        if not self._db:
+            self._db = os.path.join(tempfile.mkdtemp(), "merge_files.db")
+        connection = csvblend.create_database(self._db, self._tuning.pragmas())
+        try:
+            self._connection.backup(connection)
+            if self._without_rowid:
+                count = self._last_insert()
+                csvblend.create_counter(connection, self._table, count)
+            if self._engine == "staging":
+                csvblend.create_staging(connection, self._table, list(self._columns))
+            connection.commit()
+        except BaseException:
+            connection.close()
+            raise
+        self._connection.close()
+        self._connection = connection
+        self._in_memory = False
+        self.pragmas = csvblend.select_pragmas(self._connection, Tuning.PRAGMAS)
+        logger.info("Moved the merge database (%s bytes) to '%s'", size, self._db)
+
+    def _staging_merge(self, values, conflicts):
+        """Load a csvfile into the staging table, and apply it to the merge table.
+
+        :param iter values: The csvfile values, in column order.
+        :param dict conflicts: The conflict policy of each column.
+        :rtype: sqlite3.Cursor
+        """
+        csvblend.load_values(
+            self._connection,
+            f"temp.{self._table}_staging",
+            list(self._columns),
+            values,
+        )
+        return csvblend.insert_staging(
+            self._connection,
+            self._table,
+            list(self._columns),
+            list(self._indexes),
+            conflicts,
+            self._latest,
+        )
 
-    def rows(self):
+    def rows(
+        self,
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+        limit=None,
+    ):
         """The returned object is an iterator.
 
         Each iteration returns a row of the merge CSV.
 
+        The filter (where) maps columns to the value, or the list of values, to
+        keep (None matches an empty typed value or a missing value). It is
+        compiled to SQL, and a filter on a prefix of the indexes searches the
+        UNIQUE index instead of scanning the merge table.
+
+        :param int batch_size: (optional) The number of rows fetched at once.
+        :param bool order_by_index: (optional) Return the rows in index order,
+               otherwise in merge order.
+        :param list columns: (optional) The columns of each row (default: all
+               the columns, in order).
+        :param dict where: (optional) Only return the rows matching the filter.
+        :param int limit: (optional) The maximum number of rows.
         :rtype: tuple
         """
+        batches = self.batches(batch_size, order_by_index, columns, where, limit)
+        for batch in batches:
+            yield from batch
+
+    def batches(
+        self,
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+        limit=None,
+    ):
+        """The returned object is an iterator.
+
+        Each iteration returns a list of (up to batch_size) rows of the merge CSV.
+
+        :param int batch_size: (optional) The number of rows in a batch.
+        :param bool order_by_index: (optional) Return the rows in index order,
+               otherwise in merge order. The RUN_ENGINES are always in index order.
+        :param list columns: (optional) The columns of each row (see rows()).
+        :param dict where: (optional) Only return the rows matching the filter
+               (see rows()).
+        :param int limit: (optional) The maximum number of rows.
+        :rtype: list[tuple]
+        """
         if self.closed:
             raise ValueError("Operation on closed MergeFile")
+        positions = self._projection(columns)
+        conditions = self._conditions(where)
+        if limit is not None and limit < 0:
+            raise ValueError("limit should not be negative")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number")
+        if self._run:
+            rows = utils.filter_rows(sorting.read_run(self._run), conditions)
+            rows = itertools.islice(rows, limit)
+            if positions != list(range(len(self._columns))):
+                rows = map(utils.itemgetter(positions), rows)
+            yield from utils.batched(rows, batch_size)
+            return
         if not self._connection:
             return
         cursor = csvblend.select_values(
-            self._connection, self._table, list(self._columns)
+            self._connection,
+            self._table,
+            self._table_columns(positions),
+            list(self._indexes) if order_by_index else None,
+            self._table_conditions(conditions),
+            limit,
         )
-        yield from cursor
+        yield from iter(lambda: cursor.fetchmany(batch_size), [])
+
+    def _projection(self, columns):
+        """Map the columns of a rows() projection to their positions.
+
+        :param list columns: The projected columns, or None for all the columns.
+        :rtype: list
+        """
+        names = list(self._columns.values())
+        if columns is None:
+            return list(range(len(names)))
+        if not columns or not set(columns).issubset(names):
+            raise ValueError("columns must be a non-empty subset of columns")
+        return [names.index(i) for i in columns]
+
+    def _conditions(self, where):
+        """Compile a row filter (see rows()) into (position, values) conditions.
+
+        The values of a typed column are converted as csv values are (see types),
+        so either form matches.
+
+        :param dict where: The values to keep of each column, or None.
+        :rtype: list[tuple]
+        """
+        if not where:
+            return []
+        names = list(self._columns.values())
+        if not set(where).issubset(names):
+            raise ValueError("where must be a subset of columns")
+        conditions = []
+        for name, values in where.items():
+            if not isinstance(values, (list, tuple, set, frozenset)):
+                values = [values]
+            position = names.index(name)
+            converter = self._converters[position]
+            if converter:
+                values = [converter(i) if isinstance(i, str) else i for i in values]
+            conditions.append((position, frozenset(values)))
+        return conditions
+
+    def _table_columns(self, positions):
+        """Return the database columns of a list of positions.
+
+        :param list positions: The column positions.
+        :rtype: list
+        """
+        columns = list(self._columns)
+        return [columns[i] for i in positions]
+
+    def _table_conditions(self, conditions):
+        """Return the database (column, values) conditions of a row filter.
+
+        :param list conditions: The (position, values) conditions.
+        :rtype: list[tuple]
+        """
+        columns = list(self._columns)
+        return [(columns[i], j) for i, j in conditions]
+
+    def changes(self, since_merge=None, batch_size=10000):
+        """The returned object is an iterator.
+
+        Each iteration returns a row of the merge CSV inserted or updated after the
+        since_merge-th merge() (with its current values). merge() calls are
+        numbered from 1, so since_merge=0 returns all the rows.
+
+        :param int since_merge: (optional) The merge sequence number (default: the
+               changes of the last merge()).
+        :param int batch_size: (optional) The number of rows fetched at once.
+        :rtype: tuple
+        """
+        if self.closed:
+            raise ValueError("Operation on closed MergeFile")
+        if not self._track_changes:
+            raise ValueError("changes() requires track_changes")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number")
+        if not self._connection:
+            return
+        if since_merge is None:
+            since_merge = self._merge_count - 1
+        cursor = csvblend.select_changes(
+            self._connection,
+            self._table,
+            list(self._columns),
+            since_merge,
+            self._log_indexes(),
+        )
+        for batch in iter(lambda: cursor.fetchmany(batch_size), []):
+            yield from batch
+
+    def get(self, key, default=None, columns=None):
+        """Return the row of the merge CSV of a key (see get_many()).
+
+        :param object key: The index values, in indexes order (or the value of a
+               single index).
+        :param object default: (optional) The value returned if the key is not
+               found.
+        :param list columns: (optional) The columns of the row (see rows()).
+        :rtype: tuple
+        """
+        row = self.get_many([key], columns)[0]
+        return default if row is None else row
+
+    def get_many(self, keys, columns=None):
+        """Return the rows of the merge CSV of a list of keys.
+
+        The keys are searched in the UNIQUE index of the merge table, in one
+        statement. The values of a typed index are converted as csv values are
+        (see types). A key with a None value is never found, since NULL indexes
+        are not unique.
+
+        :param list keys: The keys, each one the index values in indexes order
+               (or the value of a single index).
+        :param list columns: (optional) The columns of each row (see rows()).
+        :return: The row of each key, or None if not found.
+        :rtype: list[tuple]
+        """
+        if self.closed:
+            raise ValueError("Operation on closed MergeFile")
+        if self._engine in RUN_ENGINES:
+            raise ValueError(f"engine '{self._engine}' does not support get_many")
+        positions = self._projection(columns)
+        keys = [self._lookup_key(i) for i in keys]
+        found = {}
+        lookup = []
+        for key in dict.fromkeys(keys):
+            row = _MISSING if self._cache is None else self._cache.get(key, _MISSING)
+            if row is not _MISSING:
+                found[key] = row
+            elif None in key or not self._connection:
+                found[key] = None
+            else:
+                lookup.append(key)
+        if lookup:
+            rows = csvblend.select_keys(
+                self._connection,
+                self._table,
+                list(self._columns),
+                list(self._indexes),
+                lookup,
+            )
+            # Release the keys table (a temporary table)
+            self._connection.commit()
+            found.update(dict.fromkeys(lookup))
+            for position, *row in rows:
+                found[lookup[position]] = tuple(row)
+            if self._cache is not None:
+                for key in lookup:
+                    self._cache.put(key, found[key])
+        rows = [found[i] for i in keys]
+        if positions != list(range(len(self._columns))):
+            getter = utils.itemgetter(positions)
+            rows = [None if i is None else getter(i) for i in rows]
+        return rows
+
+    def contains(self, keys):
+        """Return whether the merge CSV has a row of each key (see get_many()).
+
+        :param list keys: The keys, each one the index values in indexes order
+               (or the value of a single index).
+        :rtype: list[bool]
+        """
+        return [i is not None for i in self.get_many(keys)]
+
+    def _lookup_key(self, key):
+        """Normalize a get_many() key into a tuple of index values.
+
+        :param object key: The index values, or the value of a single index.
+        :rtype: tuple
+        """
+        if not isinstance(key, (list, tuple)):
+            key = (key,)
+        if len(key) != len(self._indexes):
+            raise ValueError("key should have a value for each index")
+        columns = list(self._columns)
+        converters = [self._converters[columns.index(i)] for i in self._indexes]
+        return tuple(
+            j(i) if j and isinstance(i, str) else i for i, j in zip(key, converters)
+        )
+
+    def write_csv(
+        self,
+        path_or_fp,
+        header=True,
+        compression=None,
+        encoding="utf-8",
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+    ):
+        """Write the merge CSV to a file.
+
+        The rows are formatted a batch at a time, and written in large blocks.
+
+        :param object path_or_fp: The file path, or a (text or binary) file object.
+        :param bool header: (optional) Write the columns as the first row.
+        :param str compression: (optional) The compression, one of COMPRESSIONS.
+               A file object must be binary.
+        :param str encoding: (optional) The file encoding (paths and binary file
+               objects).
+        :param int batch_size: (optional) The number of rows written at once.
+        :param bool order_by_index: (optional) Write the rows in index order,
+               otherwise in merge order.
+        :param list columns: (optional) The columns written (see rows()).
+        :param dict where: (optional) Only write the rows matching the filter (see
+               rows()).
+        :return: The number of rows and bytes (before compression, characters for
+                 a text file object) written, the seconds spent, and their rates.
+        :rtype: dict
+        """
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"compression should be one of {', '.join(COMPRESSIONS)}")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number")
+        names = list(self._columns.values())
+        header_columns = [names[i] for i in self._projection(columns)]
+        self._conditions(where)
+        start_time = timeit.default_timer()
+        rows = size = 0
+        with contextlib.ExitStack() as stack:
+            fp = self._open_output(stack, path_or_fp, compression)
+            binary = not isinstance(fp, io.TextIOBase)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if header:
+                writer.writerow(header_columns)
+            # The first (empty) batch writes the header block
+            batches = self.batches(batch_size, order_by_index, columns, where)
+            batches = itertools.chain([[]], batches)
+            for batch in batches:
+                writer.writerows(batch)
+                rows += len(batch)
+                block = buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                if binary:
+                    block = block.encode(encoding)
+                size += len(block)
+                fp.write(block)
+        seconds = timeit.default_timer() - start_time
+        logger.debug("Wrote %s rows (%s bytes) in %ss", rows, size, f"{seconds:.05f}")
+        return {
+            "rows": rows,
+            "bytes": size,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0,
+            "bytes_per_second": size / seconds if seconds else 0.0,
+        }
+
+    def _open_output(self, stack, path_or_fp, compression):
+        """Open the write_csv() output file.
+
+        :param contextlib.ExitStack stack: The output file context.
+        :param object path_or_fp: The file path, or a file object.
+        :param str compression: The compression, one of COMPRESSIONS (or None).
+        :return: The file object to write to (binary unless path_or_fp is a text
+                 file object).
+        :rtype: object
+        """
+        if isinstance(path_or_fp, (str, os.PathLike)):
+            fp = stack.enter_context(open(path_or_fp, "wb"))
+        elif isinstance(path_or_fp, io.TextIOBase):
+            if compression:
+                raise ValueError("compression requires a path or a binary file object")
+            return path_or_fp
+        else:
+            fp = path_or_fp
+        if compression == "gzip":
+            # Level 6 is the usual speed/size trade-off (9 is several times slower)
+            return stack.enter_context(
+                gzip.GzipFile(fileobj=fp, mode="wb", compresslevel=6)
+            )
+        if compression == "zstd":
+            compressor = utils.import_zstandard().ZstdCompressor()
+            return stack.enter_context(compressor.stream_writer(fp, closefd=False))
+        return fp
 
     def cleanup(self):
         """Cleanup the merge database."""
         if self.closed:
             return
         logger.debug("Called cleanup() on the instance")
-        if self._connection:
+        if self._connection and self._pool is not None:
+            self._release()
+        elif self._connection:
             # Close the database connection
             self._connection.close()
             # Remove the database
-            if self._db != ":memory:":
+            if self._db != ":memory:" and not self._persist and not self._in_memory:
                 os.remove(self._db)
+        if self._run:
+            # Remove the merge run
+            utils.remove_files([self._run])
         self.closed = True
+
+    def _release(self):
+        """Return the merge database to its pool, empty, or remove it if too large."""
+        try:
+            keep = csvblend.select_size(self._connection) <= self._pool.max_size
+            if keep:
+                csvblend.reset_database(
+                    self._connection,
+                    self._table,
+                    changes=self._track_changes,
+                    staging=self._engine == "staging",
+                    counter=self._without_rowid,
+                )
+                self._connection.commit()
+        except sqlite3.Error:
+            # Such as a full disk, the database is removed instead
+            keep = False
+        if keep:
+            self._pool._release(self._plan, self._connection, self._db, self.pragmas)
+        else:
+            self._connection.close()
+            os.remove(self._db)
+
+
+class PartitionedMergeFiles(MergeFiles):
+    """Representation of a PartitionedMergeFiles instance.
+
+    The merge CSV is split into partitions (merge databases) by a hash of the
+    indexes, and each partition is merged by its own process. Since the indexes
+    define uniqueness, the partitions never conflict.
+    """
+
+    def __init__(self, columns, indexes, partitions=None, directory=None, **options):
+        """Construct a new PartitionedMergeFiles instance from a list of columns.
+
+        :param list columns: The list of columns.
+        :param list indexes: The list of indexes.
+        :param int partitions: (optional) The number of partitions (default: the
+               number of CPUs).
+        :param str directory: (optional) The partition databases directory.
+        :param options: (optional) The MergeFiles options of each partition.
+        """
+        if options.get("persist"):
+            raise ValueError("persist is not supported by partitions")
+        if options.get("memory_limit") is not None:
+            raise ValueError("memory_limit is not supported by partitions")
+        if options.get("commit_rows") or options.get("commit_seconds"):
+            raise ValueError("commit_rows is not supported by partitions")
+        if options.get("blend"):
+            raise ValueError("blend is not supported by partitions")
+        if options.get("pool") is not None:
+            raise ValueError("pool is not supported by partitions")
+        super().__init__(columns, indexes, **options)
+        partitions = partitions or os.cpu_count() or 1
+        if partitions < 1:
+            raise ValueError("partitions should be a positive number")
+        if self._engine in RUN_ENGINES:
+            raise ValueError(f"engine '{self._engine}' is not supported by partitions")
+        # The partition databases directory
+        self._directory = directory
+        # The partition database files
+        self._dbs = [f"merge_files.{i}.db" for i in range(partitions)]
+        # The MergeFiles options of each partition, which share the memory
+        self._options = {**options, "tuning": self._tuning.split(partitions)}
+        # The callbacks run in this process
+        for name in ("metrics", "progress", "progress_rows"):
+            self._options.pop(name, None)
+        # The partition processes, and their request and response queues
+        self._processes = []
+        self._requests = []
+        self._responses = []
+        # The number of rows sent to a partition at once
+        self._batch_size = 10000
+        # The seconds between the checks of the partition processes, while waiting
+        # on their queues
+        self._poll_seconds = 1.0
+        # The error of the first partition process gone, if any (the other
+        # processes are stopped then)
+        self._failure = None
+
+    def batches(
+        self,
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+        limit=None,
+    ):
+        """The returned object is an iterator.
+
+        Each iteration returns a list of (up to batch_size) rows of the merge CSV.
+
+        :param int batch_size: (optional) The number of rows in a batch.
+        :param bool order_by_index: (optional) Return the rows in index order
+               (merging the partitions), otherwise partition by partition.
+        :param list columns: (optional) The columns of each row (see rows()).
+        :param dict where: (optional) Only return the rows matching the filter
+               (see rows()).
+        :param int limit: (optional) The maximum number of rows.
+        :rtype: list[tuple]
+        """
+        if self.closed:
+            raise ValueError("Operation on closed MergeFile")
+        positions = self._projection(columns)
+        conditions = self._table_conditions(self._conditions(where))
+        if limit is not None and limit < 0:
+            raise ValueError("limit should not be negative")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number")
+        if not self._processes:
+            return
+        indexes = list(self._indexes) if order_by_index else None
+        # The partitions are merged by index, so project the rows afterwards
+        selected = list(self._columns) if indexes else self._table_columns(positions)
+        with contextlib.ExitStack() as stack:
+            streams = []
+            for db in self._dbs:
+                connection = sqlite3.connect(db)
+                stack.callback(connection.close)
+                streams.append(
+                    csvblend.select_values(
+                        connection, self._table, selected, indexes, conditions, limit
+                    )
+                )
+            if order_by_index:
+                key = self._key()
+
+                def sort_key(row):
+                    # NULL sorts first, as in SQLite
+                    return [(i is not None, i) for i in key(row)]
+
+                rows = heapq.merge(*streams, key=sort_key)
+                if positions != list(range(len(self._columns))):
+                    rows = map(utils.itemgetter(positions), rows)
+            else:
+                rows = itertools.chain.from_iterable(streams)
+            yield from utils.batched(itertools.islice(rows, limit), batch_size)
+
+    def changes(self, since_merge=None, batch_size=10000):
+        """The returned object is an iterator.
+
+        Each iteration returns a row of the merge CSV inserted or updated after the
+        since_merge-th merge(), partition by partition.
+
+        :param int since_merge: (optional) The merge sequence number (default: the
+               changes of the last merge()).
+        :param int batch_size: (optional) The number of rows fetched at once.
+        :rtype: tuple
+        """
+        if self.closed:
+            raise ValueError("Operation on closed MergeFile")
+        if not self._track_changes:
+            raise ValueError("changes() requires track_changes")
+        if batch_size < 1:
+            raise ValueError("batch_size should be a positive number")
+        if not self._processes:
+            return
+        if since_merge is None:
+            since_merge = self._merge_count - 1
+        for db in self._dbs:
+            with contextlib.closing(sqlite3.connect(db)) as connection:
+                cursor = csvblend.select_changes(
+                    connection,
+                    self._table,
+                    list(self._columns),
+                    since_merge,
+                    self._log_indexes(),
+                )
+                for batch in iter(lambda: cursor.fetchmany(batch_size), []):
+                    yield from batch
+
+    def get_many(self, keys, columns=None):
+        """Lookups are not supported by partitions.
+
+        :param list keys: The keys.
+        :param list columns: (optional) The columns of each row.
+        :rtype: list[tuple]
+        """
+        raise ValueError("get_many is not supported by partitions")
+
+    def cleanup(self):
+        """Cleanup the partition databases."""
+        if self.closed:
+            return
+        logger.debug("Called cleanup() on the instance")
+        for partition in range(len(self._processes)):
+            # A partition process gone has nothing to close
+            with contextlib.suppress(RuntimeError):
+                self._put(partition, _CLOSE)
+        for process in self._processes:
+            process.join()
+        if self._processes:
+            # Remove the databases
+            for db in self._dbs:
+                if os.path.exists(db):
+                    os.remove(db)
+        self.closed = True
+
+    def _size(self):
+        """Return the size of the partition databases, in bytes.
+
+        :rtype: int
+        """
+        return sum(os.path.getsize(i) for i in self._dbs if os.path.exists(i))
+
+    def _open(self):
+        """Start the partition processes."""
+        if self.closed:
+            raise ValueError("Operation on closed MergeFile")
+        if self._processes:
+            return
+        if not self._directory:
+            self._directory = tempfile.mkdtemp()
+        self._dbs = [os.path.join(self._directory, i) for i in self._dbs]
+        for db in self._dbs:
+            requests = multiprocessing.Queue(maxsize=8)
+            responses = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_merge_partition,
+                args=(
+                    list(self._columns.values()),
+                    list(self._indexes.values()),
+                    db,
+                    self._options,
+                    requests,
+                    responses,
+                ),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+            self._requests.append(requests)
+            self._responses.append(responses)
+
+    def _merge_values(self, values, absent=()):
+        """Route the values of a csvfile to the partition processes.
+
+        :param iter values: The csvfile values, in column order.
+        :param list absent: (optional) The columns missing from the csvfile, always
+               empty (blend is not supported by partitions).
+        """
+        start_time = timeit.default_timer()
+        key = self._key()
+        partitions = len(self._dbs)
+        batches = [[] for _ in range(partitions)]
+        try:
+            for value in values:
+                partition = utils.partition_function(key(value), partitions)
+                batch = batches[partition]
+                batch.append(value)
+                if len(batch) >= self._batch_size:
+                    self._put(partition, batch)
+                    batches[partition] = []
+        finally:
+            for partition, batch in enumerate(batches):
+                if batch:
+                    self._put(partition, batch)
+                # Mark the end of the csvfile
+                self._put(partition, None)
+            responses = [self._get(i) for i in range(partitions)]
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        merge_time = timeit.default_timer()
+        total_time = merge_time - start_time
+        logger.debug("Merged csvfile in %ss", f"{total_time:.05f}")
+        self.affected_count = sum(i[0] for i in responses)
+        self.rowcount = sum(i[1] for i in responses)
+        self._merge_count += 1
+
+    def _put(self, partition, request):
+        """Send a request to a partition process, unless it is gone.
+
+        :param int partition: The partition.
+        :param object request: The request, a batch of values, None or _CLOSE.
+        """
+        while True:
+            self._check(partition)
+            try:
+                self._requests[partition].put(request, timeout=self._poll_seconds)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, partition):
+        """Receive the response of a partition process, unless it is gone.
+
+        :param int partition: The partition.
+        :return: The (affected_count, rowcount) or the exception of a csvfile.
+        :rtype: object
+        """
+        while True:
+            # A response sent before the process exited is still received
+            alive = self._processes[partition].is_alive()
+            try:
+                return self._responses[partition].get(timeout=self._poll_seconds)
+            except queue.Empty:
+                if not alive or self._failure:
+                    self._check(partition)
+
+    def _check(self, partition):
+        """Raise an error if a partition process is gone, and stop the others.
+
+        Such as a process killed for lack of memory, its merge can not go on.
+
+        :param int partition: The partition.
+        """
+        process = self._processes[partition]
+        if self._failure is None and process.is_alive():
+            return
+        if self._failure is None:
+            self._failure = (
+                f"partition process {partition} exited unexpectedly (exit code "
+                f"{process.exitcode})"
+            )
+            for other in self._processes:
+                if other.is_alive():
+                    other.terminate()
+                    other.join()
+        raise RuntimeError(self._failure)
+
+
+# The request that stops a partition process
+_CLOSE = "close"
+
+
+def _merge_partition(columns, indexes, db, options, requests, responses):
+    """Merge the values sent to a partition process (the process target).
+
+    :param list columns: The list of columns.
+    :param list indexes: The list of indexes.
+    :param str db: The partition database file.
+    :param dict options: The MergeFiles options.
+    :param multiprocessing.Queue requests: The value batches of each csvfile,
+           each csvfile followed by None.
+    :param multiprocessing.Queue responses: The (affected_count, rowcount) or
+           the exception of each csvfile.
+    """
+    mf = MergeFiles(columns, indexes, db, **options)
+    for batch in iter(requests.get, _CLOSE):
+        values = _partition_values(batch, requests)
+        try:
+            mf._open()
+            mf._merge_values(values)
+        except Exception as e:
+            # Drain the rest of the csvfile
+            for _ in values:
+                pass
+            responses.put(e)
+        else:
+            responses.put((mf.affected_count, mf.rowcount))
+    if mf._connection:
+        mf._connection.close()
+
+
+def _partition_values(batch, requests):
+    """Iterate over the value batches of a csvfile sent to a partition process.
+
+    :param list batch: The first batch, or None.
+    :param multiprocessing.Queue requests: The remaining batches.
+    :rtype: tuple
+    """
+    while batch is not None:
+        yield from batch
+        batch = requests.get()
+
+
+class AsyncMergeFiles:
+    """Representation of an AsyncMergeFiles instance.
+
+    An asyncio interface of MergeFiles. The blocking work (csv parsing and the
+    database) runs on a dedicated worker thread, which owns the database
+    connection, so the event loop is never blocked. The worker thread runs one
+    call at a time, in order.
+    """
+
+    def __init__(self, columns, indexes, db=None, queue_size=8, **options):
+        """Construct a new AsyncMergeFiles instance from a list of columns.
+
+        :param list columns: The list of columns.
+        :param list indexes: The list of indexes.
+        :param str db: (optional) The database file database.
+        :param int queue_size: (optional) The number of chunks (of a byte stream)
+               or batches (of rows()) buffered between the event loop and the
+               worker thread.
+        :param options: (optional) The MergeFiles options.
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size should be a positive number")
+        # The MergeFiles instance, only used by the worker thread
+        self._mf = MergeFiles(columns, indexes, db, **options)
+        # The worker thread
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="csvblend"
+        )
+        self._queue_size = queue_size
+
+    async def __aenter__(self):
+        """Enter the runtime context."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exit the runtime context."""
+        await self.cleanup()
+
+    @property
+    def affected_count(self):
+        """The number of rows affected by merge() (see MergeFiles)."""
+        return self._mf.affected_count
+
+    @property
+    def rowcount(self):
+        """The number of rows in the merge table."""
+        return self._mf.rowcount
+
+    @property
+    def closed(self):
+        """True if cleanup() has been called, otherwise False."""
+        return self._mf.closed
+
+    @property
+    def last_merge_stats(self):
+        """The statistics of the last merge (see MergeFiles)."""
+        return self._mf.last_merge_stats
+
+    async def merge(self, csvfile, encoding="utf-8", where=None):
+        """Merge a csvfile into the merge CSV.
+
+        The chunks of a byte stream are parsed by the worker thread as they are
+        read, up to queue_size chunks ahead of it. If the byte stream fails, the
+        merge fails with its exception (as merge() does on an invalid row, the
+        rows written before the failure are not rolled back).
+
+        :param object csvfile: An async iterable of bytes (such as an
+               asyncio.StreamReader), or any csvfile of MergeFiles.merge().
+        :param str encoding: (optional) The byte stream encoding.
+        :param dict where: (optional) Only merge the rows matching the filter (see
+               MergeFiles.rows()).
+        """
+        if not hasattr(csvfile, "__aiter__"):
+            await self._run(self._mf.merge, csvfile, where)
+            return
+        # Check the filter before reading the byte stream
+        self._mf._conditions(where)
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self._queue_size)
+        chunks = queue.Queue()
+        reader = _ChunkReader(chunks, lambda: loop.call_soon_threadsafe(slots.release))
+        future = self._run(self._merge_stream, reader, encoding, where)
+        try:
+            async for chunk in csvfile:
+                await slots.acquire()
+                if reader.closed:
+                    # The merge failed
+                    break
+                chunks.put(chunk)
+        except BaseException as e:
+            # Fail the merge (before its commit)
+            chunks.put(e)
+            await asyncio.wait([future])
+            if not future.cancelled():
+                future.exception()
+            raise
+        chunks.put(None)
+        await future
+
+    def _merge_stream(self, reader, encoding, where):
+        """Merge a byte stream (the worker thread).
+
+        :param _ChunkReader reader: The byte stream.
+        :param str encoding: The byte stream encoding.
+        :param dict where: The row filter, or None.
+        """
+        with io.TextIOWrapper(io.BufferedReader(reader), encoding, newline="") as fp:
+            self._mf.merge(fp, where)
+
+    async def merge_path(self, path, encoding="utf-8", where=None):
+        """Merge a csvfile (path) into the merge CSV (see MergeFiles).
+
+        :param str path: The csvfile path.
+        :param str encoding: (optional) The csvfile encoding.
+        :param dict where: (optional) Only merge the rows matching the filter (see
+               MergeFiles.rows()).
+        :return: True if the csvfile was merged, False if it was skipped.
+        :rtype: bool
+        """
+        return await self._run(self._mf.merge_path, path, encoding, where)
+
+    async def merge_many(self, paths, **kwargs):
+        """Merge csvfiles (paths) into the merge CSV, in order (see MergeFiles).
+
+        :param list paths: The csvfile paths.
+        :param kwargs: (optional) The MergeFiles.merge_many() options.
+        """
+        await self._run(self._mf.merge_many, paths, **kwargs)
+
+    async def rows(
+        self,
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+        limit=None,
+    ):
+        """The returned object is an asynchronous iterator.
+
+        Each iteration returns a row of the merge CSV. The worker thread is busy
+        until the iteration ends, so do not merge while iterating.
+
+        :param int batch_size: (optional) The number of rows fetched at once.
+        :param bool order_by_index: (optional) Return the rows in index order,
+               otherwise in merge order.
+        :param list columns: (optional) The columns of each row (see
+               MergeFiles.rows()).
+        :param dict where: (optional) Only return the rows matching the filter.
+        :param int limit: (optional) The maximum number of rows.
+        :rtype: tuple
+        """
+        batches = self.batches(batch_size, order_by_index, columns, where, limit)
+        async for batch in batches:
+            for row in batch:
+                yield row
+
+    async def batches(
+        self,
+        batch_size=10000,
+        order_by_index=False,
+        columns=None,
+        where=None,
+        limit=None,
+    ):
+        """The returned object is an asynchronous iterator.
+
+        Each iteration returns a list of (up to batch_size) rows of the merge CSV.
+        The worker thread fetches up to queue_size batches ahead of the event loop.
+
+        :param int batch_size: (optional) The number of rows in a batch.
+        :param bool order_by_index: (optional) Return the rows in index order,
+               otherwise in merge order.
+        :param list columns: (optional) The columns of each row (see
+               MergeFiles.rows()).
+        :param dict where: (optional) Only return the rows matching the filter.
+        :param int limit: (optional) The maximum number of rows.
+        :rtype: list[tuple]
+        """
+        batches = self._mf.batches(batch_size, order_by_index, columns, where, limit)
+        async for batch in self._iterate(batches):
+            yield batch
+
+    async def changes(self, since_merge=None, batch_size=10000):
+        """The returned object is an asynchronous iterator.
+
+        Each iteration returns a row of the merge CSV inserted or updated after the
+        since_merge-th merge() (see MergeFiles).
+
+        :param int since_merge: (optional) The merge sequence number (default: the
+               changes of the last merge()).
+        :param int batch_size: (optional) The number of rows fetched at once.
+        :rtype: tuple
+        """
+        changes = self._mf.changes(since_merge, batch_size)
+        async for batch in self._iterate(utils.batched(changes, batch_size)):
+            for row in batch:
+                yield row
+
+    async def _iterate(self, iterator):
+        """Iterate over a (blocking) iterator on the worker thread.
+
+        :param object iterator: The iterator.
+        :rtype: object
+        """
+        loop = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        slots = threading.Semaphore(self._queue_size)
+        stop = threading.Event()
+
+        def put(item):
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+        def produce():
+            try:
+                for item in iterator:
+                    slots.acquire()
+                    if stop.is_set():
+                        return
+                    put(item)
+            finally:
+                put(_END)
+
+        future = self._run(produce)
+        try:
+            while True:
+                item = await items.get()
+                slots.release()
+                if item is _END:
+                    break
+                yield item
+        finally:
+            stop.set()
+            slots.release()
+            await future
+
+    async def get(self, key, default=None, columns=None):
+        """Return the row of the merge CSV of a key (see MergeFiles).
+
+        :param object key: The index values, in indexes order (or the value of a
+               single index).
+        :param object default: (optional) The value returned if the key is not
+               found.
+        :param list columns: (optional) The columns of the row.
+        :rtype: tuple
+        """
+        return await self._run(self._mf.get, key, default, columns)
+
+    async def get_many(self, keys, columns=None):
+        """Return the rows of the merge CSV of a list of keys (see MergeFiles).
+
+        :param list keys: The keys.
+        :param list columns: (optional) The columns of each row.
+        :rtype: list[tuple]
+        """
+        return await self._run(self._mf.get_many, keys, columns)
+
+    async def contains(self, keys):
+        """Return whether the merge CSV has a row of each key (see MergeFiles).
+
+        :param list keys: The keys.
+        :rtype: list[bool]
+        """
+        return await self._run(self._mf.contains, keys)
+
+    async def write_csv(self, path_or_fp, **kwargs):
+        """Write the merge CSV to a file (see MergeFiles).
+
+        :param object path_or_fp: The file path, or a (text or binary) file object.
+        :param kwargs: (optional) The MergeFiles.write_csv() options.
+        :rtype: dict
+        """
+        return await self._run(self._mf.write_csv, path_or_fp, **kwargs)
+
+    async def cleanup(self):
+        """Cleanup the merge database, and stop the worker thread."""
+        if self._mf.closed:
+            return
+        await self._run(self._mf.cleanup)
+        self._executor.shutdown(wait=False)
+
+    def _run(self, function, *args, **kwargs):
+        """Run a function on the worker thread.
+
+        :param callable function: The function.
+        :rtype: asyncio.Future
+        """
+        loop = asyncio.get_running_loop()
+        function = functools.partial(function, *args, **kwargs)
+        return loop.run_in_executor(self._executor, function)
+
+
+class _Source:
+    """A csvfile merged with checkpoints (see MergeFiles.merge_path())."""
+
+    __slots__ = ("path", "size", "sha256", "fp", "rows")
+
+    def __init__(self, path, size, sha256, fp, rows):
+        """Construct a new _Source instance.
+
+        :param str path: The csvfile path.
+        :param int size: The csvfile size, in bytes.
+        :param str sha256: The csvfile checksum.
+        :param object fp: The binary file object.
+        :param int rows: The number of rows merged before.
+        """
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.fp = fp
+        self.rows = rows
+
+
+class _Checkpoint:
+    """A commit point in the values of a merge (see MergeFiles._checkpoints())."""
+
+    __slots__ = ("source", "offset", "rows")
+
+    def __init__(self, source, offset, rows):
+        """Construct a new _Checkpoint instance.
+
+        :param _Source source: The csvfile, or None.
+        :param int offset: The position after the last record merged, or None.
+        :param int rows: The number of rows merged.
+        """
+        self.source = source
+        self.offset = offset
+        self.rows = rows
+
+
+# The end of an AsyncMergeFiles._iterate() iteration
+_END = object()
+
+# A key missing from the MergeFiles.get_many() cache
+_MISSING = object()
+
+
+class _ChunkReader(io.RawIOBase):
+    """A raw byte stream over the chunks of a queue (see AsyncMergeFiles.merge()).
+
+    The queue ends with None, or an exception to raise.
+    """
+
+    def __init__(self, chunks, consumed):
+        """Construct a new _ChunkReader instance.
+
+        :param queue.Queue chunks: The chunks (bytes).
+        :param callable consumed: Called after each chunk taken from the queue,
+               and on close.
+        """
+        super().__init__()
+        self._chunks = chunks
+        self._consumed = consumed
+        self._chunk = memoryview(b"")
+        self._position = 0
+
+    def readable(self):
+        """Return True, the stream is readable."""
+        return True
+
+    def readinto(self, b):
+        """Read the next bytes into a buffer.
+
+        :param object b: The buffer.
+        :return: The number of bytes read (0 at the end of the stream).
+        :rtype: int
+        """
+        while not self._chunk:
+            chunk = self._chunks.get()
+            self._consumed()
+            if chunk is None:
+                return 0
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self._chunk = memoryview(chunk).cast("B")
+        size = min(len(b), len(self._chunk))
+        b[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        self._position += size
+        return size
+
+    def tell(self):
+        """Return the number of bytes read.
+
+        :rtype: int
+        """
+        return self._position
+
+    def close(self):
+        """Close the stream."""
+        if not self.closed:
+            super().close()
+            self._consumed()
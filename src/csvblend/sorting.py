@@ -0,0 +1,216 @@
+"""Sorted merge methods and objects that power csvblend (without a database)."""
+
+import heapq
+import itertools
+import logging
+import os
+import pickle
+import tempfile
+
+from csvblend import utils
+
+logger = logging.getLogger(__name__)
+
+
+def write_run(path, values, batch_size=10000):
+    """Write values to a run file.
+
+    :param str path: The run file.
+    :param iter values: The values (tuples) to write.
+    :param int batch_size: (optional) The number of values pickled at once.
+    :return: The number of values written.
+    :rtype: int
+    """
+    count = 0
+    with open(path, "wb") as fp:
+        for batch in utils.batched(values, batch_size):
+            pickle.dump(batch, fp, pickle.HIGHEST_PROTOCOL)
+            count += len(batch)
+    return count
+
+
+def read_run(path):
+    """Read the values of a run file.
+
+    :param str path: The run file.
+    :rtype: tuple
+    """
+    with open(path, "rb") as fp:
+        while True:
+            try:
+                batch = pickle.load(fp)
+            except EOFError:
+                return
+            yield from batch
+
+
+def changed(old, new):
+    """Compare two rows the way the merge table UPSERT statement does.
+
+    Like the SQL row value comparison (...) IS NOT (...), a NULL (None) value is
+    different from a non-NULL value, and the same as a NULL value.
+
+    :param tuple old: The current row.
+    :param tuple new: The new row.
+    :rtype: bool
+    """
+    return any(i != j for i, j in zip(old, new))
+
+
+def nulls_first(key):
+    """Return a sort key that orders a NULL (None) index before the other ones.
+
+    The rows without a NULL index keep the order of the key.
+
+    :param callable key: Return the indexes (tuple) of a row.
+    :rtype: callable
+    """
+
+    def _key(row):
+        return tuple((i is not None, i) for i in key(row))
+
+    return _key
+
+
+class SortedMerge:
+    """Representation of a k-way merge of streams sorted by their indexes.
+
+    The streams are merged in order, and the last row of an index wins. The
+    result and the counts are the same as inserting the streams into a merge
+    table one after another, using O(streams) memory.
+    """
+
+    def __init__(self, streams, key, counted):
+        """Construct a new SortedMerge instance from a list of streams.
+
+        :param list streams: The streams (iterables of rows), in merge order.
+        :param callable key: Return the indexes (tuple) of a row.
+        :param list counted: True if the changes of a stream are added to
+               affected_count, otherwise False (for each stream).
+        """
+        # The number of rows created or updated by the counted streams
+        self.affected_count = 0
+        # The number of rows in the result
+        self.rowcount = 0
+        # The stream with a row out of order (or with a NULL index), if any. The
+        # merge stops at that row
+        self.unsorted = None
+        # The streams
+        self._streams = [iter(i) for i in streams]
+        # The index function
+        self._key = key
+        # The counted streams
+        self._counted = counted
+        # The heap of (indexes, stream, row), one for each unfinished stream
+        self._heap = []
+        # The rest of the unsorted stream
+        self._remainder = None
+
+    def __iter__(self):
+        """Iterate over the merged rows, in index order.
+
+        :rtype: tuple
+        """
+        for stream in range(len(self._streams)):
+            self._pull(stream, None)
+        group = state = None
+        while self._heap and self.unsorted is None:
+            key, stream, row = heapq.heappop(self._heap)
+            if key != group:
+                if state is not None:
+                    self.rowcount += 1
+                    yield state
+                group = key
+                state = None
+            if state is None or changed(state, row):
+                state = row
+                if self._counted[stream]:
+                    self.affected_count += 1
+            self._pull(stream, key)
+        if state is not None:
+            self.rowcount += 1
+            yield state
+
+    def rest(self, stream):
+        """Return the rows of a stream not merged (once the merge stopped).
+
+        :param int stream: The stream.
+        :rtype: iter
+        """
+        if stream == self.unsorted:
+            return self._remainder
+        held = [i[2] for i in self._heap if i[1] == stream]
+        return itertools.chain(held, self._streams[stream])
+
+    def _pull(self, stream, previous):
+        """Push the next row of a stream onto the heap.
+
+        :param int stream: The stream.
+        :param tuple previous: The indexes of the previous row of the stream.
+        """
+        row = next(self._streams[stream], None)
+        if row is None:
+            return
+        key = self._key(row)
+        if None in key or (previous is not None and key < previous):
+            logger.debug("Found an unsorted row in stream %s", stream)
+            self.unsorted = stream
+            self._remainder = itertools.chain([row], self._streams[stream])
+            return
+        heapq.heappush(self._heap, (key, stream, row))
+
+
+def spill_runs(values, key, directory, run_size, fan_in=64):
+    """Split values into run files sorted by their indexes (an external sort).
+
+    Each run is sorted in memory with a stable sort, so the rows of an index keep
+    their order across the runs (in run order). No row is dropped, the rows with
+    a NULL (None) index come first (the merge stops at them, see SortedMerge).
+
+    :param iter values: The values (tuples) to sort.
+    :param callable key: Return the indexes (tuple) of a row.
+    :param str directory: The run files directory.
+    :param int run_size: The number of values sorted in memory at once.
+    :param int fan_in: (optional) The maximum number of runs returned, larger
+           numbers of runs are combined (see combine_runs()).
+    :return: The run files, in order.
+    :rtype: list[str]
+    """
+    runs = []
+    for batch in utils.batched(values, run_size):
+        try:
+            batch.sort(key=key)
+        except TypeError:
+            # A NULL index, the run is sorted the way the runs are combined
+            batch.sort(key=nulls_first(key))
+        fd, path = tempfile.mkstemp(".run", dir=directory)
+        os.close(fd)
+        write_run(path, batch)
+        runs.append(path)
+    while len(runs) > fan_in:
+        runs = [
+            combine_runs(runs[i : i + fan_in], nulls_first(key), directory)
+            for i in range(0, len(runs), fan_in)
+        ]
+    return runs
+
+
+def combine_runs(runs, key, directory):
+    """Combine run files into a single run file sorted by their indexes.
+
+    Unlike SortedMerge, no row is dropped: the rows of an index keep their order
+    (in run order). The run files are removed.
+
+    :param list runs: The run files, in order.
+    :param callable key: Return the indexes (tuple) of a row.
+    :param str directory: The run file directory.
+    :return: The run file.
+    :rtype: str
+    """
+    fd, path = tempfile.mkstemp(".run", dir=directory)
+    os.close(fd)
+    # heapq.merge() is stable, equal rows keep the order of their runs
+    write_run(path, heapq.merge(*[read_run(i) for i in runs], key=key))
+    for run in runs:
+        os.remove(run)
+    return path
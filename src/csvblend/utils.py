@@ -1,13 +1,27 @@
 """Utility methods that are used in csvblend."""
 
+import bz2
+import collections
+import contextlib
+import csv
+import datetime
+import functools
+import gzip
+import hashlib
+import io
+import itertools
+import lzma
+import operator
+import os
 import zlib
 
 
+@functools.lru_cache(maxsize=4096)
 def hash_function(value):
     """Map a group of characters to a fixed-size value.
 
     One that does not violate the keyword, identifier or parameter database
-    requirements.
+    requirements. The values of the recent column names are cached.
 
     :param str value: The value to hash.
     :rtype: str
@@ -15,3 +29,446 @@ def hash_function(value):
     # Ref: https://docs.python.org/3/library/zlib.html#zlib.crc32
     result = zlib.crc32(value.encode()) & 0xFFFFFFFF
     return str(result)
+
+
+def itemgetter(positions):
+    """Return a callable that fetches a tuple of positions from its operand.
+
+    Unlike operator.itemgetter(), a single position also returns a tuple.
+
+    :param list positions: The positions to fetch, in order.
+    :rtype: callable
+    """
+    if len(positions) > 1:
+        return operator.itemgetter(*positions)
+    position = positions[0]
+
+    def getter(row):
+        return (row[position],)
+
+    return getter
+
+
+def partition_function(key, partitions):
+    """Map an index key to a partition, the same way in every process.
+
+    :param tuple key: The index values.
+    :param int partitions: The number of partitions.
+    :rtype: int
+    """
+    # Unlike hash(), crc32 is not salted per process
+    value = "\x1f".join(["" if i is None else str(i) for i in key])
+    return zlib.crc32(value.encode()) % partitions
+
+
+def project_rows(rows, positions):
+    """Project the csv rows onto a list of positions.
+
+    Blank rows are skipped and short rows are padded with None (as with
+    csv.DictReader).
+
+    :param object rows: The csv rows (lists), such as a csv.reader.
+    :param list positions: The positions to keep, in order.
+    :rtype: tuple
+    """
+    width = max(positions) + 1
+    getter = itemgetter(positions)
+    for row in rows:
+        if len(row) < width:
+            if not row:
+                continue
+            row = row + [None] * (width - len(row))
+        yield getter(row)
+
+
+def convert_integer(value):
+    """Convert a csv value to an integer (an empty value is None).
+
+    :param str value: The csv value.
+    :rtype: int
+    """
+    return int(value) if value else None
+
+
+def convert_real(value):
+    """Convert a csv value to a float (an empty value is None).
+
+    :param str value: The csv value.
+    :rtype: float
+    """
+    return float(value) if value else None
+
+
+def convert_date(value):
+    """Convert a csv value to an ISO 8601 date (an empty value is None).
+
+    :param str value: The csv value (YYYY-MM-DD).
+    :rtype: str
+    """
+    return datetime.date.fromisoformat(value).isoformat() if value else None
+
+
+def convert_rows(rows, converters):
+    """Convert the values of rows, position by position.
+
+    :param object rows: The rows (tuples).
+    :param list converters: The converter of each position, or None to keep the
+           values as they are.
+    :rtype: tuple
+    """
+    converted = [(i, j) for i, j in enumerate(converters) if j is not None]
+    if not converted:
+        yield from rows
+        return
+    for row in rows:
+        row = list(row)
+        for position, converter in converted:
+            row[position] = converter(row[position])
+        yield tuple(row)
+
+
+def filter_rows(rows, conditions):
+    """Keep the rows matching every condition.
+
+    :param object rows: The rows (tuples).
+    :param list conditions: The (position, values) conditions, a row matches when
+           its value at position is one of values (a frozenset).
+    :rtype: tuple
+    """
+    if not conditions:
+        yield from rows
+        return
+    if len(conditions) == 1:
+        ((position, values),) = conditions
+        for row in rows:
+            if row[position] in values:
+                yield row
+        return
+    for row in rows:
+        if all(row[i] in j for i, j in conditions):
+            yield row
+
+
+# The magic bytes of the compressed csvfiles
+MAGIC_BYTES = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+
+
+def import_zstandard():
+    """Import the (optional) zstandard package.
+
+    :rtype: module
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("compression 'zstd' requires the zstandard package") from None
+    return zstandard
+
+
+def detect_compression(path):
+    """Detect the compression of a file from its magic bytes.
+
+    :param str path: The file path.
+    :return: The compression (a value of MAGIC_BYTES), or None.
+    :rtype: str
+    """
+    with open(path, "rb") as fp:
+        head = fp.read(max(len(i) for i in MAGIC_BYTES))
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_binary(path):
+    """Open a csvfile for reading in binary mode, decompressing it if needed.
+
+    :param str path: The csvfile path.
+    :rtype: io.BufferedIOBase
+    """
+    compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "bz2":
+        return bz2.open(path, "rb")
+    if compression == "xz":
+        return lzma.open(path, "rb")
+    if compression == "zstd":
+        reader = import_zstandard().ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.BufferedReader(reader)
+    return open(path, "rb")
+
+
+def open_csvfile(path, encoding="utf-8"):
+    """Open a csvfile for reading, decompressing it if needed (see MAGIC_BYTES).
+
+    :param str path: The csvfile path.
+    :param str encoding: (optional) The csvfile encoding.
+    :rtype: io.TextIOBase
+    """
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, newline="")
+
+
+def read_lines(fp, encoding="utf-8", offset=None):
+    """Decode the lines of a binary csvfile, such as for csv.reader().
+
+    Unlike with a text file, the file position (fp.tell()) is exact after each
+    line, so it is the end of the last record read. The csvfile must use an ASCII
+    compatible encoding.
+
+    :param object fp: The binary file object.
+    :param str encoding: (optional) The csvfile encoding.
+    :param int offset: (optional) The position to skip to after the first line
+           (the header).
+    :rtype: str
+    """
+    for line in fp:
+        yield line.decode(encoding)
+        if offset:
+            fp.seek(offset)
+            offset = None
+
+
+# The bytes after which a quote starts a quoted field, elsewhere it is a
+# character of the field (as read by csv.reader())
+FIELD_STARTS = b",\r\n"
+
+
+def split_csv(path, chunk_size, block_size=1 << 20):
+    """Split a csvfile into byte ranges of whole records.
+
+    A newline ends a record outside of the quoted fields (quotes inside them
+    are doubled). The first range is the header.
+
+    :param str path: The csvfile path.
+    :param int chunk_size: The approximate range size, in bytes.
+    :param int block_size: (optional) The read size, in bytes.
+    :rtype: list[tuple]
+    """
+    boundaries = [0]
+    # The first boundary is the end of the header
+    target = 0
+    quoted = False
+    # The bytes carried over to the next block, the file starts a field
+    carry = b"\n"
+    position = 1
+    # The file offset of the first byte of the block read
+    offset = -1
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(block_size), b""):
+            data = carry + block
+            while True:
+                if quoted:
+                    quote = data.find(b'"', position)
+                    if quote == -1 or quote == len(data) - 1:
+                        # A quote ending the block is read again with the next one
+                        carry = data[quote:] if quote != -1 else b""
+                        position = 0
+                        break
+                    # A doubled quote is a quote inside the field
+                    quoted = data[quote + 1] == ord('"')
+                    position = quote + 2 if quoted else quote + 1
+                    continue
+                quote = data.find(b'"', position)
+                while quote != -1 and data[quote - 1] not in FIELD_STARTS:
+                    quote = data.find(b'"', quote + 1)
+                end = len(data) if quote == -1 else quote
+                newline = data.find(b"\n", max(target - offset, position), end)
+                while newline != -1:
+                    position = newline + 1
+                    boundaries.append(offset + position)
+                    target = offset + position + chunk_size
+                    newline = data.find(b"\n", target - offset, end)
+                if quote == -1:
+                    # The last byte tells whether a quote of the next block
+                    # starts a field
+                    carry = data[-1:]
+                    position = 1
+                    break
+                quoted = True
+                position = quote + 1
+            offset += len(data) - len(carry)
+    size = offset + len(carry)
+    if boundaries[-1] != size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:])) or [(0, 0)]
+
+
+def read_csv_chunk(
+    path, start, end, positions, encoding="utf-8", converters=(), conditions=()
+):
+    """Read a byte range of whole records (see split_csv()) from a csvfile.
+
+    :param str path: The csvfile path.
+    :param int start: The range start, in bytes.
+    :param int end: The range end, in bytes.
+    :param list positions: The positions to keep (see project_rows()), or None
+           to return the first row.
+    :param str encoding: (optional) The csvfile encoding.
+    :param list converters: (optional) The converter of each position kept (see
+           convert_rows()).
+    :param list conditions: (optional) The conditions of the rows kept (see
+           filter_rows()).
+    :rtype: list
+    """
+    with open(path, "rb") as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+    reader = csv.reader(io.StringIO(data.decode(encoding), newline=""))
+    if positions is None:
+        return next(reader, [])
+    values = convert_rows(project_rows(reader, positions), converters)
+    return list(filter_rows(values, conditions))
+
+
+def read_ahead(iterable, size):
+    """Iterate over an iterable, consuming up to size items in advance.
+
+    :param object iterable: The iterable, such as a generator of futures.
+    :param int size: The number of items to consume in advance.
+    :rtype: object
+    """
+    iterator = iter(iterable)
+    pending = collections.deque(itertools.islice(iterator, size))
+    while pending:
+        yield pending.popleft()
+        pending.extend(itertools.islice(iterator, 1))
+
+
+def available_memory():
+    """Return the memory available to this process, in bytes.
+
+    Container (cgroup) memory limits are taken into account.
+
+    :return: The available memory, or None if unknown.
+    :rtype: int
+    """
+    available = []
+    # cgroup v2, then cgroup v1
+    for limit, usage in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        (
+            "/sys/fs/cgroup/memory/memory.limit_in_bytes",
+            "/sys/fs/cgroup/memory/memory.usage_in_bytes",
+        ),
+    ):
+        try:
+            with open(limit) as fp0, open(usage) as fp1:
+                available.append(int(fp0.read()) - int(fp1.read()))
+            break
+        except (OSError, ValueError):
+            # Not found, or "max" (unlimited)
+            continue
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    available.append(int(line.split()[1]) * 1024)
+                    break
+    except (OSError, ValueError):
+        try:
+            pages = os.sysconf("SC_AVPHYS_PAGES")
+            available.append(pages * os.sysconf("SC_PAGE_SIZE"))
+        except (AttributeError, OSError, ValueError):
+            pass
+    return max(min(available), 0) if available else None
+
+
+def remove_files(paths):
+    """Remove files, and their directories once empty.
+
+    :param list paths: The file paths.
+    """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    for directory in {os.path.dirname(i) for i in paths}:
+        with contextlib.suppress(OSError):
+            os.rmdir(directory)
+
+
+class LRUCache:
+    """A mapping of (up to) size items, which evicts the least recently used."""
+
+    def __init__(self, size):
+        """Construct a new LRUCache instance.
+
+        :param int size: The maximum number of items.
+        """
+        self.size = size
+        self._items = collections.OrderedDict()
+
+    def __len__(self):
+        """Return the number of items."""
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """Return the value of a key, and mark it as the most recently used.
+
+        :param object key: The key.
+        :param object default: (optional) The value of a missing key.
+        :rtype: object
+        """
+        try:
+            self._items.move_to_end(key)
+        except KeyError:
+            return default
+        return self._items[key]
+
+    def put(self, key, value):
+        """Set the value of a key, evicting the least recently used key if full.
+
+        :param object key: The key.
+        :param object value: The value.
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Remove all the items."""
+        self._items.clear()
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of (up to) size items.
+
+    :param object iterable: The iterable.
+    :param int size: The number of items in a list.
+    :rtype: list
+    """
+    iterator = iter(iterable)
+    return iter(lambda: list(itertools.islice(iterator, size)), [])
+
+
+def byte_position(fp):
+    """Return the position of a (text) file object in its underlying binary file.
+
+    :param object fp: The file object, or any iterable.
+    :return: The position, in bytes (None if unknown).
+    :rtype: int
+    """
+    with contextlib.suppress(AttributeError, OSError, ValueError):
+        return fp.buffer.tell()
+    return None
+
+
+def checksum_file(path, block_size=1 << 20):
+    """Return the SHA-256 checksum of a file.
+
+    :param str path: The file path.
+    :param int block_size: (optional) The number of bytes read at once.
+    :return: The hexadecimal digest.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
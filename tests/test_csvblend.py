@@ -49,6 +49,22 @@ def test_create_database_in_memory():
     assert test_cursor0 == [(0, "main", "")]
 
 
+def test_create_database_pragmas():
+    connection = csvblend.create_database(
+        ":memory:", {"page_size": 8192, "cache_size": -4096}
+    )
+    test_cursor0 = connection.execute("""
+        PRAGMA cache_size;
+    """).fetchone()
+    assert test_cursor0[0] == -4096
+
+
+def test_select_pragmas():
+    connection = csvblend.create_database(":memory:", {"cache_size": -4096})
+    result = csvblend.select_pragmas(connection, ["cache_size", "synchronous"])
+    assert result == {"cache_size": -4096, "synchronous": 2}
+
+
 def test_create_table(tmp_path: Path):
     def _normalize_text(text):
         return " ".join(re.findall(r"\S+", text))
@@ -68,6 +84,98 @@ def test_create_table(tmp_path: Path):
     """)
 
 
+def test_create_table_not_unique(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(
+        connection, test_table, test_columns, test_indexes, unique=False
+    )
+    test_cursor0 = connection.execute("""
+        SELECT count(*) FROM sqlite_master
+        WHERE type='index';
+    """).fetchone()
+    assert test_cursor0[0] == 0
+
+
+def test_create_table_without_rowid(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(
+        connection,
+        test_table,
+        test_columns,
+        test_indexes,
+        types=["TEXT", "TEXT", "REAL"],
+        without_rowid=True,
+    )
+    assert csvblend.select_without_rowid(connection, test_table) is True
+    assert csvblend.select_columns(connection, test_table) == {
+        "first_name": "TEXT",
+        "last_name": "TEXT",
+        "score": "REAL",
+    }
+    assert csvblend.select_unique_indexes(connection, test_table) == [test_indexes]
+    cursor = csvblend.create_counter(connection, test_table)
+    assert isinstance(cursor, sqlite3.Cursor)
+    cursor = csvblend.insert_values(
+        connection,
+        test_table,
+        test_columns,
+        test_indexes,
+        [("Yú", "花", 3.87), ("Yú", "花", 4.0), ("Nuó", "辛", 0.73)],
+    )
+    assert cursor.rowcount == 3
+    assert csvblend.select_counter(connection, test_table).fetchall() == [(2,)]
+    # The rows are stored in index order
+    assert csvblend.select_values(connection, test_table, test_columns).fetchall() == [
+        ("Nuó", "辛", 0.73),
+        ("Yú", "花", 4.0),
+    ]
+
+
+def test_add_column(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(connection, test_table, test_columns, test_indexes)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values[:1]
+    )
+    cursor = csvblend.add_column(connection, test_table, "day", "DATE")
+    assert isinstance(cursor, sqlite3.Cursor)
+    csvblend.add_column(connection, test_table, "note")
+    assert csvblend.select_columns(connection, test_table) == {
+        **dict.fromkeys(test_columns, "TEXT"),
+        "day": "DATE",
+        "note": "",
+    }
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == [(*test_values[0], None, None)]
+
+
+def test_create_index(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT);
+    """)
+    cursor = csvblend.create_index(connection, test_table, test_indexes)
+    assert isinstance(cursor, sqlite3.Cursor)
+    test_cursor0 = connection.execute(f"""
+        PRAGMA index_list({test_table});
+    """).fetchall()
+    assert [(i[1], i[2]) for i in test_cursor0] == [(f"{test_table}_unique", 1)]
+    # The index is a valid ON CONFLICT target
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values
+    )
+    test_cursor1 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor1 == list(dict.fromkeys(test_values))
+
+
 def test_insert_values(tmp_path: Path):
     test_database = tmp_path / "test.db"
     connection = sqlite3.connect(str(test_database))
@@ -102,6 +210,175 @@ def test_insert_values_all_indexes(tmp_path: Path):
     assert test_cursor0 == list(dict.fromkeys(test_values))
 
 
+def test_insert_values_conflicts(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    columns = ["id", "first", "coalesce", "max", "min", "day"]
+    csvblend.create_table(connection, test_table, columns, ["id"])
+    conflicts = {"first": "first", "coalesce": "coalesce", "max": "max", "min": "min"}
+    values = [
+        ("1", "a", "b", "2", None, "2024-01-02"),
+        ("1", "c", "", "3", "5", "2024-01-03"),
+        ("1", "d", "e", None, "4", "2024-01-01"),
+    ]
+    cursor = csvblend.insert_values(
+        connection, test_table, columns, ["id"], values, conflicts
+    )
+    assert cursor.rowcount == 3
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == [("1", "a", "e", "3", "4", "2024-01-01")]
+    # An unchanged row is not updated
+    cursor = csvblend.insert_values(
+        connection,
+        test_table,
+        columns,
+        ["id"],
+        [("1", "z", "", "1", "9", "2024-01-01")],
+        conflicts,
+    )
+    assert cursor.rowcount == 0
+    connection.execute(f"""
+        DELETE FROM {test_table};
+    """)
+    cursor = csvblend.insert_values(
+        connection, test_table, columns, ["id"], values, conflicts, "day"
+    )
+    # The older row is ignored
+    assert cursor.rowcount == 2
+    test_cursor1 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor1 == [("1", "a", "b", "3", "5", "2024-01-03")]
+
+
+def test_insert_staging(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT,
+        UNIQUE ("first_name", "last_name"));
+    """)
+    connection.execute(f"""
+        INSERT INTO {test_table} VALUES ("Hélène", "於", "¥1.00");
+    """)
+    cursor = csvblend.create_staging(connection, test_table, test_columns)
+    assert isinstance(cursor, sqlite3.Cursor)
+    csvblend.load_values(
+        connection, f"temp.{test_table}_staging", test_columns, test_values
+    )
+    cursor = csvblend.insert_staging(connection, test_table, test_columns, test_indexes)
+    assert isinstance(cursor, sqlite3.Cursor)
+    # 1 update and 7 inserts, as with insert_values()
+    assert cursor.rowcount == 8
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == list(dict.fromkeys([test_values[2]] + test_values))
+    test_cursor1 = connection.execute(f"""
+        SELECT count(*) from temp.{test_table}_staging;
+    """).fetchone()
+    assert test_cursor1[0] == 0
+
+
+def test_load_values(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT);
+    """)
+    cursor = csvblend.load_values(connection, test_table, test_columns, test_values)
+    assert isinstance(cursor, sqlite3.Cursor)
+    assert cursor.rowcount == 10
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == test_values
+
+
+def test_dedupe_values(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT);
+    """)
+    values = [
+        ("Maéna", "柴", "$0.47"),
+        ("Maïwenn", "车", "¥0.56"),
+        ("Maéna", "柴", "¥5.47"),
+        (None, "酆", "$1.39"),
+        ("Maéna", "柴", "€9.30"),
+        (None, "酆", "$1.39"),
+    ]
+    csvblend.load_values(connection, test_table, test_columns, values)
+    result = csvblend.dedupe_values(connection, test_table, test_columns, test_indexes)
+    assert result == 1
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == [
+        ("Maéna", "柴", "€9.30"),
+        ("Maïwenn", "车", "¥0.56"),
+        (None, "酆", "$1.39"),
+        (None, "酆", "$1.39"),
+    ]
+    # The merge table is unique afterwards
+    csvblend.create_index(connection, test_table, test_indexes)
+
+
+def test_dedupe_values_conflicts(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    columns = ["id", "first", "coalesce", "max", "min", "last"]
+    csvblend.create_table(connection, test_table, columns, ["id"], unique=False)
+    conflicts = {"first": "first", "coalesce": "coalesce", "max": "max", "min": "min"}
+    values = [
+        ("1", "a", "", "2", None, "x"),
+        ("2", "b", "", "1", "1", "y"),
+        ("1", "c", "d", "3", "5", "z"),
+        ("2", "e", None, None, None, None),
+        ("1", "f", "", None, "4", "w"),
+    ]
+    csvblend.load_values(connection, test_table, columns, values)
+    result = csvblend.dedupe_values(connection, test_table, columns, ["id"], conflicts)
+    assert result == 2
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    # The same values as insert_values() row by row
+    connection.execute(f"""
+        DELETE FROM {test_table};
+    """)
+    csvblend.create_index(connection, test_table, ["id"])
+    csvblend.insert_values(connection, test_table, columns, ["id"], values, conflicts)
+    test_cursor1 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == test_cursor1
+    assert test_cursor0 == [
+        ("1", "a", "d", "3", "4", "w"),
+        ("2", "b", "", "1", "1", None),
+    ]
+
+
+def test_dedupe_values_all_indexes(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT);
+    """)
+    csvblend.load_values(connection, test_table, test_columns, test_values)
+    result = csvblend.dedupe_values(connection, test_table, test_columns, test_columns)
+    assert result == 1
+    result = csvblend.dedupe_values(connection, test_table, test_columns, test_columns)
+    assert result == 0
+    test_cursor0 = connection.execute(f"""
+        SELECT * from {test_table};
+    """).fetchall()
+    assert test_cursor0 == list(dict.fromkeys(test_values))
+
+
 def test_select_values(tmp_path: Path):
     test_database = tmp_path / "test.db"
     connection = sqlite3.connect(str(test_database))
@@ -120,6 +397,85 @@ def test_select_values(tmp_path: Path):
     assert cursor.fetchall() == test_values
 
 
+def test_select_values_order_by_indexes(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT,
+        UNIQUE ("last_name", "first_name"));
+    """)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes[::-1], test_values
+    )
+    indexes = test_indexes[::-1]
+    cursor = csvblend.select_values(connection, test_table, test_columns, indexes)
+    assert cursor.fetchall() == sorted(
+        dict.fromkeys(test_values), key=lambda i: (i[1], i[0])
+    )
+    test_cursor0 = connection.execute(f"""
+        EXPLAIN QUERY PLAN
+        SELECT * FROM {test_table} ORDER BY "last_name", "first_name";
+    """).fetchall()
+    # The UNIQUE index is scanned, without a sort
+    assert "USE TEMP B-TREE" not in str(test_cursor0)
+
+
+def test_select_values_where(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT,
+        UNIQUE ("first_name", "last_name"));
+    """)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values
+    )
+    connection.execute(f"""
+        INSERT INTO {test_table} ("first_name", "last_name") VALUES ('Yú', NULL);
+    """)
+    where = [("first_name", frozenset(["Yú", "Hélène"]))]
+    cursor = csvblend.select_values(connection, test_table, ["score"], where=where)
+    assert set(cursor.fetchall()) == {("£3.87",), ("¥9.50",), (None,)}
+    where = [("first_name", ["Yú"]), ("last_name", [None, "贡"])]
+    cursor = csvblend.select_values(connection, test_table, test_columns, where=where)
+    assert cursor.fetchall() == [("Yú", None, None)]
+    where = [("first_name", [])]
+    cursor = csvblend.select_values(connection, test_table, test_columns, where=where)
+    assert cursor.fetchall() == []
+    cursor = csvblend.select_values(
+        connection, test_table, test_columns, test_indexes, limit=2
+    )
+    assert cursor.fetchall() == [("Faîtes", "闵", "€0.06"), ("Gaëlle", "俞", "¥7.17")]
+    test_cursor0 = connection.execute(f"""
+        EXPLAIN QUERY PLAN
+        SELECT * FROM {test_table} WHERE ("first_name" IN ('Yú'));
+    """).fetchall()
+    # A filter on a prefix of the indexes searches the UNIQUE index
+    assert "SEARCH" in str(test_cursor0)
+
+
+def test_select_keys(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(connection, test_table, test_columns, test_indexes)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values
+    )
+    keys = [("Hélène", "於"), ("Hélène", "花"), ("Yáo", "贺")]
+    rows = csvblend.select_keys(
+        connection, test_table, ["score"], test_indexes, keys[:1]
+    )
+    assert rows == [(0, "¥9.50")]
+    rows = csvblend.select_keys(connection, test_table, ["score"], test_indexes, keys)
+    assert sorted(rows) == [(0, "¥9.50"), (2, "£5.18")]
+    rows = csvblend.select_keys(connection, test_table, [], test_indexes, keys[1:])
+    assert rows == [(1,)]
+    test_cursor0 = connection.execute(f"""
+        SELECT count(*) from temp.{test_table}_keys;
+    """).fetchone()
+    assert test_cursor0[0] == 0
+
+
 def test_select_count(tmp_path: Path):
     test_database = tmp_path / "test.db"
     connection = sqlite3.connect(str(test_database))
@@ -136,3 +492,199 @@ def test_select_count(tmp_path: Path):
     cursor = csvblend.select_count(connection, test_table)
     assert isinstance(cursor, sqlite3.Cursor)
     assert cursor.fetchall() == [(10,)]
+
+
+def test_select_count_rowid(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT);
+    """)
+    cursor = csvblend.select_rowid(connection, test_table)
+    assert cursor.fetchall() == [(0,)]
+    connection.executemany(
+        f"""
+        INSERT INTO {test_table} ("first_name", "last_name", "score")
+        VALUES (?, ?, ?);
+    """,
+        test_values,
+    )
+    rowid = csvblend.select_rowid(connection, test_table).fetchone()[0]
+    assert rowid == 10
+    connection.executemany(
+        f"""
+        INSERT INTO {test_table} ("first_name", "last_name", "score")
+        VALUES (?, ?, ?);
+    """,
+        test_values[:3],
+    )
+    cursor = csvblend.select_count(connection, test_table, rowid)
+    assert cursor.fetchall() == [(3,)]
+
+
+def test_create_changes(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    connection.execute(f"""
+        CREATE TABLE {test_table} ("first_name" TEXT, "last_name" TEXT, "score" TEXT,
+        UNIQUE ("first_name", "last_name"));
+    """)
+    cursor = csvblend.create_changes(connection, test_table)
+    assert isinstance(cursor, sqlite3.Cursor)
+    csvblend.update_sequence(connection, test_table, 1)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values[:3]
+    )
+    csvblend.update_sequence(connection, test_table, 2)
+    csvblend.insert_values(
+        connection,
+        test_table,
+        test_columns,
+        test_indexes,
+        [("Yú", "花", "£3.87"), ("Marlène", "贡", "€0.00"), ("Gaëlle", "俞", "¥7.17")],
+    )
+    test_cursor0 = connection.execute(f"""
+        SELECT merge, id FROM {test_table}_changes;
+    """).fetchall()
+    # The unchanged row is not recorded
+    assert test_cursor0 == [(1, 1), (1, 2), (1, 3), (2, 2), (2, 4)]
+    cursor = csvblend.select_changes(connection, test_table, test_columns, 1)
+    assert isinstance(cursor, sqlite3.Cursor)
+    assert cursor.fetchall() == [("Marlène", "贡", "€0.00"), ("Gaëlle", "俞", "¥7.17")]
+    cursor = csvblend.select_changes(connection, test_table, test_columns, 0)
+    assert len(cursor.fetchall()) == 4
+
+
+def test_select_columns(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    assert csvblend.select_columns(connection, test_table) == {}
+    csvblend.create_table(connection, test_table, test_columns, test_indexes)
+    assert csvblend.select_without_rowid(connection, test_table) is False
+    assert csvblend.select_columns(connection, test_table) == dict.fromkeys(
+        test_columns, "TEXT"
+    )
+    assert csvblend.select_unique_indexes(connection, test_table) == [test_indexes]
+
+
+def test_select_unique_indexes(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(
+        connection, test_table, test_columns, test_indexes, unique=False
+    )
+    assert csvblend.select_unique_indexes(connection, test_table) == []
+    csvblend.create_index(connection, test_table, test_indexes)
+    assert csvblend.select_unique_indexes(connection, test_table) == [test_indexes]
+
+
+def test_update_merge_count(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    assert csvblend.select_merge_count(connection) == 0
+    cursor = csvblend.update_merge_count(connection, 3)
+    assert isinstance(cursor, sqlite3.Cursor)
+    connection.commit()
+    connection.close()
+    connection = sqlite3.connect(str(test_database))
+    assert csvblend.select_merge_count(connection) == 3
+
+
+def test_insert_manifest(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    cursor = csvblend.create_manifest(connection, test_table)
+    assert isinstance(cursor, sqlite3.Cursor)
+    csvblend.create_manifest(connection, test_table)
+    cursor = csvblend.insert_manifest(connection, test_table, "a.csv", 10, "ab", 1)
+    assert isinstance(cursor, sqlite3.Cursor)
+    cursor = csvblend.select_manifest(connection, test_table, "a.csv", 10, "ab")
+    assert cursor.fetchall() == [(1,)]
+    cursor = csvblend.select_manifest(connection, test_table, "a.csv", 10, "cd")
+    assert cursor.fetchall() == []
+
+
+def test_update_checkpoint(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    cursor = csvblend.create_checkpoint(connection, test_table)
+    assert isinstance(cursor, sqlite3.Cursor)
+    csvblend.create_checkpoint(connection, test_table)
+    csvblend.update_checkpoint(connection, test_table, "a.csv", 10, "ab", 4, 1)
+    csvblend.update_checkpoint(connection, test_table, "a.csv", 10, "ab", 8, 2)
+    cursor = csvblend.select_checkpoint(connection, test_table, "a.csv", 10, "ab")
+    assert cursor.fetchall() == [(8, 2)]
+    cursor = csvblend.select_checkpoint(connection, test_table, "a.csv", 10, "cd")
+    assert cursor.fetchall() == []
+    csvblend.delete_checkpoint(connection, test_table, "a.csv")
+    cursor = csvblend.select_checkpoint(connection, test_table, "a.csv", 10, "ab")
+    assert cursor.fetchall() == []
+
+
+def test_create_changes_without_rowid(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(
+        connection, test_table, test_columns, test_indexes, without_rowid=True
+    )
+    csvblend.create_changes(connection, test_table, test_indexes)
+    csvblend.update_sequence(connection, test_table, 1)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values[:3]
+    )
+    csvblend.update_sequence(connection, test_table, 2)
+    csvblend.insert_values(
+        connection,
+        test_table,
+        test_columns,
+        test_indexes,
+        [("Yú", "花", "£3.87"), ("Marlène", "贡", "€0.00")],
+    )
+    cursor = csvblend.select_changes(
+        connection, test_table, test_columns, 1, test_indexes
+    )
+    assert cursor.fetchall() == [("Marlène", "贡", "€0.00")]
+    cursor = csvblend.select_changes(
+        connection, test_table, test_columns, 0, test_indexes
+    )
+    assert len(cursor.fetchall()) == 3
+
+
+def test_select_size(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(connection, test_table, test_columns, test_indexes)
+    connection.commit()
+    assert csvblend.select_size(connection) == test_database.stat().st_size
+
+
+def test_reset_database(tmp_path: Path):
+    test_database = tmp_path / "test.db"
+    connection = sqlite3.connect(str(test_database))
+    csvblend.create_table(connection, test_table, test_columns, test_indexes)
+    csvblend.create_changes(connection, test_table)
+    csvblend.create_manifest(connection, test_table)
+    csvblend.create_checkpoint(connection, test_table)
+    csvblend.create_staging(connection, test_table, test_columns)
+    csvblend.update_sequence(connection, test_table, 1)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values[:3]
+    )
+    csvblend.insert_manifest(connection, test_table, "a.csv", 10, "ab", 1)
+    csvblend.update_merge_count(connection, 1)
+    csvblend.reset_database(connection, test_table, changes=True, staging=True)
+    connection.commit()
+    assert csvblend.select_count(connection, test_table).fetchone() == (0,)
+    cursor = csvblend.select_manifest(connection, test_table, "a.csv", 10, "ab")
+    assert cursor.fetchall() == []
+    assert csvblend.select_merge_count(connection) == 0
+    cursor = csvblend.select_changes(connection, test_table, test_columns, 0)
+    assert cursor.fetchall() == []
+    # The schema is kept
+    csvblend.update_sequence(connection, test_table, 1)
+    csvblend.insert_values(
+        connection, test_table, test_columns, test_indexes, test_values[:2]
+    )
+    assert csvblend.select_rowid(connection, test_table).fetchone() == (2,)
+    cursor = csvblend.select_changes(connection, test_table, test_columns, 0)
+    assert cursor.fetchall() == test_values[:2]
@@ -1,10 +1,22 @@
+import asyncio
+import bz2
+import gzip
 import io
+import lzma
 import sqlite3
 from pathlib import Path
 
 import pytest
 
-from csvblend import MergeFiles, models
+from csvblend import (
+    AsyncMergeFiles,
+    DatabasePool,
+    MergeFiles,
+    MergeStats,
+    PartitionedMergeFiles,
+    Tuning,
+    models,
+)
 from csvblend.utils import hash_function
 
 test_columns = ["first_name", "last_name", "score"]
@@ -34,6 +46,11 @@ def test_mergefile___init__():
     assert mf._connection is None
     assert mf._table == "merge_table"
     assert mf._merge_count == 0
+    assert mf._bulk_load is True
+    assert mf._indexed is False
+    assert mf._engine == "upsert"
+    assert mf._tuning.pragmas() == {"journal_mode": "OFF", "synchronous": "OFF"}
+    assert mf.pragmas == {}
 
 
 def test_mergefile___init___with_database(tmp_path: Path):
@@ -67,9 +84,22 @@ def test_mergefile___init___exception():
         MergeFiles(test_columns + test_columns, test_indexes)
     with pytest.raises(ValueError, match="indexes contains duplicate items"):
         MergeFiles(test_columns, test_indexes + test_indexes)
+    with pytest.raises(
+        ValueError, match="engine should be one of upsert, staging, sorted"
+    ):
+        MergeFiles(test_columns, test_indexes, engine="invalid")
+    with pytest.raises(ValueError, match="run_size should be a positive number"):
+        MergeFiles(test_columns, test_indexes, engine="external", run_size=0)
+    with pytest.raises(ValueError, match="progress_rows should be a positive number"):
+        MergeFiles(test_columns, test_indexes, progress_rows=0)
+    with pytest.raises(ValueError, match="profile should be one of default, bulk"):
+        MergeFiles(test_columns, test_indexes, tuning="invalid")
+    with pytest.raises(ValueError, match="engine 'sorted' is not supported by"):
+        PartitionedMergeFiles(test_columns, test_indexes, 2, engine="sorted")
 
 
-def test_mergefile_merge():
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_merge(engine):
     test_headers = ",".join(test_columns)
     csvfiles = [
         f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
@@ -78,7 +108,7 @@ def test_mergefile_merge():
         f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥9.00\n",
         f"{test_headers}\nBérénice,屈,¥6.01\nAurélie,沙,€9.30\n",
     ]
-    mf = MergeFiles(test_columns, test_indexes)
+    mf = MergeFiles(test_columns, test_indexes, engine=engine)
     for csvfile in csvfiles:
         mf.merge(io.StringIO(csvfile))
     assert mf.affected_count == 6
@@ -96,7 +126,93 @@ def test_mergefile_merge():
     ]
 
 
-def test_mergefile_merge_noncontiguous_index():
+def test_tuning(mocker):
+    mocker.patch.object(models.utils, "available_memory", return_value=1 << 30)
+    tuning = Tuning.from_profile("bulk", mmap_size=0)
+    assert tuning.pragmas() == {
+        "page_size": 65536,
+        "journal_mode": "OFF",
+        "synchronous": "OFF",
+        "temp_store": "MEMORY",
+        "cache_size": -262144,
+        "mmap_size": 0,
+    }
+    assert tuning.split(4).pragmas()["cache_size"] == -65536
+    mocker.patch.object(models.utils, "available_memory", return_value=None)
+    assert "cache_size" not in tuning.pragmas()
+    assert Tuning.from_profile("low-memory").pragmas()["cache_size"] == -2048
+
+
+def test_tuning_exception():
+    with pytest.raises(ValueError, match="pragmas should be in page_size, "):
+        Tuning(user_version=1)
+    with pytest.raises(ValueError, match="invalid pragma value: '1; DROP'"):
+        Tuning(temp_store="1; DROP")
+    with pytest.raises(ValueError, match=r"memory_fraction should be in \(0, 1\]"):
+        Tuning(memory_fraction=0)
+
+
+@pytest.mark.parametrize("tuning", list(Tuning.PROFILES))
+def test_mergefile_merge_tuning(tmp_path: Path, tuning):
+    test_headers = ",".join(test_columns)
+    mf = MergeFiles(
+        test_columns, test_indexes, str(tmp_path / "test.db"), tuning=tuning
+    )
+    mf.merge(io.StringIO(f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n"))
+    assert mf.rowcount == 2
+    assert set(mf.pragmas) == set(Tuning.PRAGMAS)
+    assert mf.pragmas["journal_mode"] == "off"
+    if tuning == "low-memory":
+        assert mf.pragmas["page_size"] == 4096
+        assert mf.pragmas["cache_size"] == -2048
+    if tuning == "bulk":
+        assert mf.pragmas["page_size"] == 65536
+        assert mf.pragmas["temp_store"] == 2
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+@pytest.mark.parametrize("bulk_load", [True, False])
+@pytest.mark.parametrize(
+    "csvfiles, affected_count, expected",
+    [
+        (
+            [
+                "Maéna,柴,$0.47\nMaïwenn,车,¥0.56\nMaéna,柴,¥5.47\n",
+                "Göran,酆,$1.39\nMaéna,柴,$0.47\nGöran,酆,$1.39\n",
+            ],
+            2,
+            [
+                ("Maéna", "柴", "$0.47"),
+                ("Maïwenn", "车", "¥0.56"),
+                ("Göran", "酆", "$1.39"),
+            ],
+        ),
+        # A short row updates the missing values to NULL
+        (
+            ["Maéna,柴,$0.47\nMaïwenn,车,¥0.56\n", "Maéna,柴\nMaïwenn,车,¥0.56\n"],
+            1,
+            [("Maéna", "柴", None), ("Maïwenn", "车", "¥0.56")],
+        ),
+    ],
+)
+def test_mergefile_merge_duplicates(
+    bulk_load, engine, csvfiles, affected_count, expected
+):
+    test_headers = ",".join(test_columns)
+    mf = MergeFiles(test_columns, test_indexes, bulk_load=bulk_load, engine=engine)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(f"{test_headers}\n{csvfile}"))
+    assert mf.affected_count == affected_count
+    assert mf.rowcount == len(expected)
+    assert mf._indexed is (mf._engine not in models.RUN_ENGINES)
+    if mf._engine in models.RUN_ENGINES:
+        # The rows are in index order
+        expected = sorted(expected)
+    assert list(mf.rows()) == expected
+
+
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_merge_noncontiguous_index(engine):
     columns = ["first_name", " ", "score", "email", " ip addr "]
     indexes = [" ", "email"]
     test_headers = ",".join(columns)
@@ -116,7 +232,7 @@ def test_mergefile_merge_noncontiguous_index():
         f"Torbjörn,那,¥7.93,cbarke8@ihg.com,232.157.135.140\n"
         f"Lyséa,胡,$3.05,bgorringe1@disqus.com,29.168.3.116\n",
     ]
-    mf = MergeFiles(columns, indexes)
+    mf = MergeFiles(columns, indexes, engine=engine)
     for csvfile in csvfiles:
         mf.merge(io.StringIO(csvfile))
     assert mf.affected_count == 6
@@ -134,6 +250,172 @@ def test_mergefile_merge_noncontiguous_index():
     ]
 
 
+def test_mergefile_merge_sorted():
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nAurélie,沙,€9.30\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nGöran,酆,$1.39\nMaéna,柴,¥5.47\nMaéna,柴,$0.47\n",
+        f"{test_headers}\n",
+        f"{test_headers}\nBérénice,屈,¥6.01\nMaïwenn,车,¥9.00\nMaïwenn,车,\n",
+    ]
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf1 = MergeFiles(test_columns, test_indexes, engine="sorted")
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile))
+        mf1.merge(io.StringIO(csvfile))
+        assert mf1.affected_count == mf0.affected_count
+        assert mf1.rowcount == mf0.rowcount
+    assert mf1.affected_count == 6
+    assert mf1._engine == "sorted"
+    assert mf1._connection is None
+    assert list(mf1.rows()) == sorted(mf0.rows())
+    run = Path(mf1._run)
+    mf1.cleanup()
+    assert not run.exists()
+    assert not run.parent.exists()
+
+
+def test_mergefile_merge_sorted_fallback():
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nAurélie,沙,€9.30\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nGöran,酆,$1.39\nMaéna,柴,¥5.47\nAurélie,沙,€1.00\n"
+        "Maéna,柴,$0.47\n",
+        f"{test_headers}\nBérénice,屈,¥6.01\nAurélie,沙,€9.30\n",
+    ]
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf1 = MergeFiles(test_columns, test_indexes, engine="sorted")
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile))
+        mf1.merge(io.StringIO(csvfile))
+        assert mf1.affected_count == mf0.affected_count
+        assert mf1.rowcount == mf0.rowcount
+    assert mf1.affected_count == 6
+    assert mf1._engine == "upsert"
+    assert mf1._run is None
+    assert sorted(mf1.rows()) == sorted(mf0.rows())
+
+
+def test_mergefile_merge_many_sorted_fallback(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nAurélie,沙,€9.30\nMaéna,柴,$0.47\n",
+        f"{test_headers}\nGöran,酆,$1.39\nMaéna,柴,¥5.47\n",
+        f"{test_headers}\nMaéna,柴,$0.47\nAurélie,沙,€1.00\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_text(csvfile)
+        paths.append(str(path))
+    mf = MergeFiles(test_columns, test_indexes, engine="sorted")
+    mf.merge_many(paths[:2], workers=1)
+    assert mf._engine == "sorted"
+    assert (mf.affected_count, mf.rowcount) == (2, 3)
+    mf.merge_many(paths, workers=1)
+    assert mf._engine == "upsert"
+    assert (mf.affected_count, mf.rowcount) == (6, 3)
+    assert mf._merge_count == 5
+    assert sorted(mf.rows()) == [
+        ("Aurélie", "沙", "€1.00"),
+        ("Göran", "酆", "$1.39"),
+        ("Maéna", "柴", "$0.47"),
+    ]
+
+
+def test_mergefile_merge_external():
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\nAurélie,沙,€9.30\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\nMaéna,柴,$0.47\n"
+        "Aurélie,沙,€9.30\nMaéna,柴,\n",
+        f"{test_headers}\n",
+        f"{test_headers}\nMaïwenn,车,¥9.00\nBérénice,屈,¥6.01\nMaïwenn,车,¥0.56\n",
+    ]
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf1 = MergeFiles(test_columns, test_indexes, engine="external", run_size=2)
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile))
+        mf1.merge(io.StringIO(csvfile))
+        assert mf1.affected_count == mf0.affected_count
+        assert mf1.rowcount == mf0.rowcount
+    assert mf1.affected_count == 7
+    assert mf1._engine == "external"
+    assert list(mf1.rows()) == sorted(mf0.rows())
+    # Only the merge run is left
+    assert len(list(Path(mf1._run).parent.iterdir())) == 1
+    mf1.cleanup()
+    assert not Path(mf1._run).parent.exists()
+
+
+def test_mergefile_merge_many_external(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nAurélie,沙,€9.30\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+        f"{test_headers}\nAurélie,沙,€1.00\nMaéna,柴,$0.47\nMaéna,柴,$0.47\n",
+        "first_name\nMaïwenn\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_text(csvfile)
+        paths.append(str(path))
+    mf = MergeFiles(test_columns, test_indexes, engine="external", run_size=1)
+    with pytest.raises(ValueError, match=r"fieldnames .+ must be a subset"):
+        mf.merge_many(paths)
+    assert (mf.affected_count, mf.rowcount, mf._merge_count) == (4, 3, 3)
+    assert list(mf.rows()) == [
+        ("Aurélie", "沙", "€1.00"),
+        ("Göran", "酆", "$1.39"),
+        ("Maéna", "柴", "$0.47"),
+    ]
+
+
+def test_mergefile_merge_external_fallback():
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nAurélie,沙,€9.30\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran\nMaéna,柴,$0.47\nGöran\n",
+    ]
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf1 = MergeFiles(test_columns, test_indexes, engine="external", run_size=2)
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile))
+        mf1.merge(io.StringIO(csvfile))
+    assert (mf1.affected_count, mf1.rowcount) == (mf0.affected_count, mf0.rowcount)
+    assert (mf1.affected_count, mf1.rowcount) == (4, 4)
+    assert mf1._engine == "upsert"
+    assert sorted(mf1.rows(), key=str) == sorted(mf0.rows(), key=str)
+    # More runs than combine_runs() merges at once
+    rows = [f"{i % 150},柴,${i}" for i in range(200)]
+    csvfile = "\n".join([test_headers, *rows, "7", ""])
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf1 = MergeFiles(test_columns, test_indexes, engine="external", run_size=2)
+    mf0.merge(io.StringIO(csvfile))
+    mf1.merge(io.StringIO(csvfile))
+    assert (mf1.affected_count, mf1.rowcount) == (mf0.affected_count, mf0.rowcount)
+    assert (mf1.affected_count, mf1.rowcount) == (0, 151)
+    assert mf1._engine == "upsert"
+    assert sorted(mf1.rows(), key=str) == sorted(mf0.rows(), key=str)
+
+
+def test_mergefile_merge_projection():
+    csvfiles = [
+        "extra,score,first_name,last_name\n1,$0.47,Maéna,柴\n2,¥0.56,Maïwenn,车\n",
+        "last_name,first_name,score\n柴,Maéna,¥5.47\n\n酆,Göran\n",
+    ]
+    mf = MergeFiles(test_columns, test_indexes)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    assert mf.affected_count == 2
+    assert list(mf.rows()) == [
+        ("Maéna", "柴", "¥5.47"),
+        ("Maïwenn", "车", "¥0.56"),
+        ("Göran", "酆", None),
+    ]
+
+
 def test_mergefile_merge_exception():
     test_headers = ",".join(test_columns)
     csvfiles = [
@@ -149,6 +431,78 @@ def test_mergefile_merge_exception():
             ValueError, match=r"fieldnames .+ must be a subset of columns"
         ):
             mf.merge(io.StringIO(csvfile))
+    with pytest.raises(ValueError, match=r"fieldnames .+ must be a subset of columns"):
+        mf.merge(io.StringIO(""))
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_merge_many(tmp_path: Path, engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,\"¥0.56\n\"\"\"\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\nMaéna,柴,$0.47\n",
+        f"{test_headers}\n",
+        f"{test_headers}\nAurélie,沙,€9.30\nMaïwenn,车,¥9.00",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_text(csvfile)
+        paths.append(str(path))
+    mf0 = MergeFiles(test_columns, test_indexes, engine=engine)
+    for path in paths:
+        with open(path, newline="") as fp:
+            mf0.merge(fp)
+    mf1 = MergeFiles(test_columns, test_indexes, engine=engine)
+    mf1.merge_many(paths, workers=2, chunk_size=1)
+    assert mf1.affected_count == mf0.affected_count == 5
+    assert mf1.rowcount == mf0.rowcount == 4
+    assert mf1._merge_count == mf0._merge_count == 4
+    assert list(mf1.rows()) == list(mf0.rows())
+
+
+def test_mergefile_merge_many_exception(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        "first_name,score\nMaéna,¥5.47\n",
+        f"{test_headers}\nAurélie,沙,€9.30\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_text(csvfile)
+        paths.append(str(path))
+    mf = MergeFiles(test_columns, test_indexes)
+    with pytest.raises(ValueError, match=r"fieldnames .+ must be a subset of columns"):
+        mf.merge_many(paths, workers=1)
+    # The csvfiles before the invalid csvfile are merged, as with merge()
+    assert mf.rowcount == 2
+    assert mf._merge_count == 1
+    with pytest.raises(FileNotFoundError):
+        mf.merge_many([str(tmp_path / "unknown.csv")], workers=1)
+
+
+@pytest.mark.parametrize("compress", [gzip.compress, bz2.compress, lzma.compress])
+def test_mergefile_merge_compressed(tmp_path: Path, compress):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f'{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,"¥0.56\n"""\n',
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_bytes(compress(csvfile.encode("utf-8")))
+        paths.append(str(path))
+    mf0 = MergeFiles(test_columns, test_indexes)
+    for path in paths:
+        assert mf0.merge_path(path)
+    mf1 = MergeFiles(test_columns, test_indexes)
+    mf1.merge_many(paths, workers=2, chunk_size=1)
+    assert mf1.rowcount == mf0.rowcount == 3
+    assert list(mf1.rows()) == list(mf0.rows())
+    assert ("Maïwenn", "车", '¥0.56\n"') in mf1.rows()
 
 
 def test_mergefile_rows():
@@ -166,6 +520,805 @@ def test_mergefile_rows():
         ("Maïwenn", "车", "¥0.56"),
         ("Göran", "酆", "$1.39"),
     ]
+    assert list(mf.rows(batch_size=1, order_by_index=True)) == [
+        ("Göran", "酆", "$1.39"),
+        ("Maéna", "柴", "¥5.47"),
+        ("Maïwenn", "车", "¥0.56"),
+    ]
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_rows_where(tmp_path: Path, engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\nGöran,酆,$1.39\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,\nAurélie,沙,€9.30\n",
+    ]
+    mf = MergeFiles(test_columns, test_indexes, engine=engine)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    where = {"first_name": ["Maéna", "Göran"]}
+    assert sorted(mf.rows(where=where)) == [
+        ("Göran", "酆", ""),
+        ("Maéna", "柴", "¥5.47"),
+    ]
+    assert list(mf.rows(order_by_index=True, columns=["score", "first_name"])) == [
+        ("€9.30", "Aurélie"),
+        ("", "Göran"),
+        ("¥5.47", "Maéna"),
+        ("¥0.56", "Maïwenn"),
+    ]
+    assert list(mf.rows(order_by_index=True, where={"score": ""}, limit=1)) == [
+        ("Göran", "酆", ""),
+    ]
+    assert len(list(mf.rows(limit=3))) == 3
+    assert list(mf.rows(where={"last_name": []})) == []
+    path = tmp_path / "merge.csv"
+    mf.write_csv(str(path), columns=["last_name"], where={"first_name": "Maïwenn"})
+    assert path.read_bytes() == "last_name\r\n车\r\n".encode()
+    with pytest.raises(ValueError, match="columns must be a non-empty subset"):
+        list(mf.rows(columns=["unknown"]))
+    with pytest.raises(ValueError, match="where must be a subset of columns"):
+        list(mf.rows(where={"unknown": "x"}))
+    with pytest.raises(ValueError, match="limit should not be negative"):
+        list(mf.rows(limit=-1))
+    with pytest.raises(ValueError, match="batch_size should be a positive number"):
+        list(mf.batches(0))
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_merge_where(tmp_path: Path, engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\nGöran,酆,$1.39\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$3.05\nAurélie,沙,€9.30\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        path = tmp_path / f"test{i}.csv"
+        path.write_text(csvfile)
+        paths.append(str(path))
+    where = {"first_name": ["Maéna", "Aurélie"]}
+    mf0 = MergeFiles(test_columns, test_indexes, engine=engine)
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile), where=where)
+    mf1 = MergeFiles(test_columns, test_indexes, engine=engine)
+    mf1.merge_many(paths, workers=1, where=where)
+    assert sorted(mf1.rows()) == sorted(mf0.rows())
+    assert sorted(mf1.rows()) == [("Aurélie", "沙", "€9.30"), ("Maéna", "柴", "¥5.47")]
+    assert mf1.affected_count == mf0.affected_count == 2
+    mf2 = MergeFiles(test_columns, test_indexes, types={"score": "real"})
+    mf2.merge(io.StringIO(f"{test_headers}\nMaéna,柴,0.47\nGöran,酆,\n"))
+    # The filter values are converted as the csv values are
+    assert list(mf2.rows(where={"score": ["0.47"]})) == [("Maéna", "柴", 0.47)]
+    assert list(mf2.rows(where={"score": None})) == [("Göran", "酆", None)]
+    with pytest.raises(ValueError, match="where must be a subset of columns"):
+        mf2.merge(io.StringIO(csvfiles[0]), where={"unknown": "x"})
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_batches(engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+    ]
+    mf = MergeFiles(test_columns, test_indexes, engine=engine)
+    assert list(mf.batches()) == []
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    assert list(mf.batches(2, order_by_index=True)) == [
+        [("Göran", "酆", "$1.39"), ("Maéna", "柴", "¥5.47")],
+        [("Maïwenn", "车", "¥0.56")],
+    ]
+
+
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+@pytest.mark.parametrize("bulk_load", [True, False])
+def test_mergefile_changes(bulk_load, engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\nMaéna,柴,$0.48\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nGöran,酆,$1.39\nAurélie,沙,€9.30\n",
+    ]
+    mf = MergeFiles(
+        test_columns,
+        test_indexes,
+        bulk_load=bulk_load,
+        engine=engine,
+        track_changes=True,
+    )
+    assert list(mf.changes()) == []
+    mf.merge(io.StringIO(csvfiles[0]))
+    assert list(mf.changes()) == [("Maéna", "柴", "$0.48"), ("Maïwenn", "车", "¥0.56")]
+    mf.merge(io.StringIO(csvfiles[1]))
+    assert list(mf.changes()) == [("Maéna", "柴", "¥5.47"), ("Göran", "酆", "$1.39")]
+    mf.merge(io.StringIO(csvfiles[2]))
+    assert list(mf.changes()) == [("Aurélie", "沙", "€9.30")]
+    assert list(mf.changes(since_merge=1, batch_size=1)) == [
+        ("Maéna", "柴", "¥5.47"),
+        ("Göran", "酆", "$1.39"),
+        ("Aurélie", "沙", "€9.30"),
+    ]
+    assert list(mf.changes(since_merge=0)) == list(mf.rows())
+
+
+def test_mergefile_changes_exception():
+    with pytest.raises(ValueError, match="engine 'sorted' does not support"):
+        MergeFiles(test_columns, test_indexes, engine="sorted", track_changes=True)
+    mf = MergeFiles(test_columns, test_indexes)
+    with pytest.raises(ValueError, match="changes\\(\\) requires track_changes"):
+        next(mf.changes())
+    mf = MergeFiles(test_columns, test_indexes, track_changes=True)
+    with pytest.raises(ValueError, match="batch_size should be a positive number"):
+        next(mf.changes(batch_size=0))
+
+
+@pytest.mark.parametrize("bulk_load", [True, False])
+def test_mergefile_persist(tmp_path: Path, bulk_load):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+        f"{test_headers}\nAurélie,沙,€9.30\nMaïwenn,车,¥0.56\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        paths.append(tmp_path / f"{i}.csv")
+        paths[-1].write_text(csvfile, encoding="utf-8")
+    db = str(tmp_path / "test.db")
+    options = {"bulk_load": bulk_load, "track_changes": True, "persist": True}
+    with MergeFiles(test_columns, test_indexes, db, **options) as mf:
+        assert mf.merge_path(paths[0]) is True
+        assert mf.merge_path(paths[0]) is False
+        assert mf.merge_path(paths[1]) is True
+    assert Path(db).exists()
+    with MergeFiles(test_columns, test_indexes, db, **options) as mf:
+        assert [mf.merge_path(i) for i in paths] == [False, False, True]
+        assert mf._merge_count == 3
+        assert mf.affected_count == 1
+        assert mf.rowcount == 4
+        assert list(mf.changes()) == [("Aurélie", "沙", "€9.30")]
+        assert list(mf.rows()) == [
+            ("Maéna", "柴", "¥5.47"),
+            ("Maïwenn", "车", "¥0.56"),
+            ("Göran", "酆", "$1.39"),
+            ("Aurélie", "沙", "€9.30"),
+        ]
+    paths[1].write_text(f"{test_headers}\nMaéna,柴,$0.47\n", encoding="utf-8")
+    with MergeFiles(test_columns, test_indexes, db, persist=True) as mf:
+        # A changed csvfile is merged again
+        assert [mf.merge_path(i) for i in paths] == [False, True, False]
+        assert list(mf.changes(since_merge=3)) == [("Maéna", "柴", "$0.47")]
+    assert Path(db).exists()
+
+
+def test_mergefile_persist_where(tmp_path: Path):
+    path = tmp_path / "test.csv"
+    path.write_text(
+        f"{','.join(test_columns)}\nMaéna,柴,$0.47\nGöran,酆,$1.39\n",
+        encoding="utf-8",
+    )
+    db = str(tmp_path / "test.db")
+    with MergeFiles(test_columns, test_indexes, db, persist=True) as mf:
+        # A filtered merge does not skip the other rows of the csvfile
+        assert mf.merge_path(path, where={"first_name": "Maéna"}) is True
+        assert mf.merge_path(path, where={"first_name": "Göran"}) is True
+        assert mf.rowcount == 2
+        assert mf.merge_path(path) is True
+        assert mf.merge_path(path) is False
+
+
+def test_mergefile_persist_merge_many(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+        f"{test_headers}\nAurélie,沙,€9.30\nMaïwenn,车,¥0.56\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        paths.append(str(tmp_path / f"{i}.csv"))
+        Path(paths[-1]).write_text(csvfile, encoding="utf-8")
+    db = str(tmp_path / "test.db")
+    with MergeFiles(test_columns, test_indexes, db, persist=True) as mf:
+        assert mf.merge_path(paths[0]) is True
+        # The csvfiles before the missing one are merged, and recorded
+        with pytest.raises(FileNotFoundError):
+            mf.merge_many([*paths, paths[1], str(tmp_path / "missing.csv")], 1)
+        assert (mf._merge_count, mf.affected_count, mf.rowcount) == (3, 3, 4)
+    with MergeFiles(test_columns, test_indexes, db, persist=True) as mf:
+        mf.merge_many(paths, 1)
+        assert (mf._merge_count, mf.affected_count, mf.rowcount) == (3, 0, 4)
+        assert [mf.merge_path(i) for i in paths] == [False, False, False]
+        # A filtered merge uses no manifest
+        mf.merge_many(paths[:1], 1, where={"first_name": "Maéna"})
+        assert mf._merge_count == 4
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_merge_path_temporary(tmp_path: Path, mocker, engine):
+    path = tmp_path / "test.csv"
+    path.write_text(f"{','.join(test_columns)}\nMaéna,柴,$0.47\n", encoding="utf-8")
+    checksum_file = mocker.spy(models.utils, "checksum_file")
+    with MergeFiles(test_columns, test_indexes, engine=engine) as mf:
+        # A temporary database keeps no manifest
+        assert mf.merge_path(path) is True
+        assert mf.merge_path(path) is True
+        assert mf.rowcount == 1
+    checksum_file.assert_not_called()
+
+
+def test_mergefile_persist_exception(tmp_path: Path):
+    db = str(tmp_path / "test.db")
+    test_types = {"score": "real"}
+    with pytest.raises(ValueError, match="persist requires a database file"):
+        MergeFiles(test_columns, test_indexes, persist=True)
+    with pytest.raises(ValueError, match="engine 'sorted' does not support persist"):
+        MergeFiles(test_columns, test_indexes, db, engine="sorted", persist=True)
+    with pytest.raises(ValueError, match="persist is not supported by partitions"):
+        PartitionedMergeFiles(test_columns, test_indexes, persist=True)
+    with MergeFiles(test_columns, test_indexes, db, persist=True) as mf:
+        mf.merge(io.StringIO(",".join(test_columns)))
+    mf = MergeFiles(test_columns[:2], test_indexes, db, persist=True)
+    with pytest.raises(ValueError, match="columns do not match columns"):
+        mf.merge(io.StringIO(",".join(test_columns)))
+    mf = MergeFiles(test_columns, test_indexes[:1], db, persist=True)
+    with pytest.raises(ValueError, match="indexes do not match indexes"):
+        mf.merge(io.StringIO(",".join(test_columns)))
+    assert mf._connection is None
+    mf = MergeFiles(test_columns, test_indexes, db, persist=True, types=test_types)
+    with pytest.raises(ValueError, match="types do not match types"):
+        mf.merge(io.StringIO(",".join(test_columns)))
+    mf = MergeFiles(test_columns, test_indexes, db, persist=True, without_rowid=True)
+    with pytest.raises(ValueError, match="without_rowid does not match"):
+        mf.merge(io.StringIO(",".join(test_columns)))
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_commit_rows(tmp_path: Path, engine):
+    test_headers = ",".join(test_columns)
+    rows = [f'Maéna{i % 7},"柴\r\n{i}",${i}' for i in range(20)]
+    path = tmp_path / "test.csv"
+    path.write_text("\r\n".join([test_headers, *rows, ""]), encoding="utf-8")
+    db = str(tmp_path / "test.db")
+    mf0 = MergeFiles(test_columns, test_indexes, engine=engine)
+    mf0.merge_path(path)
+
+    def progress(stats):
+        if stats.rows_read >= 12:
+            raise Interrupted
+
+    options = {"engine": engine, "persist": True, "commit_rows": 5}
+    mf1 = MergeFiles(
+        test_columns, test_indexes, db, progress=progress, progress_rows=1, **options
+    )
+    with pytest.raises(Interrupted):
+        mf1.merge_path(path)
+    mf1.cleanup()
+    with MergeFiles(test_columns, test_indexes, db, **options) as mf1:
+        # The merge resumes after the last checkpoint
+        assert mf1.merge_path(path) is True
+        assert mf1.last_merge_stats.rows_read == 10
+        assert mf1.merge_path(path) is False
+        assert list(mf1.rows()) == list(mf0.rows())
+        cursor = mf1._connection.execute(f"SELECT * FROM {mf1._table}_checkpoint")
+        assert cursor.fetchall() == []
+    mf2 = MergeFiles(test_columns, test_indexes, engine=engine, commit_seconds=0.01)
+    mf2.merge_path(path)
+    assert list(mf2.rows()) == list(mf0.rows())
+
+
+def test_mergefile_commit_rows_progress(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    rows = [f"Maéna{i},柴,${i}" for i in range(3000)]
+    path = tmp_path / "test.csv"
+    path.write_text("\n".join([test_headers, *rows, ""]), encoding="utf-8")
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf0.merge_path(path)
+    rows_read = []
+
+    def progress(stats):
+        rows_read.append(stats.rows_read)
+        raise Interrupted
+
+    db = str(tmp_path / "test.db")
+    options = {"persist": True, "commit_rows": 1000}
+    mf1 = MergeFiles(
+        test_columns, test_indexes, db, progress=progress, progress_rows=1500, **options
+    )
+    with pytest.raises(Interrupted):
+        mf1.merge_path(path)
+    mf1.cleanup()
+    # The checkpoints are not counted as rows
+    assert 1500 <= rows_read[0] < 1510
+    with MergeFiles(test_columns, test_indexes, db, **options) as mf1:
+        # The rows read ahead of a checkpoint are not skipped
+        assert mf1.merge_path(path) is True
+        assert mf1.last_merge_stats.rows_read == 2000
+        assert mf1.rowcount == 3000
+        assert list(mf1.rows()) == list(mf0.rows())
+
+
+def test_mergefile_commit_rows_journal(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    # Each commit is larger than the cache, so pages are written before it
+    rows = [f"Maéna{i % 3001},{'柴' * 20}{i % 7},${i}" for i in range(12000)]
+    path = tmp_path / "test.csv"
+    path.write_text("\n".join([test_headers, *rows, ""]), encoding="utf-8")
+    mf0 = MergeFiles(test_columns, test_indexes)
+    mf0.merge_path(path)
+
+    def progress(stats):
+        if stats.rows_read >= 9000:
+            raise Interrupted
+
+    db = str(tmp_path / "test.db")
+    tuning = Tuning(cache_size=20, journal_mode="WAL", synchronous="NORMAL")
+    options = {"persist": True, "bulk_load": False, "commit_rows": 4000}
+    mf1 = MergeFiles(
+        test_columns,
+        test_indexes,
+        db,
+        tuning=tuning,
+        progress=progress,
+        progress_rows=1000,
+        **options,
+    )
+    with pytest.raises(Interrupted):
+        mf1.merge_path(path)
+    mf1.cleanup()
+    connection = sqlite3.connect(db)
+    assert connection.execute("PRAGMA integrity_check;").fetchall() == [("ok",)]
+    connection.close()
+    with MergeFiles(test_columns, test_indexes, db, **options) as mf1:
+        assert mf1.merge_path(path) is True
+        assert mf1.pragmas["journal_mode"] == "wal"
+        assert mf1.last_merge_stats.rows_read == 4000
+        assert mf1.rowcount == mf0.rowcount
+        assert list(mf1.rows()) == list(mf0.rows())
+
+
+def test_mergefile_commit_rows_exception():
+    with pytest.raises(ValueError, match="engine 'sorted' does not support commit"):
+        MergeFiles(test_columns, test_indexes, engine="sorted", commit_rows=5)
+    with pytest.raises(ValueError, match="commit_rows should be a positive number"):
+        MergeFiles(test_columns, test_indexes, commit_rows=0)
+    with pytest.raises(ValueError, match="commit_seconds should be a positive"):
+        MergeFiles(test_columns, test_indexes, commit_seconds=0)
+    with pytest.raises(ValueError, match="commit_rows requires a journal"):
+        MergeFiles(test_columns, test_indexes, commit_rows=5, tuning=Tuning())
+    with pytest.raises(ValueError, match="commit_rows is not supported by"):
+        PartitionedMergeFiles(test_columns, test_indexes, 2, commit_rows=5)
+
+
+@pytest.mark.parametrize("without_rowid", [False, True])
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_merge_types(tmp_path: Path, engine, without_rowid):
+    test_headers = "id,day,score,name"
+    csvfiles = [
+        f"{test_headers}\n2,2024-01-02,1.5,Maéna\n10,2024-01-02,2,Maïwenn\n",
+        f"{test_headers}\n2,2024-01-02,1.50,Maéna\n3,2024-01-01,,Göran\n",
+        f"{test_headers}\n10,2024-01-02,3.25,Maïwenn\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        paths.append(tmp_path / f"{i}.csv")
+        paths[-1].write_text(csvfile, encoding="utf-8")
+    types = {"id": "integer", "day": "date", "score": "real"}
+    test_rows = [
+        (2, "2024-01-02", 1.5, "Maéna"),
+        (3, "2024-01-01", None, "Göran"),
+        (10, "2024-01-02", 3.25, "Maïwenn"),
+    ]
+    mf = MergeFiles(
+        test_headers.split(","),
+        ["id", "day"],
+        engine=engine,
+        types=types,
+        without_rowid=without_rowid,
+    )
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    # "1.50" is the same real as "1.5"
+    assert mf.affected_count == 2
+    assert mf.rowcount == 3
+    assert list(mf.rows(order_by_index=True)) == test_rows
+    mf = MergeFiles(
+        test_headers.split(","),
+        ["id", "day"],
+        engine=engine,
+        types=types,
+        without_rowid=without_rowid,
+    )
+    mf.merge_many(paths, workers=1)
+    assert mf.affected_count == 2
+    assert mf.rowcount == 3
+    assert list(mf.rows(order_by_index=True)) == test_rows
+
+
+def test_mergefile_merge_types_exception():
+    with pytest.raises(ValueError, match="types must be a subset of columns"):
+        MergeFiles(test_columns, test_indexes, types={"unknown": "integer"})
+    with pytest.raises(ValueError, match="types should be in integer, real"):
+        MergeFiles(test_columns, test_indexes, types={"score": "decimal"})
+    mf = MergeFiles(test_columns, test_indexes, types={"score": "real"})
+    with pytest.raises(ValueError, match="could not convert string to float"):
+        mf.merge(io.StringIO(f"{','.join(test_columns)}\nMaéna,柴,$0.47\n"))
+
+
+@pytest.mark.parametrize("bulk_load", [True, False])
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_merge_conflicts(engine, bulk_load):
+    test_headers = "id,name,email,score,day"
+    csvfiles = [
+        f"{test_headers}\n1,Maéna,,2,2024-01-02\n2,Göran,g@x,5,2024-01-02\n"
+        f"1,Maëna,m@x,1,2024-01-01\n",
+        f"{test_headers}\n1,Maïwenn,,7,2024-01-03\n2,Gøran,,3,2024-01-01\n",
+    ]
+    conflicts = {"name": "first", "email": "coalesce", "score": "max"}
+    options = {"engine": engine, "bulk_load": bulk_load, "types": {"score": "real"}}
+    mf = MergeFiles(test_headers.split(","), ["id"], conflicts=conflicts, **options)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    assert mf.affected_count == 2
+    assert list(mf.rows()) == [
+        ("1", "Maéna", "m@x", 7.0, "2024-01-03"),
+        ("2", "Göran", "g@x", 5.0, "2024-01-01"),
+    ]
+    mf = MergeFiles(
+        test_headers.split(","), ["id"], conflicts=conflicts, latest="day", **options
+    )
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    # The older rows are ignored
+    assert mf.affected_count == 1
+    assert list(mf.rows()) == [
+        ("1", "Maéna", "", 7.0, "2024-01-03"),
+        ("2", "Göran", "g@x", 5.0, "2024-01-02"),
+    ]
+
+
+def test_mergefile_merge_conflicts_exception():
+    with pytest.raises(ValueError, match="conflicts must be a subset of the non-in"):
+        MergeFiles(test_columns, test_indexes, conflicts={"first_name": "max"})
+    with pytest.raises(ValueError, match="conflicts should be in last, first"):
+        MergeFiles(test_columns, test_indexes, conflicts={"score": "sum"})
+    with pytest.raises(ValueError, match="latest should be a non-index column"):
+        MergeFiles(test_columns, test_indexes, latest="first_name")
+    with pytest.raises(ValueError, match="engine 'sorted' does not support conflicts"):
+        MergeFiles(test_columns, test_indexes, engine="sorted", latest="score")
+
+
+@pytest.mark.parametrize("bulk_load", [True, False])
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_merge_blend(tmp_path: Path, engine, bulk_load):
+    csvfiles = [
+        "id,name\n1,Maéna\n2,Göran\n1,Maïwenn\n",
+        "id,score\n2,5\n3,7\n",
+        "name,id,score,day\nAurélie,3,,2024-01-01\nYú,1,2,\n",
+    ]
+    paths = []
+    for i, csvfile in enumerate(csvfiles):
+        paths.append(tmp_path / f"{i}.csv")
+        paths[-1].write_text(csvfile, encoding="utf-8")
+    test_rows = [
+        ("1", "Yú", 2, ""),
+        ("2", "Göran", 5, None),
+        ("3", "Aurélie", None, "2024-01-01"),
+    ]
+    options = {"engine": engine, "bulk_load": bulk_load, "types": {"score": "integer"}}
+    mf = MergeFiles(["id"], ["id"], blend=True, **options)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    assert list(mf._columns.values()) == ["id", "name", "score", "day"]
+    # The missing columns of a csvfile are not updated
+    assert mf.affected_count == 4
+    assert mf.rowcount == 3
+    assert list(mf.rows()) == test_rows
+    mf = MergeFiles(["id"], ["id"], blend=True, **options)
+    mf.merge_many(paths, workers=1)
+    assert mf.affected_count == 4
+    assert list(mf.rows()) == test_rows
+    assert list(mf.rows(columns=["id", "day"], where={"day": [None]})) == [("2", None)]
+
+
+def test_mergefile_merge_blend_exception():
+    with pytest.raises(ValueError, match="engine 'sorted' does not support blend"):
+        MergeFiles(test_columns, test_indexes, engine="sorted", blend=True)
+    with pytest.raises(ValueError, match="blend does not support persist"):
+        MergeFiles(test_columns, test_indexes, "test.db", persist=True, blend=True)
+    with pytest.raises(ValueError, match="blend is not supported by partitions"):
+        PartitionedMergeFiles(test_columns, test_indexes, 2, blend=True)
+    mf = MergeFiles(test_columns, test_indexes, blend=True)
+    with pytest.raises(ValueError, match="must contain the indexes"):
+        mf.merge(io.StringIO("first_name,score\nMaéna,$0.47\n"))
+
+
+@pytest.mark.parametrize("without_rowid", [False, True])
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+@pytest.mark.parametrize("memory_limit", [0, 1 << 30])
+def test_mergefile_memory_limit(tmp_path: Path, memory_limit, engine, without_rowid):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\nGöran,酆,$1.39\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nAurélie,沙,€9.30\nGöran,酆,$1.39\n",
+        f"{test_headers}\nMaïwenn,车,¥9.00\nYú,花,£3.87\n",
+    ]
+    db = str(tmp_path / "test.db")
+    options = {"engine": engine, "without_rowid": without_rowid}
+    mf0 = MergeFiles(test_columns, test_indexes, **options)
+    mf1 = MergeFiles(
+        test_columns, test_indexes, db, memory_limit=memory_limit, **options
+    )
+    # Check the database size every 2 rows
+    mf1._check_rows = 2
+    for csvfile in csvfiles:
+        mf0.merge(io.StringIO(csvfile))
+        mf1.merge(io.StringIO(csvfile))
+        assert mf1._in_memory == (memory_limit > 0)
+        assert Path(db).exists() == (memory_limit == 0)
+        assert mf1.rowcount == mf0.rowcount
+        assert mf1.affected_count == mf0.affected_count
+    assert mf1.affected_count == 4
+    assert list(mf1.rows()) == list(mf0.rows())
+    mf0.cleanup()
+    mf1.cleanup()
+    assert not Path(db).exists()
+
+
+def test_mergefile_memory_limit_exception():
+    with pytest.raises(ValueError, match=r"memory_limit requires a database file"):
+        MergeFiles(test_columns, test_indexes, ":memory:", memory_limit=0)
+    with pytest.raises(ValueError, match="memory_limit does not support persist"):
+        MergeFiles(test_columns, test_indexes, "test.db", persist=True, memory_limit=0)
+    with pytest.raises(ValueError, match="memory_limit should not be negative"):
+        MergeFiles(test_columns, test_indexes, memory_limit=-1)
+    with pytest.raises(ValueError, match="memory_limit is not supported by"):
+        PartitionedMergeFiles(test_columns, test_indexes, 2, memory_limit=0)
+
+
+@pytest.mark.parametrize("engine", models.ENGINES)
+def test_mergefile_merge_stats(tmp_path: Path, engine):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nGöran,酆,$1.39\nMaéna,柴,¥5.47\nMaïwenn,车,¥0.56\n",
+    ]
+    metrics = []
+    progress = []
+    mf = MergeFiles(
+        test_columns,
+        test_indexes,
+        engine=engine,
+        metrics=metrics.append,
+        progress=lambda stats: progress.append(stats.rows_read),
+        progress_rows=2,
+    )
+    assert mf.last_merge_stats is None
+    mf.merge(io.StringIO(csvfiles[0]))
+    stats = mf.last_merge_stats
+    assert isinstance(stats, MergeStats)
+    assert (stats.rows_read, stats.inserted, stats.updated) == (2, 2, 0)
+    assert stats.bytes_read is None
+    path = tmp_path / "test.csv"
+    path.write_text(csvfiles[1], encoding="utf-8")
+    mf.merge_path(path)
+    stats = mf.last_merge_stats
+    assert (stats.rows_read, stats.inserted, stats.updated) == (3, 1, 1)
+    assert stats.unchanged == 1
+    assert stats.bytes_read == path.stat().st_size
+    assert stats.total_time >= stats.parse_time + stats.commit_time
+    assert stats.as_dict()["rows_per_second"] == stats.rows_per_second
+    assert metrics == [metrics[0], stats]
+    # Once per progress_rows rows, in each merge
+    assert progress == [2, 2]
+    mf.merge_many([path, path], workers=1)
+    stats = mf.last_merge_stats
+    if engine in models.RUN_ENGINES:
+        # The csvfiles are merged in one pass
+        assert len(metrics) == 3
+        assert stats.rows_read == 6
+        assert stats.bytes_read == path.stat().st_size * 2
+    else:
+        assert len(metrics) == 4
+        assert stats.rows_read == 3
+        assert stats.bytes_read == path.stat().st_size
+    assert stats.inserted == stats.updated == 0
+
+
+@pytest.mark.parametrize("without_rowid", [False, True])
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_get(engine, without_rowid):
+    test_headers = "id,day,score"
+    csvfiles = [
+        f"{test_headers}\n1,2024-01-02,1.5\n2,2024-01-02,2\n1,2024-01-03,3\n",
+        f"{test_headers}\n2,2024-01-02,4.5\n",
+    ]
+    mf = MergeFiles(
+        test_headers.split(","),
+        ["id", "day"],
+        engine=engine,
+        types={"id": "integer"},
+        without_rowid=without_rowid,
+        cache_size=2,
+    )
+    assert mf.get((1, "2024-01-02")) is None
+    mf.merge(io.StringIO(csvfiles[0]))
+    # The csv values of a typed index are converted
+    assert mf.get(("1", "2024-01-02")) == (1, "2024-01-02", "1.5")
+    assert mf.get((3, "2024-01-02"), ()) == ()
+    assert mf.get((2, "2024-01-02"), columns=["score"]) == ("2",)
+    keys = [(2, "2024-01-02"), (1, "2024-01-03"), (1, None), (2, "2024-01-02")]
+    assert mf.get_many(keys, ["score"]) == [("2",), ("3",), None, ("2",)]
+    assert len(mf._cache) == 2
+    assert mf.contains(keys) == [True, True, False, True]
+    # A merge clears the cache
+    mf.merge(io.StringIO(csvfiles[1]))
+    assert len(mf._cache) == 0
+    assert mf.get_many(keys[:1]) == [(2, "2024-01-02", "4.5")]
+
+
+def test_mergefile_get_exception():
+    with pytest.raises(ValueError, match="cache_size should not be negative"):
+        MergeFiles(test_columns, test_indexes, cache_size=-1)
+    mf = MergeFiles(test_columns, test_indexes)
+    with pytest.raises(ValueError, match="key should have a value for each index"):
+        mf.get("Maéna")
+    with pytest.raises(ValueError, match="columns must be a non-empty subset"):
+        mf.get(("Maéna", "柴"), columns=["unknown"])
+    mf = MergeFiles(test_columns, test_indexes, engine="sorted")
+    with pytest.raises(ValueError, match="engine 'sorted' does not support get_many"):
+        mf.get_many([("Maéna", "柴")])
+    mf.cleanup()
+    with pytest.raises(ValueError, match="Operation on closed MergeFile"):
+        mf.contains([("Maéna", "柴")])
+    mf = PartitionedMergeFiles(test_columns, test_indexes, 2)
+    with pytest.raises(ValueError, match="get_many is not supported by partitions"):
+        mf.get(("Maéna", "柴"))
+
+
+@pytest.mark.parametrize("without_rowid", [False, True])
+@pytest.mark.parametrize("engine", ["upsert", "staging"])
+def test_mergefile_pool(engine, without_rowid):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+    ]
+    expected = [("Maéna", "柴", "¥5.47"), ("Maïwenn", "车", "¥0.56")]
+    expected.append(("Göran", "酆", "$1.39"))
+    if without_rowid:
+        expected.sort()
+    options = {
+        "engine": engine,
+        "without_rowid": without_rowid,
+        "track_changes": True,
+    }
+    with DatabasePool(size=2) as pool:
+        pool.prefill(test_columns, test_indexes, **options)
+        assert len(pool) == 1
+        for _ in range(2):
+            with MergeFiles(test_columns, test_indexes, pool=pool, **options) as mf:
+                for csvfile in csvfiles:
+                    mf.merge(io.StringIO(csvfile))
+                assert len(pool) == 0
+                assert mf.rowcount == 3
+                assert mf.affected_count == 2
+                assert list(mf.rows()) == expected
+                changes = [i for i in expected if i[0] != "Maïwenn"]
+                assert list(mf.changes(1)) == changes
+                db = mf._db
+            # The database is returned empty
+            assert len(pool) == 1
+            assert Path(db).exists()
+        # Another merge plan does not take it
+        with MergeFiles(test_columns[::-1], test_indexes, pool=pool) as mf:
+            mf.merge(io.StringIO(f"{','.join(test_columns[::-1])}\n$0.47,柴,Maéna\n"))
+            assert mf._db != db
+        assert len(pool) == 2
+    assert not Path(db).exists()
+
+
+def test_mergefile_pool_size():
+    test_headers = ",".join(test_columns)
+    pool = DatabasePool(size=1)
+    pool.prefill(test_columns, test_indexes, count=2)
+    assert len(pool) == 1
+    # A database larger than max_size is removed on cleanup()
+    pool.max_size = 0
+    mf = MergeFiles(test_columns, test_indexes, pool=pool)
+    mf.merge(io.StringIO(f"{test_headers}\nMaéna,柴,$0.47\n"))
+    mf.cleanup()
+    assert len(pool) == 0
+    assert not Path(mf._db).exists()
+    pool.max_size = 1 << 20
+    # The connection can be taken by another thread
+    mf = AsyncMergeFiles(test_columns, test_indexes, pool=pool)
+
+    async def merge():
+        async with mf:
+            await mf.merge(io.StringIO(f"{test_headers}\nMaéna,柴,$0.47\n"))
+            return await mf.get(("Maéna", "柴"))
+
+    assert asyncio.run(merge()) == ("Maéna", "柴", "$0.47")
+    assert len(pool) == 1
+    with MergeFiles(test_columns, test_indexes, pool=pool) as mf:
+        assert mf.get(("Maéna", "柴")) is None
+    pool.close()
+    assert len(pool) == 0
+    # A database released after close() is removed
+    mf = MergeFiles(test_columns, test_indexes, pool=pool)
+    mf.merge(io.StringIO(test_headers))
+    mf.cleanup()
+    assert len(pool) == 0
+    assert not Path(mf._db).exists()
+
+
+def test_mergefile_pool_exception(tmp_path: Path):
+    test_message = "pool requires a temporary database"
+    pool = DatabasePool()
+    with pytest.raises(ValueError, match=test_message):
+        MergeFiles(test_columns, test_indexes, str(tmp_path / "test.db"), pool=pool)
+    with pytest.raises(ValueError, match=test_message):
+        MergeFiles(test_columns, test_indexes, memory_limit=0, pool=pool)
+    with pytest.raises(ValueError, match=test_message):
+        MergeFiles(test_columns, test_indexes, blend=True, pool=pool)
+    with pytest.raises(ValueError, match="engine 'sorted' does not support pool"):
+        MergeFiles(test_columns, test_indexes, engine="sorted", pool=pool)
+    with pytest.raises(ValueError, match="pool is not supported by partitions"):
+        PartitionedMergeFiles(test_columns, test_indexes, 2, pool=pool)
+    with pytest.raises(ValueError, match="size should be a positive number"):
+        DatabasePool(size=0)
+    with pytest.raises(ValueError, match="max_size should not be negative"):
+        DatabasePool(max_size=-1)
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_mergefile_write_csv(tmp_path: Path, compression):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+    ]
+    test_rows = "Maéna,柴,¥5.47\r\nMaïwenn,车,¥0.56\r\nGöran,酆,$1.39\r\n"
+    test_output = f"{test_headers}\r\n{test_rows}"
+    mf = MergeFiles(test_columns, test_indexes)
+    for csvfile in csvfiles:
+        mf.merge(io.StringIO(csvfile))
+    path = tmp_path / "merge.csv"
+    stats = mf.write_csv(path, compression=compression, batch_size=2)
+    assert stats["rows"] == 3
+    assert stats["bytes"] == len(test_output.encode())
+    content = path.read_bytes()
+    if compression == "gzip":
+        content = gzip.decompress(content)
+    assert content.decode() == test_output
+    fp = io.StringIO()
+    stats = mf.write_csv(fp, header=False, order_by_index=True)
+    assert stats["rows"] == 3
+    assert fp.getvalue() == "Göran,酆,$1.39\r\nMaéna,柴,¥5.47\r\nMaïwenn,车,¥0.56\r\n"
+    fp = io.BytesIO()
+    mf.write_csv(fp, compression=compression)
+    content = fp.getvalue()
+    if compression == "gzip":
+        content = gzip.decompress(content)
+    assert content.decode() == test_output
+
+
+def test_mergefile_write_csv_exception():
+    mf = MergeFiles(test_columns, test_indexes)
+    with pytest.raises(ValueError, match="compression should be one of"):
+        mf.write_csv(io.BytesIO(), compression="lzma")
+    with pytest.raises(ValueError, match="compression requires a path"):
+        mf.write_csv(io.StringIO(), compression="gzip")
+    with pytest.raises(ValueError, match="batch_size should be a positive number"):
+        mf.write_csv(io.StringIO(), batch_size=0)
 
 
 def test_mergefile_cleanup():
@@ -199,3 +1352,173 @@ def test_mergefile_cleanup_exception():
         mf.merge(io.StringIO(",".join(test_columns)))
     with pytest.raises(ValueError, match=test_message):
         next(mf.rows())
+    with pytest.raises(ValueError, match=test_message):
+        next(mf.batches())
+
+
+def test_partitionedmergefiles___init__():
+    mf = PartitionedMergeFiles(test_columns, test_indexes, 3, engine="staging")
+    assert mf._dbs == ["merge_files.0.db", "merge_files.1.db", "merge_files.2.db"]
+    assert mf._options["engine"] == "staging"
+    assert mf._options["tuning"].memory_fraction == mf._tuning.memory_fraction / 3
+    assert mf._engine == "staging"
+    assert mf._processes == []
+    with pytest.raises(ValueError, match="partitions should be a positive number"):
+        PartitionedMergeFiles(test_columns, test_indexes, -1)
+
+
+def test_partitionedmergefiles_merge(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+        f"{test_headers}\nAurélie,沙,€9.30\n",
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥9.00\n",
+        f"{test_headers}\nBérénice,屈,¥6.01\nAurélie,沙,€9.30\n",
+    ]
+    with PartitionedMergeFiles(test_columns, test_indexes, 3, str(tmp_path)) as mf:
+        assert list(mf.rows()) == []
+        for csvfile in csvfiles:
+            mf.merge(io.StringIO(csvfile))
+        assert mf.affected_count == 6
+        assert mf.rowcount == 5
+        assert mf._merge_count == 5
+        assert sorted(mf.rows()) == [
+            ("Aurélie", "沙", "€9.30"),
+            ("Bérénice", "屈", "¥6.01"),
+            ("Göran", "酆", "$1.39"),
+            ("Maéna", "柴", "$0.47"),
+            ("Maïwenn", "车", "¥9.00"),
+        ]
+        assert list(mf.batches(2, order_by_index=True)) == [
+            [("Aurélie", "沙", "€9.30"), ("Bérénice", "屈", "¥6.01")],
+            [("Göran", "酆", "$1.39"), ("Maéna", "柴", "$0.47")],
+            [("Maïwenn", "车", "¥9.00")],
+        ]
+        assert list(mf.rows(order_by_index=True, columns=["last_name"], limit=2)) == [
+            ("沙",),
+            ("屈",),
+        ]
+        where = {"first_name": ["Göran", "Maéna"]}
+        assert sorted(mf.rows(where=where)) == [
+            ("Göran", "酆", "$1.39"),
+            ("Maéna", "柴", "$0.47"),
+        ]
+        assert all(Path(i).exists() for i in mf._dbs)
+        with pytest.raises(ValueError, match="batch_size should be a positive"):
+            list(mf.batches(0))
+        with pytest.raises(ValueError, match=r"fieldnames .+ must be a subset"):
+            mf.merge(io.StringIO("first_name\n"))
+    assert mf.closed is True
+    assert not any(Path(i).exists() for i in mf._dbs)
+
+
+def test_partitionedmergefiles_changes(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n",
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\nMaïwenn,车,¥0.56\n",
+    ]
+    with PartitionedMergeFiles(
+        test_columns, test_indexes, 3, str(tmp_path), track_changes=True
+    ) as mf:
+        assert list(mf.changes()) == []
+        for csvfile in csvfiles:
+            mf.merge(io.StringIO(csvfile))
+        assert sorted(mf.changes()) == [
+            ("Göran", "酆", "$1.39"),
+            ("Maéna", "柴", "¥5.47"),
+        ]
+        assert sorted(mf.changes(since_merge=0)) == sorted(mf.rows())
+
+
+def test_partitionedmergefiles_merge_exception(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfile = f"{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,¥0.56\n"
+    mf = PartitionedMergeFiles(test_columns, test_indexes, 2, str(tmp_path))
+    mf._poll_seconds = 0.1
+    mf._batch_size = 1
+    mf.merge(io.StringIO(csvfile))
+    # Such as a partition process killed for lack of memory
+    mf._processes[0].kill()
+    mf._processes[0].join()
+    with pytest.raises(RuntimeError, match="partition process 0 exited unexp"):
+        mf.merge(io.StringIO(csvfile * 20))
+    assert not any(i.is_alive() for i in mf._processes)
+    mf.cleanup()
+    assert mf.closed is True
+    assert list(tmp_path.iterdir()) == []
+
+
+async def _stream(data, size):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+def test_asyncmergefiles_merge(tmp_path: Path):
+    test_headers = ",".join(test_columns)
+    csvfiles = [
+        f'{test_headers}\nMaéna,柴,$0.47\nMaïwenn,车,"¥0.56\n"""\n',
+        f"{test_headers}\nMaéna,柴,¥5.47\nGöran,酆,$1.39\n",
+    ]
+    path = tmp_path / "test.csv"
+    path.write_text(f"{test_headers}\nAurélie,沙,€9.30\n")
+
+    async def merge():
+        async with AsyncMergeFiles(
+            test_columns, test_indexes, queue_size=1, track_changes=True
+        ) as amf:
+            # Split the multi-byte characters across chunks
+            await amf.merge(_stream(csvfiles[0].encode("utf-8"), 3))
+            assert amf.last_merge_stats.bytes_read == len(csvfiles[0].encode())
+            await amf.merge(io.StringIO(csvfiles[1]))
+            assert await amf.merge_path(str(path))
+            assert [i async for i in amf.changes()] == [("Aurélie", "沙", "€9.30")]
+            rows = [i async for i in amf.rows(batch_size=1)]
+            where = {"first_name": "Aurélie"}
+            assert [i async for i in amf.rows(columns=["score"], where=where)] == [
+                ("€9.30",)
+            ]
+            assert await amf.get(("Aurélie", "沙")) == ("Aurélie", "沙", "€9.30")
+            assert await amf.get_many([("Göran", "酆")], ["score"]) == [("$1.39",)]
+            assert await amf.contains([("Göran", "柴")]) == [False]
+            # Stop an iteration early
+            async for row in amf.rows(batch_size=1):
+                break
+            result = await amf.write_csv(str(tmp_path / "merge.csv"))
+            assert result["rows"] == 4
+            return rows, row, amf.rowcount, amf.affected_count
+
+    rows, row, rowcount, affected_count = asyncio.run(merge())
+    with MergeFiles(test_columns, test_indexes) as mf:
+        for csvfile in csvfiles:
+            mf.merge(io.StringIO(csvfile))
+        with open(path, newline="") as fp:
+            mf.merge(fp)
+        assert rows == list(mf.rows())
+        assert row == rows[0]
+        assert rowcount == mf.rowcount == 4
+        assert affected_count == mf.affected_count == 3
+
+
+def test_asyncmergefiles_merge_exception():
+    test_headers = ",".join(test_columns)
+
+    async def failed_stream():
+        yield f"{test_headers}\n".encode()
+        raise OSError("connection reset")
+
+    async def merge():
+        async with AsyncMergeFiles(test_columns, test_indexes, queue_size=1) as amf:
+            with pytest.raises(OSError, match="connection reset"):
+                await amf.merge(failed_stream())
+            csvfile = ("first_name,score\n" + "Maéna,¥5.47\n" * 100).encode()
+            with pytest.raises(ValueError, match=r"fieldnames .+ must be a subset"):
+                await amf.merge(_stream(csvfile, 1))
+            await amf.merge(_stream(f"{test_headers}\nMaéna,柴,$0.47\n".encode(), 4))
+            assert amf.rowcount == 1
+        assert amf.closed
+
+    asyncio.run(merge())
+    with pytest.raises(ValueError, match="queue_size should be a positive number"):
+        AsyncMergeFiles(test_columns, test_indexes, queue_size=0)
@@ -0,0 +1,112 @@
+from pathlib import Path
+
+from csvblend import sorting
+from csvblend.utils import itemgetter
+
+test_values = [
+    ("Maéna", "柴", "$0.47"),
+    ("Maïwenn", "车", None),
+    ("Göran", "酆", "$1.39"),
+]
+
+
+def test_write_run(tmp_path: Path):
+    test_run = tmp_path / "test.run"
+    result = sorting.write_run(str(test_run), test_values, batch_size=2)
+    assert result == 3
+    assert list(sorting.read_run(str(test_run))) == test_values
+    result = sorting.write_run(str(test_run), [])
+    assert result == 0
+    assert list(sorting.read_run(str(test_run))) == []
+
+
+def test_changed():
+    assert sorting.changed(("a", "b"), ("a", "c")) is True
+    assert sorting.changed(("a", "b"), ("a", "b")) is False
+    assert sorting.changed(("a", None), ("a", "c")) is True
+    assert sorting.changed(("a", "b"), ("a", None)) is True
+    assert sorting.changed(("a", None), ("a", None)) is False
+    assert sorting.changed(("a", "b", None), ("a", "c", "d")) is True
+
+
+def test_sortedmerge():
+    streams = [
+        [("a", "1"), ("c", "1")],
+        [("a", "2"), ("b", "1"), ("b", "2"), ("d", "1")],
+        [("a", "2"), ("b", "3"), ("c", "1"), ("e", None)],
+    ]
+    merge = sorting.SortedMerge(streams, itemgetter([0]), [False, True, True])
+    assert list(merge) == [("a", "2"), ("b", "3"), ("c", "1"), ("d", "1"), ("e", None)]
+    assert merge.affected_count == 6
+    assert merge.rowcount == 5
+    assert merge.unsorted is None
+
+
+def test_sortedmerge_unsorted():
+    streams = [
+        [("a", "1"), ("c", "1"), ("d", "1")],
+        [("a", "2"), ("b", "1"), ("a", "3"), ("e", "1")],
+    ]
+    merge = sorting.SortedMerge(streams, itemgetter([0]), [False, True])
+    assert list(merge) == [("a", "2"), ("b", "1")]
+    assert merge.affected_count == 2
+    assert merge.unsorted == 1
+    assert list(merge.rest(0)) == [("c", "1"), ("d", "1")]
+    assert list(merge.rest(1)) == [("a", "3"), ("e", "1")]
+    merge = sorting.SortedMerge([[(None, "1")]], itemgetter([0]), [True])
+    assert list(merge) == []
+    assert merge.unsorted == 0
+
+
+def test_spill_runs(tmp_path: Path):
+    values = [("c", "1"), ("a", "1"), ("b", "1"), ("a", "2"), ("a", "3")]
+    result0 = sorting.spill_runs(values, itemgetter([0]), str(tmp_path), 2)
+    assert [list(sorting.read_run(i)) for i in result0] == [
+        [("a", "1"), ("c", "1")],
+        [("a", "2"), ("b", "1")],
+        [("a", "3")],
+    ]
+    result1 = sorting.spill_runs(values, itemgetter([0]), str(tmp_path), 1, 2)
+    assert len(result1) == 2
+    assert list(sorting.read_run(result1[0])) == [
+        ("a", "1"),
+        ("a", "2"),
+        ("b", "1"),
+        ("c", "1"),
+    ]
+    assert list(sorting.read_run(result1[1])) == [("a", "3")]
+    # The runs are combined, and removed
+    assert len(list(tmp_path.iterdir())) == 5
+    result2 = sorting.spill_runs([("b",), (None,)], itemgetter([0]), str(tmp_path), 2)
+    assert list(sorting.read_run(result2[0])) == [(None,), ("b",)]
+    # A NULL index in a single run, with combined runs
+    values = [(str(i % 7), str(i)) for i in range(200)] + [(None, "200")]
+    result3 = sorting.spill_runs(values, itemgetter([0]), str(tmp_path), 2, 4)
+    assert len(result3) == 2
+    assert next(sorting.read_run(result3[-1])) == (None, "200")
+    assert sum(len(list(sorting.read_run(i))) for i in result3) == 201
+    result4 = sorting.spill_runs(values[::-1], itemgetter([0]), str(tmp_path), 2, 4)
+    assert next(sorting.read_run(result4[0])) == (None, "200")
+    assert sum(len(list(sorting.read_run(i))) for i in result4) == 201
+
+
+def test_combine_runs(tmp_path: Path):
+    runs = []
+    for i, values in enumerate([[("a", "1"), ("b", "1")], [("a", "2")]]):
+        run = tmp_path / f"test{i}.run"
+        sorting.write_run(str(run), values)
+        runs.append(str(run))
+    result = sorting.combine_runs(runs, itemgetter([0]), str(tmp_path))
+    assert list(sorting.read_run(result)) == [("a", "1"), ("a", "2"), ("b", "1")]
+    assert list(tmp_path.iterdir()) == [Path(result)]
+
+
+def test_nulls_first():
+    key = sorting.nulls_first(itemgetter([0, 1]))
+    values = [("b", None), ("a", "1"), (None, "2"), ("b", "0")]
+    assert sorted(values, key=key) == [
+        (None, "2"),
+        ("a", "1"),
+        ("b", None),
+        ("b", "0"),
+    ]
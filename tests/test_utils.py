@@ -1,3 +1,12 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+from pathlib import Path
+
+import pytest
+
 from csvblend import utils
 
 
@@ -8,3 +17,188 @@ def test_hash_function():
     assert result1 == "0"
     result2 = utils.hash_function(" ")
     assert result2 == "3916222277"
+
+
+def test_project_rows():
+    rows = [["a", "b", "c"], [], ["d"], ["e", "f", "g", "h"]]
+    result0 = list(utils.project_rows(rows, [2, 0]))
+    assert result0 == [("c", "a"), (None, "d"), ("g", "e")]
+    result1 = list(utils.project_rows(rows, [1]))
+    assert result1 == [("b",), (None,), ("f",)]
+
+
+def test_split_csv(tmp_path: Path):
+    test_csvfile = tmp_path / "test.csv"
+    test_csvfile.write_bytes(b'a,b\n1,"x\ny"\n2,""""\n3,z')
+    result0 = utils.split_csv(str(test_csvfile), 1, block_size=3)
+    assert result0 == [(0, 4), (4, 12), (12, 19), (19, 22)]
+    result1 = utils.split_csv(str(test_csvfile), 1 << 20)
+    assert result1 == [(0, 4), (4, 22)]
+    test_csvfile.write_bytes(b"")
+    result2 = utils.split_csv(str(test_csvfile), 1)
+    assert result2 == [(0, 0)]
+    # A quote inside an unquoted field does not start a quoted field
+    test_csvfile.write_bytes(b'a,b,c\n1,5 ft 3",y\n2,"multi\nline",z\n3,"""",w')
+    result3 = utils.split_csv(str(test_csvfile), 1, block_size=3)
+    assert result3 == [(0, 6), (6, 18), (18, 35), (35, 43)]
+
+
+def test_read_csv_chunk(tmp_path: Path):
+    test_csvfile = tmp_path / "test.csv"
+    test_csvfile.write_bytes('a,b\n1,"x\ny"\n2,"於"\n'.encode())
+    result0 = utils.read_csv_chunk(str(test_csvfile), 0, 4, None)
+    assert result0 == ["a", "b"]
+    result1 = utils.read_csv_chunk(str(test_csvfile), 4, 21, [1, 0])
+    assert result1 == [("x\ny", "1"), ("於", "2")]
+    conditions = [(1, frozenset(["2"]))]
+    result2 = utils.read_csv_chunk(
+        str(test_csvfile), 4, 21, [1, 0], conditions=conditions
+    )
+    assert result2 == [("於", "2")]
+
+
+def test_read_ahead():
+    consumed = []
+
+    def _iterable():
+        for i in range(5):
+            consumed.append(i)
+            yield i
+
+    result = utils.read_ahead(_iterable(), 2)
+    assert next(result) == 0
+    assert consumed == [0, 1]
+    assert next(result) == 1
+    assert consumed == [0, 1, 2]
+    assert list(result) == [2, 3, 4]
+
+
+def test_itemgetter():
+    assert utils.itemgetter([2, 0])(["a", "b", "c"]) == ("c", "a")
+    assert utils.itemgetter([1])(["a", "b", "c"]) == ("b",)
+
+
+def test_partition_function():
+    result0 = utils.partition_function(("於", "Va l"), 7)
+    assert result0 == utils.partition_function(("於", "Va l"), 7)
+    assert 0 <= result0 < 7
+    result1 = utils.partition_function(("a", None), 1 << 32)
+    assert result1 == int(utils.hash_function("a\x1f"))
+
+
+def test_available_memory():
+    result = utils.available_memory()
+    assert result is None or result >= 0
+
+
+def test_batched():
+    assert list(utils.batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(utils.batched([], 2)) == []
+
+
+def test_lru_cache():
+    cache = utils.LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", None)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # "b" is the least recently used
+    assert cache.get("b", 0) == 0
+    assert cache.get("a") == 1
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_checksum_file(tmp_path: Path):
+    path = tmp_path / "test.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    assert utils.checksum_file(str(path), block_size=3) == (
+        "492d5ea496056f1a6a6592241032fab764c321596317930b4fa0e1e8bc3b7470"
+    )
+
+
+def test_convert_rows():
+    rows = [("1", "2.5", "2024-02-01", "x"), ("", "", "", ""), (None, None, None, None)]
+    converters = [
+        utils.convert_integer,
+        utils.convert_real,
+        utils.convert_date,
+        None,
+    ]
+    assert list(utils.convert_rows(rows, converters)) == [
+        (1, 2.5, "2024-02-01", "x"),
+        (None, None, None, ""),
+        (None, None, None, None),
+    ]
+    assert list(utils.convert_rows(rows, [None] * 4)) == rows
+    with pytest.raises(ValueError):
+        list(utils.convert_rows([("1.5",)], [utils.convert_integer]))
+    with pytest.raises(ValueError):
+        list(utils.convert_rows([("2024-02-30",)], [utils.convert_date]))
+
+
+def test_filter_rows():
+    rows = [("a", 1), ("b", 2), ("c", None)]
+    assert list(utils.filter_rows(rows, [])) == rows
+    assert list(utils.filter_rows(rows, [(0, frozenset("ac"))])) == [
+        ("a", 1),
+        ("c", None),
+    ]
+    conditions = [(0, frozenset("ac")), (1, frozenset([None]))]
+    assert list(utils.filter_rows(rows, conditions)) == [("c", None)]
+    assert list(utils.filter_rows(rows, [(1, frozenset())])) == []
+
+
+def test_read_lines(tmp_path: Path):
+    path = tmp_path / "test.csv"
+    path.write_bytes('a,b\r\n1,"x\ny"\r\n2,於\r\n'.encode())
+    with utils.open_binary(str(path)) as fp:
+        reader = csv.reader(utils.read_lines(fp))
+        assert next(reader) == ["a", "b"]
+        assert next(reader) == ["1", "x\ny"]
+        # The position is after the last record read
+        offset = fp.tell()
+        assert offset == 14
+    with utils.open_binary(str(path)) as fp:
+        assert list(csv.reader(utils.read_lines(fp, offset=offset))) == [
+            ["a", "b"],
+            ["2", "於"],
+        ]
+
+
+def test_byte_position(tmp_path: Path):
+    path = tmp_path / "test.csv"
+    path.write_text("a,b\n1,2\n", encoding="utf-8")
+    with open(path, newline="", encoding="utf-8") as fp:
+        assert utils.byte_position(fp) == 0
+        assert list(fp) == ["a,b\n", "1,2\n"]
+        assert utils.byte_position(fp) == 8
+    assert utils.byte_position(io.StringIO("a,b\n")) is None
+    assert utils.byte_position(["a,b\n"]) is None
+
+
+@pytest.mark.parametrize(
+    "compression, compress",
+    [
+        ("gzip", gzip.compress),
+        ("bz2", bz2.compress),
+        ("xz", lzma.compress),
+        (None, lambda data: data),
+    ],
+)
+def test_open_csvfile(tmp_path: Path, compression, compress):
+    path = tmp_path / "test.csv"
+    path.write_bytes(compress('a,b\r\n1,"2\r\n3"\n'.encode("utf-8")))
+    assert utils.detect_compression(str(path)) == compression
+    with utils.open_csvfile(str(path)) as fp:
+        assert fp.read() == 'a,b\r\n1,"2\r\n3"\n'
+
+
+def test_open_csvfile_zstd(tmp_path: Path, mocker):
+    path = tmp_path / "test.csv.zst"
+    path.write_bytes(b"\x28\xb5\x2f\xfd")
+    assert utils.detect_compression(str(path)) == "zstd"
+    mocker.patch.dict("sys.modules", {"zstandard": None})
+    with pytest.raises(ValueError, match="requires the zstandard package"):
+        utils.open_csvfile(str(path))